@@ -0,0 +1,184 @@
+"""
+Compare decoding of API pages: `json.loads` + `model_validate`
+against single pass `model_validate_json` used by the API clients.
+Prints time per page and peak memory allocated while decoding it,
+relative to the two pass decoding.
+
+The single pass saves memory, it skips the intermediate dict and list
+objects. It shows no consistent CPU gain, its time per page varies
+between runs around the time of the two pass decoding.
+
+Usage:
+    python benchmarks/decode.py [api_debug]
+
+Without arguments it builds full pages of `PlaylistItems`
+and `AlbumItemsCredits` payloads. You can also pass the directory
+with calls captured by `tiddl --debug`.
+"""
+
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+from timeit import repeat
+from typing import Any, Type
+
+from pydantic import BaseModel
+
+from tiddl.core.api.cache import endpoint_family
+from tiddl.core.api.debug import read_captures
+from tiddl.core.api.models import (
+    AlbumItems,
+    AlbumItemsCredits,
+    ArtistAlbumsItems,
+    MixItems,
+    PlaylistItems,
+)
+
+PAGE_SIZE = 100
+ROUNDS = 50
+
+CAPTURED_MODELS: dict[str, Type[BaseModel]] = {
+    "albums/{id}/items": AlbumItems,
+    "albums/{id}/items/credits": AlbumItemsCredits,
+    "artists/{id}/albums": ArtistAlbumsItems,
+    "mixes/{id}/items": MixItems,
+    "playlists/{id}/items": PlaylistItems,
+}
+
+
+def track_payload(index: int) -> dict[str, Any]:
+    artist = {"id": 1000 + index, "name": f"Artist {index}", "type": "MAIN"}
+
+    return {
+        "id": 100000 + index,
+        "title": f"Track {index}",
+        "duration": 180 + index,
+        "replayGain": -7.5,
+        "peak": 0.98,
+        "allowStreaming": True,
+        "streamReady": True,
+        "adSupportedStreamReady": True,
+        "djReady": True,
+        "stemReady": False,
+        "streamStartDate": "2020-01-01T00:00:00.000+0000",
+        "premiumStreamingOnly": False,
+        "trackNumber": index % 20 + 1,
+        "volumeNumber": 1,
+        "version": None,
+        "popularity": 50,
+        "copyright": "(P) 2020 Label",
+        "bpm": 120,
+        "url": f"http://www.tidal.com/track/{100000 + index}",
+        "isrc": f"USABC20{index:05d}",
+        "editable": False,
+        "explicit": False,
+        "audioQuality": "LOSSLESS",
+        "audioModes": ["STEREO"],
+        "mediaMetadata": {"tags": ["LOSSLESS", "HIRES_LOSSLESS"]},
+        "artist": artist,
+        "artists": [artist, {**artist, "id": 5, "type": "FEATURED"}],
+        "album": {
+            "id": 2000 + index // 20,
+            "title": f"Album {index // 20}",
+            "cover": "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee",
+            "vibrantColor": "#ffffff",
+            "videoCover": None,
+        },
+        "mixes": {"TRACK_MIX": "0123456789abcdef0123456789abcd"},
+    }
+
+
+def playlist_items_payload() -> dict[str, Any]:
+    return {
+        "limit": PAGE_SIZE,
+        "offset": 0,
+        "totalNumberOfItems": PAGE_SIZE,
+        "items": [
+            {
+                "item": {
+                    **track_payload(index),
+                    "dateAdded": "2024-01-01T00:00:00.000+0000",
+                    "index": index,
+                    "itemUuid": f"00000000-0000-0000-0000-{index:012d}",
+                },
+                "type": "track",
+                "cut": None,
+            }
+            for index in range(PAGE_SIZE)
+        ],
+    }
+
+
+def album_items_credits_payload() -> dict[str, Any]:
+    return {
+        "limit": PAGE_SIZE,
+        "offset": 0,
+        "totalNumberOfItems": PAGE_SIZE,
+        "items": [
+            {
+                "item": track_payload(index),
+                "type": "track",
+                "credits": [
+                    {
+                        "type": role,
+                        "contributors": [
+                            {"name": f"{role} {n}", "id": n} for n in range(3)
+                        ],
+                    }
+                    for role in ("Producer", "Composer", "Lyricist", "Engineer")
+                ],
+            }
+            for index in range(PAGE_SIZE)
+        ],
+    }
+
+
+def benchmark(name: str, model: Type[BaseModel], body: bytes):
+    def two_pass():
+        model.model_validate(json.loads(body))
+
+    def single_pass():
+        model.model_validate_json(body)
+
+    print(f"{name} ({len(body) / 1024:.1f} KiB)")
+
+    baseline: tuple[float, int] | None = None
+
+    for label, func in (("two pass", two_pass), ("single pass", single_pass)):
+        elapsed = min(repeat(func, number=ROUNDS, repeat=5)) / ROUNDS * 1000
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        baseline = baseline or (elapsed, peak)
+
+        print(
+            f"  {label:<12} {elapsed:>8.3f} ms ({elapsed / baseline[0]:>4.0%})"
+            f"  peak {peak / 1024:>8.1f} KiB ({peak / baseline[1]:>4.0%})"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for captured in read_captures(Path(sys.argv[1])):
+            endpoint = captured["endpoint"]
+            model = CAPTURED_MODELS.get(endpoint_family(endpoint))
+
+            if model is None or captured["status_code"] != 200:
+                continue
+
+            benchmark(endpoint, model, captured["body"].encode())
+    else:
+        benchmark(
+            "PlaylistItems",
+            PlaylistItems,
+            json.dumps(playlist_items_payload()).encode(),
+        )
+        benchmark(
+            "AlbumItemsCredits",
+            AlbumItemsCredits,
+            json.dumps(album_items_credits_payload()).encode(),
+        )
@@ -0,0 +1,144 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from tiddl.cli.commands.bench import get_scenario
+from tiddl.cli.commands.bench.server import (
+    MIX_ID,
+    PLAYLIST_UUID,
+    Catalog,
+    FakeTidal,
+    Faults,
+)
+from tiddl.core.api import AsyncTidalAPI, AsyncTidalClient
+from tiddl.core.utils import parse_track_stream
+from tiddl.core.utils.mp4 import FlacExtractor
+
+
+def run_with_api(tmp_path, catalog: Catalog, faults: Faults, test):
+    server = FakeTidal(catalog, faults)
+
+    async def run():
+        await server.start()
+        client = AsyncTidalClient(
+            "token", tmp_path / "cache", omit_cache=True, api_url=server.api_url
+        )
+
+        try:
+            return await test(AsyncTidalAPI(client, "1", "US"), server)
+        finally:
+            await client.close()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_resources_are_valid(tmp_path):
+    catalog = Catalog(albums=2, tracks=3, videos=1)
+
+    async def test(api: AsyncTidalAPI, server: FakeTidal):
+        album = await api.get_album(catalog.album_ids()[0])
+        items = [item async for item in api.iter_album_items_credits(album.id)]
+        playlist_items = [item async for item in api.iter_playlist_items(PLAYLIST_UUID)]
+        mix_items = [item async for item in api.iter_mix_items(MIX_ID)]
+        albums = [album async for album in api.iter_artist_albums(1)]
+        video = await api.get_video(catalog.video_ids()[0])
+
+        assert len(items) == 3
+        assert len(playlist_items) == len(mix_items) == 6
+        assert len(albums) == 2
+        assert video.allowStreaming
+        assert server.stats.api_calls > 0
+
+    run_with_api(tmp_path, catalog, Faults(), test)
+
+
+@pytest.mark.parametrize(
+    "quality, urls_count", [("LOSSLESS", 1), ("HIGH", 1), ("HI_RES_LOSSLESS", 4)]
+)
+def test_track_stream_is_served(tmp_path, quality, urls_count):
+    catalog = Catalog(albums=1, tracks=1, track_size=4000, segments=4)
+    track_id = catalog.all_track_ids()[0]
+
+    async def test(api: AsyncTidalAPI, server: FakeTidal):
+        stream = await api.get_track_stream(track_id, quality)
+        urls, _ = parse_track_stream(stream)
+
+        async with aiohttp.ClientSession() as session:
+            sizes = [len(await (await session.get(url)).read()) for url in urls]
+
+        assert len(urls) == urls_count
+        assert sum(sizes) == server.stats.cdn_bytes
+
+    run_with_api(tmp_path, catalog, Faults(), test)
+
+
+def test_faults_are_injected(tmp_path):
+    async def test(api: AsyncTidalAPI, server: FakeTidal):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{server.api_url}/albums/100") as res:
+                assert res.status == 429
+                assert res.headers["Retry-After"] == "1"
+
+        assert server.stats.throttled == 1
+
+    run_with_api(tmp_path, Catalog(), Faults(throttle_rate=1), test)
+
+
+def test_get_scenario():
+    catalog = Catalog(albums=2, tracks=5, videos=3)
+
+    assert get_scenario(catalog, "album") == ("album/100", 5)
+    assert get_scenario(catalog, "artist") == ("artist/1", 13)
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+def test_cdn_serves_ranges(tmp_path, accept_ranges):
+    catalog = Catalog(albums=1, tracks=1, track_size=300_000)
+    track_id = catalog.all_track_ids()[0]
+
+    async def test(api: AsyncTidalAPI, server: FakeTidal):
+        url = f"{server.cdn_url}/tracks/{track_id}.flac"
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as res:
+                body = await res.read()
+
+            async with session.get(url, headers={"Range": "bytes=2-99999"}) as res:
+                part = await res.read()
+                status = res.status
+
+        assert body.startswith(b"fLaC")
+        assert len(body) == 300_000
+
+        if accept_ranges:
+            assert status == 206
+            assert part == body[2:100_000]
+        else:
+            assert status == 200
+            assert part == body
+
+    run_with_api(tmp_path, catalog, Faults(accept_ranges=accept_ranges), test)
+
+
+def test_dash_stream_is_flac_in_mp4(tmp_path):
+    catalog = Catalog(albums=1, tracks=1, track_size=400_000, segments=4)
+    track_id = catalog.all_track_ids()[0]
+
+    async def test(api: AsyncTidalAPI, server: FakeTidal):
+        stream = await api.get_track_stream(track_id, "HI_RES_LOSSLESS")
+        urls, _ = parse_track_stream(stream)
+        extractor = FlacExtractor()
+
+        async with aiohttp.ClientSession() as session:
+            flac = b"".join(
+                [extractor.feed(await (await session.get(url)).read()) for url in urls]
+            )
+
+        extractor.close()
+
+        assert flac.startswith(b"fLaC")
+        assert extractor.frames_size == 3 * 100_000
+
+    run_with_api(tmp_path, catalog, Faults(), test)
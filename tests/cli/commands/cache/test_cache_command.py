@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from requests_cache import CachedResponse, SQLiteCache
+from typer.testing import CliRunner
+
+from tiddl.cli.commands import cache
+from tiddl.cli.commands.cache import cache_command, get_endpoint
+from tiddl.core.api.cache import ResponseCache, create_key, save_lookups
+
+runner = CliRunner(env={"COLUMNS": "200"})
+
+API_URL = "https://api.example.com/v1"
+
+
+@pytest.fixture
+def cache_names(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    api_cache_name = tmp_path / "api_cache"
+    async_api_cache_name = tmp_path / "api_cache_async"
+
+    monkeypatch.setattr(cache, "API_CACHE_NAME", api_cache_name)
+    monkeypatch.setattr(cache, "ASYNC_API_CACHE_NAME", async_api_cache_name)
+    monkeypatch.setattr(cache.CONFIG.api, "url", API_URL)
+
+    return api_cache_name, async_api_cache_name
+
+
+def save_requests_response(cache_name: Path, endpoint: str, expired: bool = False):
+    response = CachedResponse(
+        url=f"{API_URL}/{endpoint}",
+        status_code=200,
+        expires=datetime.now() + timedelta(days=-1 if expired else 1),
+    )
+    response._content = b"{}"
+
+    requests_cache = SQLiteCache(cache_name)
+    requests_cache.responses[endpoint] = response
+    requests_cache.close()
+
+
+def test_get_endpoint_uses_configured_url(cache_names):
+    assert get_endpoint(f"{API_URL}/albums/1/items?limit=10") == "albums/1/items"
+
+
+def test_commands_do_not_create_missing_caches(cache_names):
+    for args in (["stats"], ["prune"], ["purge", "albums/*"]):
+        result = runner.invoke(cache_command, args)
+        assert result.exit_code == 0, result.output
+
+    for cache_name in cache_names:
+        assert not cache_name.with_suffix(".sqlite").exists()
+
+
+def test_stats_reports_hit_rate_of_both_stores(cache_names):
+    api_cache_name, async_api_cache_name = cache_names
+
+    save_requests_response(api_cache_name, "tracks/1")
+    requests_cache = SQLiteCache(api_cache_name)
+    with requests_cache.responses.connection(commit=True) as connection:
+        save_lookups(connection, {"tracks/{id}": (1, 3)})
+    requests_cache.close()
+
+    response_cache = ResponseCache(async_api_cache_name)
+    key = create_key("albums/1", {})
+    response_cache.set_sync(key, "albums/1", 200, b"{}", 3600)
+    response_cache.get_sync(key)
+    response_cache.close()
+
+    result = runner.invoke(cache_command, ["stats"])
+
+    assert result.exit_code == 0, result.output
+    assert "tracks/{id}" in result.output
+    assert "25%" in result.output
+    assert "albums/{id}" in result.output
+    assert "100%" in result.output
+
+
+def test_prune_and_purge_both_stores(cache_names):
+    api_cache_name, async_api_cache_name = cache_names
+
+    save_requests_response(api_cache_name, "albums/1")
+    save_requests_response(api_cache_name, "tracks/1", expired=True)
+
+    response_cache = ResponseCache(async_api_cache_name)
+    response_cache.set_sync("albums/2?", "albums/2", 200, b"{}", 3600)
+    response_cache.set_sync("tracks/2?", "tracks/2", 200, b"{}", 0)
+    response_cache.close()
+
+    result = runner.invoke(cache_command, ["prune"])
+    assert "Deleted 2 expired responses." in result.output
+
+    result = runner.invoke(cache_command, ["purge", "albums/*"])
+    assert "Deleted 2 responses matching 'albums/*'." in result.output
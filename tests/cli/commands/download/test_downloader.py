@@ -0,0 +1,283 @@
+import asyncio
+import json
+import threading
+import time
+from base64 import b64encode
+from functools import partial
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientResponseError, web
+from aiohttp.test_utils import TestServer
+from pytest_mock import MockerFixture
+from rich.progress import TaskID
+
+from tiddl.cli.commands.download.downloader import Downloader
+from tiddl.core.api.models import Track, TrackStream
+from tiddl.core.utils.journal import Journal
+
+
+def create_downloader(mocker: MockerFixture, tmp_path: Path, **kwargs) -> Downloader:
+    return Downloader(
+        tidal_api=mocker.Mock(),
+        threads_count=4,
+        rich_output=mocker.Mock(),
+        track_quality="high",
+        video_quality="fhd",
+        videos_filter="allow",
+        skip_existing=True,
+        download_path=tmp_path,
+        scan_path=tmp_path,
+        **kwargs,
+    )
+
+
+def test_session_is_shared_and_closed(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(
+        mocker, tmp_path, connections_per_host=2, read_timeout=5
+    )
+
+    async def use_session():
+        async with downloader:
+            session = downloader.session
+            assert downloader.session is session
+            assert session.connector.limit_per_host == 2  # type: ignore
+            assert session.timeout.sock_read == 5
+
+        return session
+
+    session = asyncio.run(use_session())
+
+    assert session.closed
+    assert downloader._session is None
+
+
+def test_connections_per_host_fit_all_transfers(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(
+        mocker, tmp_path, range_connections=2, segment_concurrency=5
+    )
+
+    assert downloader.connections_per_host == 4 * 5
+
+
+def test_segmented_stream_is_resumed(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(mocker, tmp_path)
+    requested = []
+
+    async def segment(request: web.Request):
+        requested.append(int(request.match_info["number"]))
+        return web.Response(body=request.match_info["number"].encode() * 3)
+
+    app = web.Application()
+    app.router.add_get("/{number}", segment)
+
+    partial = tmp_path / "video.ts.part"
+    journal = Journal(partial, item_id=1, quality="HIGH", urls=5)
+    # the third segment was written but not committed
+    partial.write_bytes(b"000111222")
+    journal.commit_segment(2, 6)
+    journal.save()
+
+    async def download():
+        async with TestServer(app) as server, downloader:
+            urls = [str(server.make_url(f"/{n}")) for n in range(5)]
+            await downloader.write_stream(
+                urls, partial, TaskID(0), Journal(partial, 1, "HIGH", 5)
+            )
+
+    asyncio.run(download())
+
+    assert partial.read_bytes() == b"000111222333444"
+    assert sorted(requested) == [2, 3, 4]
+
+
+def test_interrupted_download_saves_journal(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(mocker, tmp_path, segment_concurrency=1)
+
+    async def segment(request: web.Request):
+        if request.match_info["number"] == "3":
+            raise web.HTTPNotFound()
+
+        return web.Response(body=request.match_info["number"].encode() * 3)
+
+    app = web.Application()
+    app.router.add_get("/{number}", segment)
+
+    async def download():
+        async with TestServer(app) as server, downloader:
+            urls = [str(server.make_url(f"/{n}")) for n in range(5)]
+            await downloader.write_file(
+                1, "HIGH", urls, tmp_path / "video.ts", TaskID(0)
+            )
+
+    with pytest.raises(ClientResponseError):
+        asyncio.run(download())
+
+    # progress below the save threshold is kept for the next run
+    journal = Journal(tmp_path / "video.ts.part", 1, "HIGH", 5)
+    assert journal.data.segment == 3
+
+
+def test_postprocess_runs_in_bounded_workers(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(mocker, tmp_path, postprocess_workers=2)
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    threads = set()
+
+    def finalize_flac(path: Path) -> tuple[Path, str]:
+        nonlocal active, max_active
+
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+            threads.add(threading.current_thread())
+
+        time.sleep(0.05)
+
+        with lock:
+            active -= 1
+
+        return path.with_suffix(".flac"), "demuxed"
+
+    mocker.patch(
+        "tiddl.cli.commands.download.downloader.finalize_flac", finalize_flac
+    )
+    track = mocker.Mock(spec=Track, id=1)
+
+    async def postprocess_all():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        paths = []
+
+        async def postprocess(n: int) -> None:
+            paths.append(
+                await downloader.postprocess(track, tmp_path / f"{n}.m4a", True)
+            )
+
+        await asyncio.gather(
+            *(
+                downloader.pipeline.run(
+                    "postprocess", {"postprocess": partial(postprocess, n)}
+                )
+                for n in range(4)
+            )
+        )
+        ticker.cancel()
+
+        return paths, ticks
+
+    paths, ticks = asyncio.run(postprocess_all())
+
+    assert sorted(paths) == [tmp_path / f"{n}.flac" for n in range(4)]
+    assert max_active == 2
+    assert downloader.postprocess_stats.demuxed == 4
+    assert threading.main_thread() not in threads
+    # the event loop kept running while files were processed
+    assert ticks >= 5
+
+
+def track_stream(url: str) -> TrackStream:
+    manifest = {
+        "mimeType": "audio/mp4",
+        "codecs": "mp4a.40.2",
+        "encryptionType": "NONE",
+        "urls": [url],
+    }
+
+    return TrackStream(
+        trackId=1,
+        assetPresentation="FULL",
+        audioMode="STEREO",
+        audioQuality="HIGH",
+        manifestMimeType="application/vnd.tidal.bts",
+        manifestHash="",
+        manifest=b64encode(json.dumps(manifest).encode()).decode(),
+    )
+
+
+def test_expired_stream_is_resolved_again(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(mocker, tmp_path / "downloads")
+    requested = []
+
+    async def track(request: web.Request):
+        requested.append(request.query.get("Expires"))
+        return web.Response(body=b"audio")
+
+    app = web.Application()
+    app.router.add_get("/track.m4a", track)
+
+    item = mocker.Mock(
+        spec=Track,
+        id=1,
+        title="Track",
+        allowStreaming=True,
+        streamReady=True,
+        audioQuality="HIGH",
+        audioModes=["STEREO"],
+        mediaMetadata=mocker.Mock(tags=["LOSSLESS"]),
+        album=mocker.Mock(vibrantColor=None),
+    )
+
+    async def download():
+        async with TestServer(app) as server, downloader:
+            url = str(server.make_url("/track.m4a"))
+            # the first url expires before its transfer could finish
+            downloader.api.get_track_stream = mocker.AsyncMock(
+                side_effect=[
+                    track_stream(f"{url}?Expires={int(time.time()) + 10}"),
+                    track_stream(url),
+                ]
+            )
+
+            return await downloader.download(item, Path("Track"))
+
+    path, was_downloaded = asyncio.run(download())
+
+    assert was_downloaded
+    assert path == tmp_path / "downloads" / "Track.m4a"
+    assert path.read_bytes() == b"audio"
+    assert requested == [None]
+    assert downloader.api.get_track_stream.await_count == 2
+
+
+def test_skip_counts_avoided_stream_requests(mocker: MockerFixture, tmp_path: Path):
+    downloader = create_downloader(mocker, tmp_path, dolby_atmos_filter="only")
+    downloader.videos_filter = "only"
+    downloader.skip_existing = False
+    (tmp_path / "Existing.m4a").touch()
+
+    def track(allow_streaming: bool = True):
+        return mocker.Mock(
+            spec=Track,
+            id=1,
+            title="Track",
+            allowStreaming=allow_streaming,
+            streamReady=True,
+            audioQuality="HIGH",
+            audioModes=["STEREO"],
+            mediaMetadata=mocker.Mock(tags=[]),
+        )
+
+    # the videos filter used to skip only tracks without existing file
+    assert downloader.skip(track(), Path("Existing"))
+    assert downloader.skip(track(), Path("Missing"))
+    # tracks which can't be streamed were never requested
+    assert downloader.skip(track(allow_streaming=False), Path("Missing"))
+
+    assert str(downloader.filter_stats) == "streaming: 1, videos: 2"
+    assert downloader.filter_stats.avoided_requests == 1
+
+    downloader.videos_filter = "allow"
+
+    # the atmos filter used to run on the requested stream
+    assert downloader.skip(track(), Path("Missing"))
+    assert downloader.filter_stats.avoided_requests == 2
@@ -0,0 +1,66 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from tiddl.cli.commands.download.filters import (
+    FilterStats,
+    get_skip_reason,
+    is_atmos_excluded,
+)
+from tiddl.core.api.models import Track, Video
+
+
+def make_track(mocker: MockerFixture, modes: list[str], tags: list[str], **kwargs):
+    return mocker.Mock(
+        spec=Track,
+        allowStreaming=True,
+        streamReady=True,
+        audioModes=modes,
+        mediaMetadata=mocker.Mock(tags=tags),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "modes, tags, atmos_filter, excluded",
+    [
+        (["STEREO"], ["LOSSLESS"], "allow", False),
+        (["STEREO"], ["LOSSLESS"], "none", False),
+        (["STEREO"], ["LOSSLESS"], "only", True),
+        (["DOLBY_ATMOS"], ["DOLBY_ATMOS"], "none", True),
+        (["DOLBY_ATMOS"], ["DOLBY_ATMOS"], "only", False),
+        # tracks with both modes are decided by their stream
+        (["STEREO", "DOLBY_ATMOS"], ["LOSSLESS"], "none", False),
+        (["STEREO"], ["LOSSLESS", "DOLBY_ATMOS"], "only", False),
+    ],
+)
+def test_atmos_excluded(
+    mocker: MockerFixture,
+    modes: list[str],
+    tags: list[str],
+    atmos_filter,
+    excluded: bool,
+):
+    track = make_track(mocker, modes, tags)
+
+    assert is_atmos_excluded(track, atmos_filter) is excluded
+
+
+def test_skip_reason(mocker: MockerFixture):
+    track = make_track(mocker, ["STEREO"], ["LOSSLESS"])
+    video = mocker.Mock(spec=Video, allowStreaming=True, streamReady=True)
+
+    assert get_skip_reason(track, "allow", "allow") is None
+    assert get_skip_reason(video, "allow", "only") is None
+    assert get_skip_reason(track, "only", "allow") == "videos"
+    assert get_skip_reason(video, "none", "allow") == "videos"
+    assert get_skip_reason(track, "allow", "only") == "atmos"
+
+    track.streamReady = False
+    assert get_skip_reason(track, "only", "only") == "streaming"
+
+
+def test_filter_stats():
+    stats = FilterStats(videos=3, existing=2, avoided_requests=1)
+
+    assert str(stats) == "videos: 3, existing: 2"
+    assert str(FilterStats(avoided_requests=1)) == ""
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from tiddl.cli.commands.download.pipeline import Pipeline, Stage
+
+
+def test_stages_have_independent_limits():
+    pipeline = Pipeline(
+        Stage("resolve", workers=1), Stage("transfer", workers=3), Stage("tag", 1)
+    )
+    active = {"resolve": 0, "transfer": 0, "tag": 0}
+    max_active = dict(active)
+
+    def step(name: str, next_stage: str | None, delay: float):
+        async def run() -> str | None:
+            active[name] += 1
+            max_active[name] = max(max_active[name], active[name])
+            await asyncio.sleep(delay)
+            active[name] -= 1
+            return next_stage
+
+        return run
+
+    async def run_all():
+        await asyncio.gather(
+            *(
+                pipeline.run(
+                    "resolve",
+                    {
+                        "resolve": step("resolve", "transfer", 0.001),
+                        "transfer": step("transfer", "tag", 0.02),
+                        "tag": step("tag", None, 0.001),
+                    },
+                )
+                for _ in range(12)
+            )
+        )
+
+    asyncio.run(run_all())
+
+    assert max_active == {"resolve": 1, "transfer": 3, "tag": 1}
+    assert pipeline.stages["transfer"].stats.processed == 12
+
+
+def test_full_queue_holds_previous_stage():
+    pipeline = Pipeline(
+        Stage("resolve", workers=4, queue_size=8),
+        Stage("transfer", workers=1, queue_size=1),
+    )
+    resolved = 0
+
+    async def run_all():
+        transfer_done = asyncio.Event()
+
+        async def resolve() -> str | None:
+            nonlocal resolved
+            resolved += 1
+            return "transfer"
+
+        async def transfer() -> str | None:
+            await transfer_done.wait()
+            return None
+
+        tasks = [
+            asyncio.create_task(
+                pipeline.run("resolve", {"resolve": resolve, "transfer": transfer})
+            )
+            for _ in range(10)
+        ]
+        await asyncio.sleep(0.05)
+        # one item is transferred, one waits in the queue
+        # and four hold the resolve workers
+        assert resolved == 6
+
+        transfer_done.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_all())
+
+    assert resolved == 10
+
+
+def test_reserved_room_bounds_results_ahead():
+    pipeline = Pipeline(
+        Stage("resolve", workers=4, queue_size=8, reserve="transfer"),
+        Stage("transfer", workers=1, queue_size=2),
+    )
+    resolved = 0
+
+    async def run_all():
+        transfer_done = asyncio.Event()
+
+        async def resolve() -> str | None:
+            nonlocal resolved
+            resolved += 1
+            return "transfer"
+
+        async def transfer() -> str | None:
+            await transfer_done.wait()
+            return None
+
+        tasks = [
+            asyncio.create_task(
+                pipeline.run("resolve", {"resolve": resolve, "transfer": transfer})
+            )
+            for _ in range(10)
+        ]
+        await asyncio.sleep(0.05)
+        # one item is transferred and two wait in the queue,
+        # the resolve workers don't hold results
+        assert resolved == 3
+
+        transfer_done.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_all())
+
+    assert resolved == 10
+
+
+def test_failed_step_releases_slots():
+    pipeline = Pipeline(
+        Stage("resolve", 1, 1, reserve="transfer"), Stage("transfer", 1, 1)
+    )
+
+    async def fail() -> str | None:
+        raise RuntimeError("no stream")
+
+    async def backwards() -> str | None:
+        return "resolve"
+
+    async def done() -> str | None:
+        return None
+
+    async def run_all():
+        with pytest.raises(RuntimeError):
+            await pipeline.run("resolve", {"resolve": fail})
+
+        with pytest.raises(ValueError):
+            await pipeline.run("transfer", {"transfer": backwards})
+
+        # both stages are free again
+        await asyncio.wait_for(pipeline.run("resolve", {"resolve": done}), 1)
+        await asyncio.wait_for(pipeline.run("transfer", {"transfer": done}), 1)
+
+    asyncio.run(run_all())
@@ -0,0 +1,236 @@
+import asyncio
+
+import pytest
+from pytest_mock import MockerFixture
+
+from tiddl.cli.commands.download.work_queue import (
+    WorkQueue,
+    schedule_key,
+    settle_queued,
+)
+from tiddl.core.api.models import Track
+
+
+def test_work_runs_in_fixed_pool():
+    active = 0
+    max_active = 0
+
+    async def work(n: int) -> int:
+        nonlocal active, max_active
+
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+        return n * 2
+
+    async def run_all():
+        async with WorkQueue(workers=3) as queue:
+            futures = [await queue.submit(lambda n=n: work(n)) for n in range(10)]
+            return await asyncio.gather(*futures)
+
+    results = asyncio.run(run_all())
+
+    assert results == [n * 2 for n in range(10)]
+    assert max_active == 3
+
+
+def test_submit_waits_for_room_in_queue():
+    submitted = 0
+
+    async def run_all():
+        release = asyncio.Event()
+
+        async def work() -> None:
+            await release.wait()
+
+        async with WorkQueue(workers=2, size=3) as queue:
+
+            async def produce():
+                nonlocal submitted
+
+                for _ in range(10):
+                    await queue.submit(work)
+                    submitted += 1
+
+            producer = asyncio.create_task(produce())
+            await asyncio.sleep(0.05)
+
+            # two items are worked on and three wait in the queue
+            assert submitted == 5
+
+            release.set()
+            await producer
+
+    asyncio.run(run_all())
+
+    assert submitted == 10
+
+
+def test_work_error_is_set_on_future():
+    async def fail() -> None:
+        raise RuntimeError("no stream")
+
+    async def work() -> str:
+        return "done"
+
+    async def run_all():
+        async with WorkQueue(workers=1) as queue:
+            failed = await queue.submit(fail)
+            done = await queue.submit(work)
+
+            with pytest.raises(RuntimeError):
+                await failed
+
+            # the worker keeps going after failed work
+            return await done
+
+    assert asyncio.run(run_all()) == "done"
+
+
+def test_queued_work_is_taken_by_key(mocker: MockerFixture):
+    order = []
+    tracks = [mocker.Mock(spec=Track, duration=d) for d in (300, 120, 240, 120)]
+
+    async def run_all():
+        release = asyncio.Event()
+
+        async with WorkQueue(workers=1, size=8) as queue:
+            # the only worker is busy while the rest is queued
+            blocked = await queue.submit(release.wait)
+            futures = []
+
+            for n, track in enumerate(tracks):
+
+                async def work(n=n):
+                    order.append(n)
+
+                futures.append(
+                    await queue.submit(work, key=schedule_key("shortest", track))
+                )
+
+            release.set()
+            await asyncio.gather(blocked, *futures)
+
+    asyncio.run(run_all())
+
+    # equal durations keep the queue order
+    assert order == [1, 3, 2, 0]
+
+
+def test_schedule_keys(mocker: MockerFixture):
+    track = mocker.Mock(spec=Track, duration=200)
+
+    assert schedule_key("fifo", track) == ()
+    assert schedule_key("album", track) == ()
+    assert schedule_key("shortest", track) == (200,)
+
+
+def test_lanes_share_workers_by_weight():
+    order = []
+
+    async def run_all():
+        release = asyncio.Event()
+
+        async with WorkQueue(workers=1, size=16) as queue:
+            queue.add_lane("album", weight=2)
+            blocked = await queue.submit(release.wait, lane="blocked")
+            futures = []
+
+            # the artist queues its items before the album
+            for lane, items in (("artist", 6), ("album", 3)):
+                for _ in range(items):
+
+                    async def work(lane=lane):
+                        order.append(lane)
+
+                    futures.append(await queue.submit(work, lane=lane))
+
+            release.set()
+            await asyncio.gather(blocked, *futures)
+
+    asyncio.run(run_all())
+
+    assert order[:5].count("album") == 3
+    assert order[5:] == ["artist"] * 4
+
+
+def test_lane_workers_cap_one_lane():
+    active = {"artist": 0, "album": 0}
+    max_active = dict(active)
+
+    async def run_all():
+        async with WorkQueue(workers=4, lane_workers=2) as queue:
+            futures = []
+
+            for lane in ("artist", "album"):
+                for _ in range(6):
+
+                    async def work(lane=lane):
+                        active[lane] += 1
+                        max_active[lane] = max(max_active[lane], active[lane])
+                        await asyncio.sleep(0.01)
+                        active[lane] -= 1
+
+                    futures.append(await queue.submit(work, lane=lane))
+
+            await asyncio.gather(*futures)
+
+    asyncio.run(run_all())
+
+    assert max_active == {"artist": 2, "album": 2}
+
+
+def test_lanes_by_priority():
+    order = []
+
+    async def run_all():
+        release = asyncio.Event()
+
+        async with WorkQueue(workers=1, size=16) as queue:
+            # resources are completed in the order they were given
+            queue.add_lane("first", priority=0)
+            queue.add_lane("second", priority=1)
+            blocked = await queue.submit(release.wait, lane="blocked")
+            futures = []
+
+            # the second resource queues its items first
+            for lane, items in (("second", 3), ("first", 3)):
+                for _ in range(items):
+
+                    async def work(lane=lane):
+                        order.append(lane)
+
+                    futures.append(await queue.submit(work, lane=lane))
+
+            release.set()
+            await asyncio.gather(blocked, *futures)
+
+    asyncio.run(run_all())
+
+    assert order == ["first"] * 3 + ["second"] * 3
+
+
+def test_settle_queued_awaits_work_when_producer_raises():
+    finished = []
+
+    async def work(n: int) -> int:
+        await asyncio.sleep(0.01)
+        finished.append(n)
+        return n
+
+    async def produce():
+        async with WorkQueue(workers=2) as queue:
+            futures = []
+
+            async with settle_queued(futures):
+                for n in range(4):
+                    futures.append(await queue.submit(lambda n=n: work(n)))
+
+                raise RuntimeError("producer failed")
+
+    with pytest.raises(RuntimeError, match="producer failed"):
+        asyncio.run(produce())
+
+    assert sorted(finished) == [0, 1, 2, 3]
@@ -75,3 +75,19 @@ def test_invalid_track_quality_raises(tmp_path: Path):
 
     with raises(Exception):
         load_config_file(cfg_file)
+
+
+def test_api_config(tmp_path: Path):
+    cfg_file = write_config(
+        tmp_path,
+        """
+        [api]
+        requests_per_second = 5
+        burst = 2
+        """,
+    )
+
+    cfg = load_config_file(cfg_file)
+
+    assert cfg.api.requests_per_second == 5
+    assert cfg.api.burst == 2
@@ -1,7 +1,10 @@
+import asyncio
 import pytest
 from pytest_mock import MockerFixture, MockType
 
 from tiddl.core.api.api import (
+    AsyncTidalAPI,
+    AsyncTidalClient,
     TidalAPI,
     TidalClient,
     Limits,
@@ -152,7 +155,7 @@ def test_get_search(api: TidalAPI, mock_client: MockType):
 def test_get_session(api: TidalAPI, mock_client: MockType):
     api.get_session()
     mock_client.fetch.assert_called_once_with(
-        SessionResponse, "sessions", expire_after=DO_NOT_CACHE
+        SessionResponse, "sessions", {}, expire_after=DO_NOT_CACHE
     )
 
 
@@ -204,3 +207,15 @@ def test_get_video_stream(api: TidalAPI, mock_client: MockType):
         {"videoquality": "HIGH", "playbackmode": "STREAM", "assetpresentation": "FULL"},
         expire_after=DO_NOT_CACHE,
     )
+
+
+def test_async_get_album(mocker: MockerFixture):
+    mock_client = mocker.Mock(spec=AsyncTidalClient)
+    mock_client.fetch = mocker.AsyncMock()
+    api = AsyncTidalAPI(client=mock_client, user_id="u123", country_code="US")
+
+    asyncio.run(api.get_album(album_id=1))
+
+    mock_client.fetch.assert_awaited_once_with(
+        Album, "albums/1", {"countryCode": "US"}, expire_after=3600
+    )
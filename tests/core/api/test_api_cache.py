@@ -0,0 +1,145 @@
+from pathlib import Path
+from time import time
+
+from pydantic import BaseModel
+from pytest_mock import MockerFixture
+from requests_cache import DO_NOT_CACHE, EXPIRE_IMMEDIATELY, NEVER_EXPIRE
+
+from tiddl.core.api.cache import (
+    ModelCache,
+    ResponseCache,
+    create_key,
+    endpoint_family,
+    remaining_ttl,
+)
+
+
+def test_create_key_ignores_params_order():
+    assert create_key("albums/1", {"a": 1, "b": 2}) == create_key(
+        "albums/1", {"b": 2, "a": 1}
+    )
+
+
+def test_cache_path_suffix(tmp_path: Path):
+    assert ResponseCache(tmp_path / "cache").path == tmp_path / "cache.sqlite"
+
+
+def test_set_and_get(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.set_sync("key", "albums/1", 200, b"{}", expire_after=3600)
+
+    response = cache.get_sync("key")
+
+    assert response is not None
+    assert response.status == 200
+    assert response.body == b"{}"
+
+
+def test_expired_response_is_not_returned(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.set_sync("key", "albums/1", 200, b"{}", expire_after=0)
+
+    assert cache.get_sync("key") is None
+
+
+def test_do_not_cache(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.set_sync("key", "search", 200, b"{}", expire_after=DO_NOT_CACHE)
+
+    assert cache.get_sync("key") is None
+
+
+class DummyModel(BaseModel):
+    foo: str
+
+
+def test_model_cache_hit_and_miss():
+    cache = ModelCache()
+    model = DummyModel(foo="bar")
+
+    assert cache.get(DummyModel, "key") is None
+    cache.set(DummyModel, "key", model, expire_after=3600)
+
+    assert cache.get(DummyModel, "key") is model
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_rate == 0.5
+
+
+def test_model_cache_lru_eviction():
+    cache = ModelCache(max_size=2)
+
+    for key in ("a", "b"):
+        cache.set(DummyModel, key, DummyModel(foo=key))
+
+    cache.get(DummyModel, "a")
+    cache.set(DummyModel, "c", DummyModel(foo="c"))
+
+    assert len(cache) == 2
+    assert cache.get(DummyModel, "b") is None
+    assert cache.get(DummyModel, "a") is not None
+
+
+def test_model_cache_expiry(mocker: MockerFixture):
+    monotonic = mocker.patch("tiddl.core.api.cache.monotonic", return_value=100)
+    cache = ModelCache()
+    cache.set(DummyModel, "key", DummyModel(foo="bar"), expire_after=10)
+
+    monotonic.return_value = 111
+
+    assert cache.get(DummyModel, "key") is None
+    assert len(cache) == 0
+
+
+def test_model_cache_skips_uncacheable():
+    cache = ModelCache()
+    cache.set(DummyModel, "a", DummyModel(foo="a"), expire_after=DO_NOT_CACHE)
+    cache.set(DummyModel, "b", DummyModel(foo="b"), expire_after=EXPIRE_IMMEDIATELY)
+
+    assert len(cache) == 0
+
+
+def test_endpoint_family():
+    assert endpoint_family("albums/123/items/credits") == "albums/{id}/items/credits"
+    assert endpoint_family("playlists/ab-cd") == "playlists/{id}"
+    assert endpoint_family("search") == "search"
+
+
+def test_stats_prune_and_purge(mocker: MockerFixture, tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.set_sync(create_key("albums/1", {}), "albums/1", 200, b"12345")
+    cache.set_sync(create_key("albums/2", {}), "albums/2", 200, b"1", expire_after=10)
+    cache.set_sync(create_key("tracks/1", {}), "tracks/1", 200, b"1")
+
+    cache.get_sync(create_key("albums/1", {}))
+    cache.get_sync(create_key("albums/3", {}))
+
+    stats = cache.stats()
+
+    assert stats["albums/{id}"].entries == 2
+    assert stats["albums/{id}"].size == 6
+    assert stats["albums/{id}"].hit_rate == 0.5
+    assert stats["tracks/{id}"].hit_rate is None
+
+    mocker.patch("tiddl.core.api.cache.time", return_value=time() + 60)
+
+    assert cache.prune() == 1
+    assert cache.purge("tracks/*") == 1
+    assert cache.stats()["albums/{id}"].entries == 1
+
+
+def test_lookups_are_saved_on_close(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.get_sync(create_key("albums/1", {}))
+    cache.close()
+
+    stats = ResponseCache(tmp_path / "cache").stats()
+
+    assert stats["albums/{id}"].misses == 1
+
+
+def test_remaining_ttl(mocker: MockerFixture):
+    mocker.patch("tiddl.core.api.cache.time", return_value=1000)
+
+    assert remaining_ttl(None) == NEVER_EXPIRE
+    assert remaining_ttl(1030.5) == 30
+    assert remaining_ttl(990) == EXPIRE_IMMEDIATELY
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+from pydantic import BaseModel
+from pytest_mock import MockerFixture
+
+from tiddl.core.api.cache import create_key
+from tiddl.core.api.cassette import Cassette
+from tiddl.core.api.client import AsyncTidalClient, TidalClient
+from tiddl.core.api.exceptions import CassetteError
+
+
+class DummyModel(BaseModel):
+    foo: str
+
+
+def record(path: Path):
+    cassette = Cassette(path, "record")
+    cassette.record("albums/1", {"countryCode": "US"}, 200, b'{"foo": "a"}', 0.2)
+    cassette.record("albums/1", {"countryCode": "US"}, 200, b'{"foo": "b"}', 0.1)
+    cassette.close()
+
+
+def test_replay_in_recorded_order(tmp_path: Path):
+    record(tmp_path / "cassette.jsonl")
+    cassette = Cassette(tmp_path / "cassette.jsonl", "replay")
+
+    assert len(cassette) == 2
+    assert cassette.play("albums/1", {"countryCode": "US"}).body == '{"foo": "a"}'
+    assert cassette.play("albums/1", {"countryCode": "US"}).body == '{"foo": "b"}'
+    # the last response is repeated
+    assert cassette.play("albums/1", {"countryCode": "US"}).latency == 0.1
+
+
+def test_replay_missing_request(tmp_path: Path):
+    record(tmp_path / "cassette.jsonl")
+    cassette = Cassette(tmp_path / "cassette.jsonl", "replay")
+
+    with pytest.raises(CassetteError):
+        cassette.play("albums/2", {"countryCode": "US"})
+
+
+def test_async_client_records(mocker: MockerFixture, tmp_path: Path):
+    cassette = Cassette(tmp_path / "cassette.jsonl", "record")
+    client = AsyncTidalClient("token", tmp_path / "cache", cassette=cassette)
+
+    response = mocker.AsyncMock(status=200, headers={})
+    response.read.return_value = b'{"foo": "bar"}'
+    session = mocker.MagicMock(closed=False)
+    session.get.return_value.__aenter__.return_value = response
+    client._session = session
+
+    asyncio.run(client.fetch(DummyModel, "albums/1", {"countryCode": "US"}))
+    cassette.close()
+
+    replayed = Cassette(tmp_path / "cassette.jsonl", "replay")
+    assert replayed.play("albums/1", {"countryCode": "US"}).body == '{"foo": "bar"}'
+
+
+def test_async_client_replays(mocker: MockerFixture, tmp_path: Path):
+    record(tmp_path / "cassette.jsonl")
+    sleep = mocker.patch("tiddl.core.api.client.asyncio.sleep", mocker.AsyncMock())
+    client = AsyncTidalClient(
+        "token",
+        tmp_path / "cache",
+        omit_cache=True,
+        cassette=Cassette(
+            tmp_path / "cassette.jsonl", "replay", replay_latency=True
+        ),
+    )
+
+    async def fetch():
+        result = await client.fetch(
+            DummyModel, "albums/1", {"countryCode": "US"}, expire_after=0
+        )
+        await client.close()
+        return result
+
+    assert asyncio.run(fetch()).foo == "a"
+    assert client._session is None
+    sleep.assert_awaited_once_with(0.2)
+
+
+def test_sync_client_replays(tmp_path: Path):
+    record(tmp_path / "cassette.jsonl")
+    client = TidalClient(
+        "token",
+        tmp_path / "cache",
+        cassette=Cassette(tmp_path / "cassette.jsonl", "replay"),
+    )
+
+    result = client.fetch(DummyModel, "albums/1", {"countryCode": "US"})
+
+    assert result.foo == "a"
+
+
+def test_async_client_replays_bypass_cache(tmp_path: Path):
+    record(tmp_path / "cassette.jsonl")
+    client = AsyncTidalClient(
+        "token",
+        tmp_path / "cache",
+        cassette=Cassette(tmp_path / "cassette.jsonl", "replay"),
+    )
+
+    async def fetch():
+        result = await client.fetch(DummyModel, "albums/1", {"countryCode": "US"})
+        cached = await client.cache.get(
+            create_key("albums/1", {"countryCode": "US"})
+        )
+        await client.close()
+        return result, cached
+
+    result, cached = asyncio.run(fetch())
+
+    assert result.foo == "a"
+    assert cached is None
+
+
+def test_async_client_records_off_event_loop(mocker: MockerFixture, tmp_path: Path):
+    cassette = Cassette(tmp_path / "cassette.jsonl", "record")
+    client = AsyncTidalClient("token", tmp_path / "cache", cassette=cassette)
+    threads = []
+    record = cassette.record
+
+    def record_in_thread(*args):
+        threads.append(threading.current_thread())
+        record(*args)
+
+    mocker.patch.object(cassette, "record", record_in_thread)
+
+    response = mocker.AsyncMock(status=200, headers={})
+    response.read.return_value = b'{"foo": "bar"}'
+    session = mocker.MagicMock(closed=False)
+    session.get.return_value.__aenter__.return_value = response
+    client._session = session
+
+    asyncio.run(client.fetch(DummyModel, "albums/1", {"countryCode": "US"}))
+    cassette.close()
+
+    assert threads and threads[0] is not threading.main_thread()
@@ -1,11 +1,25 @@
+import asyncio
 import pytest
 import json
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from pytest_mock import MockerFixture
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from threading import Thread
+from time import monotonic, time
 
-from tiddl.core.api.client import TidalClient, ApiError
+from requests_cache import DO_NOT_CACHE
+
+from tiddl.core.api.cache import create_key, load_lookups
+from tiddl.core.api.client import (
+    AsyncTidalClient,
+    TidalClient,
+    ApiError,
+    decode_response,
+)
+from tiddl.core.api.debug import read_captures
+from tiddl.core.api.exceptions import InvalidJSONError
 
 
 def test_tidal_client_init(mocker: MockerFixture):
@@ -48,7 +62,7 @@ def test_fetch_success(mocker: MockerFixture, tmp_path: Path):
     mock_response = mocker.Mock()
     mock_response.status_code = 200
     mock_response.from_cache = False
-    mock_response.json.return_value = {"foo": "bar"}
+    mock_response.content = b'{"foo": "bar"}'
     mock_session.get.return_value = mock_response
 
     mocker.patch("tiddl.core.api.client.API_URL", "https://api.test")
@@ -64,14 +78,16 @@ def test_fetch_success(mocker: MockerFixture, tmp_path: Path):
         expire_after=999,
     )
 
-    debug_file = tmp_path / "albums/123.json"
-    assert debug_file.exists()
+    assert client.debug is not None
+    client.debug.close()
 
-    content = json.loads(debug_file.read_text())
+    (content,) = read_captures(tmp_path)
     assert content["status_code"] == 200
     assert content["endpoint"] == "albums/123"
     assert content["params"]["limit"] == 10
-    assert content["data"]["foo"] == "bar"
+    assert content["cached"] is False
+    assert content["latency"] >= 0
+    assert json.loads(content["body"])["foo"] == "bar"
 
 
 def test_fetch_error_raises_api_error(mocker: MockerFixture, tmp_path: Path):
@@ -79,11 +95,13 @@ def test_fetch_error_raises_api_error(mocker: MockerFixture, tmp_path: Path):
     mock_response = mocker.Mock()
     mock_response.status_code = 400
     mock_response.from_cache = False
-    mock_response.json.return_value = {
-        "status": 400,
-        "subStatus": "Bad request",
-        "userMessage": "user_message",
-    }
+    mock_response.content = json.dumps(
+        {
+            "status": 400,
+            "subStatus": "Bad request",
+            "userMessage": "user_message",
+        }
+    ).encode()
     mock_session.get.return_value = mock_response
 
     client = TidalClient("token", tmp_path / "cache")
@@ -91,3 +109,331 @@ def test_fetch_error_raises_api_error(mocker: MockerFixture, tmp_path: Path):
 
     with pytest.raises(ApiError):
         client.fetch(DummyModel, "bad/endpoint")
+
+
+def test_async_fetch_caches_response(mocker: MockerFixture, tmp_path: Path):
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    request = mocker.patch.object(
+        client, "_request", mocker.AsyncMock(return_value=(200, b'{"foo": "bar"}'))
+    )
+
+    async def fetch_twice():
+        first = await client.fetch(DummyModel, "albums/1", {"limit": 1})
+        second = await client.fetch(DummyModel, "albums/1", {"limit": 1})
+        await client.close()
+        return first, second
+
+    first, second = asyncio.run(fetch_twice())
+
+    assert first.foo == second.foo == "bar"
+    request.assert_awaited_once_with("albums/1", {"limit": 1})
+
+
+def test_async_fetch_do_not_cache(mocker: MockerFixture, tmp_path: Path):
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    request = mocker.patch.object(
+        client, "_request", mocker.AsyncMock(return_value=(200, b'{"foo": "bar"}'))
+    )
+
+    async def fetch_twice():
+        for _ in range(2):
+            await client.fetch(DummyModel, "search", expire_after=DO_NOT_CACHE)
+        await client.close()
+
+    asyncio.run(fetch_twice())
+
+    assert request.await_count == 2
+
+
+def test_async_fetch_error_raises_api_error(mocker: MockerFixture, tmp_path: Path):
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    mocker.patch.object(
+        client,
+        "_request",
+        mocker.AsyncMock(
+            return_value=(
+                404,
+                b'{"status": 404, "subStatus": "2001", "userMessage": "not found"}',
+            )
+        ),
+    )
+
+    with pytest.raises(ApiError):
+        asyncio.run(client.fetch(DummyModel, "bad/endpoint"))
+
+
+def test_async_request_retries_throttled(mocker: MockerFixture, tmp_path: Path):
+    mocker.patch("tiddl.core.api.client.asyncio.sleep", mocker.AsyncMock())
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    mocker.patch.object(
+        client,
+        "_send",
+        mocker.AsyncMock(
+            side_effect=[(429, b"", "1"), (503, b"", None), (200, b"{}", None)]
+        ),
+    )
+
+    status_code, _ = asyncio.run(client._request("albums/1", {}))
+
+    assert status_code == 200
+    assert client.stats.requests == 3
+    assert client.stats.throttled == 1
+    assert client.stats.retried == 2
+
+
+def test_sync_get_retries_on_server_error(mocker: MockerFixture, tmp_path: Path):
+    mocker.patch("tiddl.core.api.client.sleep")
+    error_response = mocker.Mock(status_code=500, headers={})
+    ok_response = mocker.Mock(status_code=200, headers={})
+
+    client = TidalClient("token", tmp_path / "cache")
+    client.session = mocker.Mock()
+    client.session.get.side_effect = [error_response, ok_response]
+
+    assert client._get("albums/1", {}, expire_after=3600) is ok_response
+    assert client.stats.retried == 1
+    assert client.stats.throttled == 0
+
+
+def test_async_fetch_coalesces_concurrent_calls(mocker: MockerFixture, tmp_path: Path):
+    client = AsyncTidalClient("token", tmp_path / "cache")
+
+    async def slow_request(endpoint, params):
+        await asyncio.sleep(0.01)
+        return 200, b'{"foo": "bar"}'
+
+    request = mocker.patch.object(
+        client, "_request", mocker.AsyncMock(side_effect=slow_request)
+    )
+
+    async def fetch_concurrently():
+        results = await asyncio.gather(
+            *(
+                client.fetch(DummyModel, "albums/1", expire_after=DO_NOT_CACHE)
+                for _ in range(5)
+            )
+        )
+        await client.close()
+        return results
+
+    results = asyncio.run(fetch_concurrently())
+
+    assert all(result is results[0] for result in results)
+    assert request.await_count == 1
+    assert client.stats.coalesced == 4
+    assert client._in_flight == {}
+
+
+def test_decode_response_validates_json_bytes():
+    assert decode_response(DummyModel, 200, b'{"foo": "bar"}').foo == "bar"
+
+
+def test_decode_response_invalid_json():
+    with pytest.raises(InvalidJSONError):
+        decode_response(DummyModel, 200, b"<html>")
+
+    with pytest.raises(InvalidJSONError):
+        decode_response(DummyModel, 500, b"<html>")
+
+
+def test_decode_response_invalid_data():
+    with pytest.raises(ValidationError):
+        decode_response(DummyModel, 200, b'{"bar": "foo"}')
+
+
+def test_async_fetch_retries_invalid_json(mocker: MockerFixture, tmp_path: Path):
+    mocker.patch("tiddl.core.api.client.asyncio.sleep", mocker.AsyncMock())
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    request = mocker.patch.object(
+        client,
+        "_request",
+        mocker.AsyncMock(side_effect=[(200, b"<html>"), (200, b'{"foo": "bar"}')]),
+    )
+
+    result = asyncio.run(client.fetch(DummyModel, "albums/1"))
+
+    assert result.foo == "bar"
+    assert request.await_count == 2
+
+
+def test_async_token_refreshed_once_on_concurrent_401(
+    mocker: MockerFixture, tmp_path: Path
+):
+    on_token_expiry = mocker.Mock(return_value=("new-token", time() + 3600))
+    client = AsyncTidalClient(
+        "token", tmp_path / "cache", on_token_expiry=on_token_expiry
+    )
+
+    async def request(endpoint, params):
+        await asyncio.sleep(0.01)
+
+        if client.token == "token":
+            return 401, b'{"status": 401, "subStatus": "0", "userMessage": ""}'
+
+        return 200, b'{"foo": "bar"}'
+
+    mocker.patch.object(client, "_request", mocker.AsyncMock(side_effect=request))
+
+    async def fetch_concurrently():
+        return await asyncio.gather(
+            *(
+                client.fetch(DummyModel, f"albums/{index}", expire_after=DO_NOT_CACHE)
+                for index in range(5)
+            )
+        )
+
+    results = asyncio.run(fetch_concurrently())
+
+    assert all(result.foo == "bar" for result in results)
+    assert on_token_expiry.call_count == 1
+    assert client.token == "new-token"
+
+
+def test_async_token_refreshed_before_expiry(mocker: MockerFixture, tmp_path: Path):
+    on_token_expiry = mocker.Mock(return_value=("new-token", time() + 3600))
+    client = AsyncTidalClient(
+        "token",
+        tmp_path / "cache",
+        on_token_expiry=on_token_expiry,
+        expires_at=time() + 60,
+    )
+    tokens = []
+
+    async def request(endpoint, params):
+        tokens.append(client.token)
+        return 200, b'{"foo": "bar"}'
+
+    mocker.patch.object(client, "_request", mocker.AsyncMock(side_effect=request))
+
+    async def fetch_twice():
+        await client.fetch(DummyModel, "albums/1", expire_after=DO_NOT_CACHE)
+        assert client._refresh is not None
+        await client._refresh
+        await client.fetch(DummyModel, "albums/2", expire_after=DO_NOT_CACHE)
+
+    asyncio.run(fetch_twice())
+
+    # the refresh runs in background, the first request is not held
+    assert tokens == ["token", "new-token"]
+    assert on_token_expiry.call_count == 1
+
+
+def test_async_expired_token_refreshed_before_request(
+    mocker: MockerFixture, tmp_path: Path
+):
+    on_token_expiry = mocker.Mock(return_value=("new-token", time() + 3600))
+    client = AsyncTidalClient(
+        "token",
+        tmp_path / "cache",
+        on_token_expiry=on_token_expiry,
+        expires_at=time() - 1,
+    )
+    tokens = []
+
+    async def request(endpoint, params):
+        tokens.append(client.token)
+        return 200, b'{"foo": "bar"}'
+
+    mocker.patch.object(client, "_request", mocker.AsyncMock(side_effect=request))
+
+    asyncio.run(client.fetch(DummyModel, "albums/1"))
+
+    assert tokens == ["new-token"]
+
+
+def test_sync_token_refreshed_before_expiry(mocker: MockerFixture, tmp_path: Path):
+    on_token_expiry = mocker.Mock(return_value=("new-token", time() + 3600))
+    client = TidalClient(
+        "token",
+        tmp_path / "cache",
+        on_token_expiry=on_token_expiry,
+        expires_at=time() + 60,
+    )
+    response = mocker.Mock(status_code=200, from_cache=False, content=b'{"foo": "a"}')
+    mocker.patch.object(client.session, "get", return_value=response)
+
+    client.fetch(DummyModel, "albums/1", expire_after=DO_NOT_CACHE)
+    client.fetch(DummyModel, "albums/2", expire_after=DO_NOT_CACHE)
+
+    assert on_token_expiry.call_count == 1
+    assert client.session.headers["Authorization"] == "Bearer new-token"
+
+
+def test_sync_cache_hits_are_not_throttled(mocker: MockerFixture, tmp_path: Path):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'{"foo": "bar"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    rate_limiter = mocker.Mock()
+    client = TidalClient(
+        "token",
+        tmp_path / "cache",
+        rate_limiter=rate_limiter,
+        api_url=f"http://127.0.0.1:{server.server_port}",
+    )
+    get_response = mocker.spy(client.session.cache, "get_response")
+
+    try:
+        for _ in range(2):
+            res = client._get("albums/1", {"countryCode": "US"}, expire_after=3600)
+    finally:
+        server.shutdown()
+
+    assert res.from_cache
+    assert rate_limiter.acquire_sync.call_count == 1
+    assert client.stats.requests == 1
+    # cached responses are read once per request, by the session
+    assert get_response.call_count == 2
+
+
+def test_sync_cache_lookups_are_saved(mocker: MockerFixture, tmp_path: Path):
+    client = TidalClient("token", tmp_path / "cache")
+    responses = [
+        mocker.Mock(
+            status_code=200, content=b'{"foo": "bar"}', from_cache=hit, expires=None
+        )
+        for hit in (False, True, True)
+    ]
+    mocker.patch.object(client, "_get", side_effect=responses)
+
+    for album_id in range(3):
+        client.fetch(DummyModel, f"albums/{album_id}", expire_after=3600)
+
+    with client.session.cache.responses.connection() as connection:
+        assert load_lookups(connection) == [("albums/{id}", 2, 1)]
+
+
+def test_async_model_expires_with_cached_response(
+    mocker: MockerFixture, tmp_path: Path
+):
+    client = AsyncTidalClient("token", tmp_path / "cache")
+    # the stored response expires in five seconds
+    client.cache.set_sync(
+        create_key("albums/1", {}), "albums/1", 200, b'{"foo": "cached"}', 5
+    )
+    mocker.patch.object(
+        client, "_request", mocker.AsyncMock(return_value=(200, b'{"foo": "fresh"}'))
+    )
+
+    async def fetch():
+        return await client.fetch(DummyModel, "albums/1", expire_after=3600)
+
+    assert asyncio.run(fetch()).foo == "cached"
+
+    # both the stored response and its model expire after ten seconds
+    mocker.patch("tiddl.core.api.cache.time", return_value=time() + 10)
+    mocker.patch("tiddl.core.api.cache.monotonic", return_value=monotonic() + 10)
+
+    assert asyncio.run(fetch()).foo == "fresh"
+    client.cache.close()
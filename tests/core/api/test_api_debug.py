@@ -0,0 +1,80 @@
+import gzip
+import logging
+from pathlib import Path
+from threading import Thread
+
+import pytest
+
+from tiddl.core.api.debug import DebugCapture, read_captures
+
+
+def test_record_and_read(tmp_path: Path):
+    capture = DebugCapture(tmp_path)
+
+    for index in range(3):
+        capture.record(f"albums/{index}", {"limit": 10}, 200, b'{"id": 1}', 0.5)
+
+    capture.close()
+
+    captures = list(read_captures(tmp_path))
+
+    assert [c["endpoint"] for c in captures] == ["albums/0", "albums/1", "albums/2"]
+    assert captures[0]["params"] == {"limit": 10}
+    assert captures[0]["latency"] == 0.5
+    assert captures[0]["body"] == '{"id": 1}'
+    assert captures[0]["timestamp"] > 0
+
+
+def test_segments_are_rotated(tmp_path: Path):
+    capture = DebugCapture(tmp_path, segment_size=1, max_segments=2)
+
+    for index in range(5):
+        capture.record(f"albums/{index}", {}, 200, b"{}", 0)
+
+    capture.close()
+
+    assert len(list(tmp_path.glob("*.jsonl.gz"))) == 2
+    assert [c["endpoint"] for c in read_captures(tmp_path)] == [
+        "albums/3",
+        "albums/4",
+    ]
+
+
+def test_record_does_not_block_when_queue_is_full(tmp_path: Path):
+    capture = DebugCapture(tmp_path, queue_size=1)
+    # keep the writer thread from consuming the queue
+    capture._thread = object()  # type: ignore
+
+    capture.record("albums/1", {}, 200, b"{}", 0)
+    capture.record("albums/2", {}, 200, b"{}", 0)
+
+    assert capture.dropped == 1
+
+
+def test_dropped_calls_are_logged(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    capture = DebugCapture(tmp_path, queue_size=1)
+    # keep the writer thread from consuming the queue
+    capture._thread = object()  # type: ignore
+
+    with caplog.at_level(logging.WARNING, logger="tiddl.core.api.debug"):
+        for album_id in range(3):
+            capture.record(f"albums/{album_id}", {}, 200, b"{}", 0)
+
+        assert "dropping calls" in caplog.text
+
+        capture._thread = Thread(target=capture._run, daemon=True)
+        capture._thread.start()
+        capture.close()
+
+    assert "dropped 2 calls" in caplog.text
+    assert [c["endpoint"] for c in read_captures(tmp_path)] == ["albums/0"]
+
+
+def test_unclosed_segment_is_readable(tmp_path: Path):
+    with gzip.open(tmp_path / "segment.jsonl.gz", "wb") as f:
+        f.write(b'{"endpoint": "albums/1"}\n')
+
+    data = (tmp_path / "segment.jsonl.gz").read_bytes()
+    (tmp_path / "segment.jsonl.gz").write_bytes(data[:-8])
+
+    assert [c["endpoint"] for c in read_captures(tmp_path)] == ["albums/1"]
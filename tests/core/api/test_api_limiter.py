@@ -0,0 +1,63 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tiddl.core.api.limiter import (
+    BACKOFF_MAX,
+    RateLimiter,
+    backoff_delay,
+    parse_retry_after,
+    retry_delay,
+)
+
+
+def test_burst_does_not_wait():
+    limiter = RateLimiter(requests_per_second=1, burst=3)
+
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, 0]
+
+
+def test_wait_after_burst():
+    limiter = RateLimiter(requests_per_second=10, burst=1)
+    limiter.reserve()
+
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.01)
+    assert limiter.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_disabled_limit():
+    limiter = RateLimiter(requests_per_second=0)
+
+    assert all(limiter.reserve() == 0 for _ in range(100))
+
+
+def test_pause():
+    limiter = RateLimiter(requests_per_second=0)
+    limiter.pause(5)
+
+    assert limiter.reserve() == pytest.approx(5, abs=0.1)
+
+
+@pytest.mark.parametrize("attempt", [1, 2, 5, 20])
+def test_backoff_delay_bounds(attempt: int):
+    for _ in range(50):
+        assert 0 <= backoff_delay(attempt) <= min(BACKOFF_MAX, 2 ** (attempt - 1))
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_parse_retry_after_date():
+    date = datetime.now(timezone.utc) + timedelta(seconds=60)
+
+    assert parse_retry_after(format_datetime(date, usegmt=True)) == pytest.approx(
+        60, abs=2
+    )
+
+
+def test_retry_delay_prefers_retry_after():
+    assert retry_delay(1, "7") == 7
@@ -0,0 +1,102 @@
+import asyncio
+
+from tiddl.core.api.models.base import Items
+from tiddl.core.api.paginate import paginate
+
+
+class NumberItems(Items):
+    items: list[int]
+
+
+def make_fetch_page(total: int, calls: list[tuple[int, int]], max_limit: int = 100):
+    async def fetch_page(limit: int, offset: int) -> NumberItems:
+        calls.append((limit, offset))
+        limit = min(limit, max_limit)
+        # later pages finish first
+        await asyncio.sleep(0.001 * (total - offset) / max(total, 1))
+
+        return NumberItems(
+            limit=limit,
+            offset=offset,
+            totalNumberOfItems=total,
+            items=list(range(offset, min(offset + limit, total))),
+        )
+
+    return fetch_page
+
+
+def collect(total: int, limit: int, concurrency: int = 4, max_limit: int = 100):
+    calls: list[tuple[int, int]] = []
+
+    async def run():
+        pages = paginate(
+            make_fetch_page(total, calls, max_limit), limit, concurrency=concurrency
+        )
+        return [item async for page in pages for item in page.items]
+
+    return asyncio.run(run()), calls
+
+
+def test_paginate_yields_items_in_order():
+    items, calls = collect(total=250, limit=100)
+
+    assert items == list(range(250))
+    assert calls[0] == (100, 0)
+    assert sorted(offset for _, offset in calls) == [0, 100, 200]
+
+
+def test_paginate_single_page():
+    items, calls = collect(total=5, limit=100)
+
+    assert items == list(range(5))
+    assert calls == [(100, 0)]
+
+
+def test_paginate_empty():
+    items, calls = collect(total=0, limit=100)
+
+    assert items == []
+    assert calls == [(100, 0)]
+
+
+def test_paginate_uses_limit_applied_by_api():
+    items, calls = collect(total=120, limit=100, max_limit=50)
+
+    assert items == list(range(120))
+    assert [offset for _, offset in calls] == [0, 50, 100]
+
+
+def test_paginate_concurrency_bound():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fetch_page(limit: int, offset: int) -> NumberItems:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return NumberItems(limit=10, offset=offset, totalNumberOfItems=100, items=[])
+
+    async def run():
+        async for _ in paginate(fetch_page, 10, concurrency=3):
+            pass
+
+    asyncio.run(run())
+
+    assert max_in_flight == 3
+
+
+def test_paginate_fetches_while_first_page_is_consumed():
+    calls: list[tuple[int, int]] = []
+    requested_during_first = []
+
+    async def run():
+        async for page in paginate(make_fetch_page(500, calls), 100):
+            if page.offset == 0:
+                await asyncio.sleep(0.05)
+                requested_during_first.extend(offset for _, offset in calls)
+
+    asyncio.run(run())
+
+    assert requested_during_first == [0, 100, 200, 300, 400]
@@ -0,0 +1,60 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+
+from tiddl.core.utils.ffmpeg import FFmpegError, remux_stream
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="fake ffmpeg is a shell script"
+)
+
+# copies stdin to the output file, like `ffmpeg -i pipe:0 -c copy`
+FAKE_FFMPEG = f"""#!{sys.executable}
+import shutil, sys
+head = sys.stdin.buffer.read(4)
+if head == b"fail":
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+with open(sys.argv[-1], "wb") as f:
+    f.write(head)
+    shutil.copyfileobj(sys.stdin.buffer, f)
+"""
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    ffmpeg = bin_path / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG)
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_path), prepend=":")
+
+
+async def iter_chunks(chunks: list[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+def test_remux_stream(tmp_path: Path):
+    chunks = [b"fLaC", b"x" * 1024**2, b"end"]
+    target = tmp_path / "track.flac"
+
+    result = asyncio.run(remux_stream(iter_chunks(chunks), target))
+
+    assert result == target
+    assert target.read_bytes() == b"".join(chunks)
+    assert list(tmp_path.glob("*.tmp.*")) == []
+
+
+def test_remux_stream_error(tmp_path: Path):
+    chunks = [b"fail"] + [b"x" * 1024**2] * 8
+    target = tmp_path / "track.flac"
+
+    with pytest.raises(FFmpegError, match="Invalid data"):
+        asyncio.run(remux_stream(iter_chunks(chunks), target))
+
+    assert not target.exists()
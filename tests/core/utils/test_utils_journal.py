@@ -0,0 +1,83 @@
+import os
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from tiddl.core.utils.journal import Journal, remove_stale_partials
+
+
+def test_journal_is_resumed(tmp_path: Path):
+    file = tmp_path / "track.flac.part"
+    journal = Journal(file, item_id=1, quality="LOSSLESS", urls=1)
+    file.write_bytes(b"\0" * 100)
+    journal.start_parts(100)
+    journal.commit_part(0, 19)
+    journal.commit_part(40, 59)
+    # progress below `save_bytes` is saved when the download is interrupted
+    journal.save()
+
+    resumed = Journal(file, item_id=1, quality="LOSSLESS", urls=1)
+
+    assert resumed.resumable
+    assert resumed.missing_parts(part_size=15) == [
+        (20, 34),
+        (35, 39),
+        (60, 74),
+        (75, 89),
+        (90, 99),
+    ]
+
+
+def test_stale_journal_is_removed(tmp_path: Path):
+    file = tmp_path / "video.ts.part"
+    journal = Journal(file, item_id=1, quality="HIGH", urls=4)
+    file.write_bytes(b"\0" * 10)
+    journal.commit_segment(2, 10)
+    journal.save()
+
+    assert Journal(file, item_id=1, quality="HIGH", urls=4).resumable
+
+    other = Journal(file, item_id=1, quality="LOW", urls=4)
+
+    assert not other.resumable
+    assert not file.exists()
+    assert not other.path.exists()
+
+
+def test_remove_stale_partials(tmp_path: Path):
+    old = tmp_path / "old.flac.part"
+    new = tmp_path / "new.flac.part"
+    track = tmp_path / "track.flac"
+    # journal save and download of older versions interrupted
+    saving = tmp_path / "old.flac.part.json.tmp"
+    legacy = tmp_path / "tmpk3j_9x0a"
+    # a user file with the name of a temporary file
+    user_file = tmp_path / "tmpnotes_01"
+
+    for file in (old, new, track, saving, user_file):
+        file.touch()
+
+    legacy.write_bytes(b"fLaC\x00\x00\x00\x22")
+
+    for file in (old, track, saving, legacy, user_file):
+        os.utime(file, (0, 0))
+
+    remove_stale_partials(tmp_path)
+
+    assert not old.exists()
+    assert not saving.exists()
+    assert not legacy.exists()
+    assert new.exists()
+    assert track.exists()
+    assert user_file.exists()
+
+
+def test_journal_saves_every_save_bytes(tmp_path: Path, mocker: MockerFixture):
+    file = tmp_path / "track.m4a.part"
+    journal = Journal(file, item_id=1, quality="HIGH", urls=100, save_bytes=1000)
+    save = mocker.spy(journal, "save")
+
+    for segment in range(1, 101):
+        journal.commit_segment(segment, segment * 100)
+
+    assert save.call_count == 10
@@ -0,0 +1,102 @@
+from pathlib import Path
+from struct import pack
+
+import pytest
+
+from tiddl.core.utils.ffmpeg import extract_flac, finalize_flac
+from tiddl.core.utils.mp4 import CodecError, FlacExtractor, Mp4Error
+
+# last metadata block, STREAMINFO of 34 bytes
+STREAMINFO = b"\x80\x00\x00\x22" + bytes(range(34))
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, payload: bytes, flags: int = 0) -> bytes:
+    return box(box_type, pack(">I", flags) + payload)
+
+
+def init_segment(codec: bytes = b"fLaC") -> bytes:
+    entry = box(codec, bytes(28) + full_box(b"dfLa", STREAMINFO))
+    stsd = full_box(b"stsd", pack(">I", 1) + entry)
+    trak = box(b"trak", box(b"mdia", box(b"minf", box(b"stbl", stsd))))
+    mvex = box(b"mvex", full_box(b"trex", bytes(20)))
+
+    return box(b"ftyp", b"iso6\0\0\0\0") + box(b"moov", trak + mvex)
+
+
+def fragment(frames: list[bytes]) -> bytes:
+    def moof(data_offset: int) -> bytes:
+        trun = full_box(
+            b"trun",
+            pack(">Ii", len(frames), data_offset)
+            + b"".join(pack(">I", len(frame)) for frame in frames),
+            flags=0x201,
+        )
+        tfhd = full_box(b"tfhd", pack(">I", 1), flags=0x20000)
+        mfhd = full_box(b"mfhd", pack(">I", 1))
+        return box(b"moof", mfhd + box(b"traf", tfhd + trun))
+
+    size = len(moof(0))
+
+    return moof(size + 8) + box(b"mdat", b"".join(frames))
+
+
+def test_extract_flac_in_chunks():
+    frames = [b"\xff\xf8frame%d" % n * (n + 1) for n in range(6)]
+    mp4 = init_segment() + fragment(frames[:3]) + fragment(frames[3:])
+
+    extractor = FlacExtractor()
+    flac = b"".join(
+        extractor.feed(mp4[offset : offset + 7]) for offset in range(0, len(mp4), 7)
+    )
+    extractor.close()
+
+    assert flac == b"fLaC" + STREAMINFO + b"".join(frames)
+
+
+def test_extract_errors():
+    with pytest.raises(CodecError, match="mp4a"):
+        FlacExtractor().feed(init_segment(b"mp4a"))
+
+    with pytest.raises(Mp4Error, match="not an MP4"):
+        FlacExtractor().feed(b"fLaC" + STREAMINFO)
+
+    extractor = FlacExtractor()
+    extractor.feed((init_segment() + fragment([b"frame"]))[:-2])
+
+    with pytest.raises(Mp4Error, match="middle"):
+        extractor.close()
+
+
+def test_extract_flac_file(tmp_path: Path):
+    source = tmp_path / "track.flac"
+    source.write_bytes(init_segment() + fragment([b"frame"]))
+
+    assert extract_flac(source) == source
+    assert source.read_bytes() == b"fLaC" + STREAMINFO + b"frame"
+
+    aac = tmp_path / "aac.flac"
+    aac.write_bytes(init_segment(b"mp4a") + fragment([b"frame"]))
+
+    assert extract_flac(aac) == tmp_path / "aac.m4a"
+    assert not aac.exists()
+
+
+def test_native_flac_is_not_rewritten(tmp_path: Path):
+    native = tmp_path / "native.m4a"
+    native.write_bytes(b"fLaC" + STREAMINFO + b"frame")
+    inode = native.stat().st_ino
+
+    path, action = finalize_flac(native)
+
+    assert action == "native"
+    assert path == tmp_path / "native.flac"
+    assert path.stat().st_ino == inode
+
+    source = tmp_path / "track.flac"
+    source.write_bytes(init_segment() + fragment([b"frame"]))
+
+    assert finalize_flac(source) == (source, "demuxed")
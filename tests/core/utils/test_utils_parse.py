@@ -0,0 +1,16 @@
+import pytest
+
+from tiddl.core.utils.parse import parse_url_expiry
+
+
+@pytest.mark.parametrize(
+    "url, expiry",
+    [
+        ("https://cdn/1.flac?Expires=1700000000&Signature=abc", 1700000000),
+        ("https://cdn/1.flac?token=abc&expires=1700000000", 1700000000),
+        ("https://cdn/1.flac?token=abc", None),
+        ("https://cdn/1.flac?Expires=soon", None),
+    ],
+)
+def test_parse_url_expiry(url: str, expiry: float | None):
+    assert parse_url_expiry(url) == expiry
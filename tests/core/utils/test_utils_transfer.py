@@ -0,0 +1,277 @@
+import asyncio
+import json
+from base64 import b64encode
+from pathlib import Path
+from random import randbytes
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from pytest_mock import MockerFixture
+
+from tiddl.core.api.models import VideoStream
+from tiddl.core.utils.journal import Journal
+from tiddl.core.utils.transfer import (
+    fetch_file,
+    fetch_segments,
+    iter_file,
+    resolve_video_stream,
+)
+
+
+def test_fetch_segments_in_order_with_retry(mocker: MockerFixture):
+    mocker.patch("tiddl.core.utils.transfer.asyncio.sleep", mocker.AsyncMock())
+    failed = set()
+    active = 0
+    max_active = 0
+
+    async def segment(request: web.Request):
+        nonlocal active, max_active
+        number = int(request.match_info["number"])
+
+        if number == 2 and number not in failed:
+            failed.add(number)
+            return web.Response(status=503)
+
+        active += 1
+        max_active = max(max_active, active)
+        # later segments finish first
+        await asyncio.sleep((10 - number) / 1000)
+        active -= 1
+
+        return web.Response(body=f"{number};".encode())
+
+    app = web.Application()
+    app.router.add_get("/{number}", segment)
+
+    async def fetch():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            urls = [str(server.make_url(f"/{n}")) for n in range(10)]
+            return [
+                segment
+                async for segment in fetch_segments(session, urls, concurrency=3)
+            ]
+
+    segments = asyncio.run(fetch())
+
+    assert b"".join(segments) == b"".join(f"{n};".encode() for n in range(10))
+    assert failed == {2}
+    assert max_active <= 3
+
+
+def run_fetch_file(app: web.Application, file: Path, connections: int) -> list[int]:
+    progress = []
+
+    async def fetch():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            await fetch_file(
+                session,
+                str(server.make_url("/file")),
+                file,
+                connections=connections,
+                part_size=16 * 1024,
+                on_progress=progress.append,
+            )
+
+    asyncio.run(fetch())
+
+    return progress
+
+
+def test_fetch_file_in_ranges(mocker: MockerFixture, tmp_path: Path):
+    mocker.patch("tiddl.core.utils.transfer.asyncio.sleep", mocker.AsyncMock())
+    data = randbytes(100_000)
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    ranges = []
+
+    async def file(request: web.Request):
+        requested = request.headers.get("Range")
+        ranges.append(requested)
+
+        # one of the parts fails once
+        if requested == "bytes=49152-65535" and ranges.count(requested) == 1:
+            return web.Response(status=503)
+
+        return web.FileResponse(source)
+
+    app = web.Application()
+    app.router.add_get("/file", file)
+
+    progress = run_fetch_file(app, tmp_path / "file", connections=3)
+
+    assert (tmp_path / "file").read_bytes() == data
+    assert sum(progress) == len(data)
+    assert ranges[0] == "bytes=0-16383"
+    assert len(ranges) == 8
+
+
+@pytest.mark.parametrize("connections", [1, 4])
+def test_fetch_file_without_ranges(tmp_path: Path, connections: int):
+    data = randbytes(100_000)
+    requests = []
+
+    async def file(request: web.Request):
+        requests.append(request)
+        return web.Response(body=data)
+
+    app = web.Application()
+    app.router.add_get("/file", file)
+
+    run_fetch_file(app, tmp_path / "file", connections)
+
+    assert (tmp_path / "file").read_bytes() == data
+    assert len(requests) == 1
+
+
+def test_fetch_file_resumes_missing_parts(tmp_path: Path):
+    data = randbytes(100_000)
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    ranges = []
+
+    async def file(request: web.Request):
+        ranges.append(request.headers.get("Range"))
+        return web.FileResponse(source)
+
+    app = web.Application()
+    app.router.add_get("/file", file)
+
+    partial = tmp_path / "file"
+    journal = Journal(partial, item_id=1, quality="LOSSLESS", urls=1)
+    partial.write_bytes(data[:32768] + bytes(len(data) - 32768))
+    journal.start_parts(len(data))
+    journal.commit_part(0, 32767)
+
+    async def fetch():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            await fetch_file(
+                session,
+                str(server.make_url("/file")),
+                partial,
+                part_size=16 * 1024,
+                journal=journal,
+            )
+
+    asyncio.run(fetch())
+
+    assert partial.read_bytes() == data
+    assert ranges[0] == "bytes=32768-49151"
+    assert len(ranges) == 5
+    assert journal.missing_parts(16 * 1024) == []
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+def test_iter_file_in_order(tmp_path: Path, accept_ranges: bool):
+    data = randbytes(100_000)
+    source = tmp_path / "source"
+    source.write_bytes(data)
+
+    async def file(request: web.Request):
+        if accept_ranges:
+            return web.FileResponse(source)
+
+        return web.Response(body=data)
+
+    app = web.Application()
+    app.router.add_get("/file", file)
+
+    async def fetch():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            return [
+                chunk
+                async for chunk in iter_file(
+                    session, str(server.make_url("/file")), 3, part_size=16 * 1024
+                )
+            ]
+
+    chunks = asyncio.run(fetch())
+
+    assert b"".join(chunks) == data
+
+    if accept_ranges:
+        assert len(chunks) == 7
+
+
+@pytest.mark.parametrize("iterate", [False, True])
+def test_first_request_is_retried(
+    mocker: MockerFixture, tmp_path: Path, iterate: bool
+):
+    mocker.patch("tiddl.core.utils.transfer.asyncio.sleep", mocker.AsyncMock())
+    data = randbytes(100_000)
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    ranges = []
+
+    async def file(request: web.Request):
+        ranges.append(request.headers.get("Range"))
+
+        if len(ranges) == 1:
+            return web.Response(status=503)
+
+        return web.FileResponse(source)
+
+    app = web.Application()
+    app.router.add_get("/file", file)
+
+    async def fetch():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            url = str(server.make_url("/file"))
+
+            if iterate:
+                return b"".join(
+                    [chunk async for chunk in iter_file(session, url, 3, 16 * 1024)]
+                )
+
+            await fetch_file(
+                session, url, tmp_path / "file", 3, part_size=16 * 1024
+            )
+            return (tmp_path / "file").read_bytes()
+
+    assert asyncio.run(fetch()) == data
+    assert ranges[:2] == ["bytes=0-16383"] * 2
+
+
+def test_resolve_video_stream_picks_highest_quality():
+    async def master(request: web.Request):
+        return web.Response(
+            text="#EXTM3U\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=1000,RESOLUTION=640x360\n"
+            f"{request.url.with_path('/360.m3u8')}\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=5000,RESOLUTION=1920x1080\n"
+            f"{request.url.with_path('/1080.m3u8')}\n"
+        )
+
+    async def playlist(request: web.Request):
+        quality = request.match_info["quality"]
+        return web.Response(
+            text="#EXTM3U\n#EXT-X-TARGETDURATION:10\n"
+            + "".join(
+                f"#EXTINF:10,\nhttps://cdn/{quality}/{n}.ts\n" for n in range(3)
+            )
+            + "#EXT-X-ENDLIST\n"
+        )
+
+    app = web.Application()
+    app.router.add_get("/master.m3u8", master)
+    app.router.add_get("/{quality}.m3u8", playlist)
+
+    async def resolve():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            manifest = {
+                "mimeType": "application/vnd.apple.mpegurl",
+                "urls": [str(server.make_url("/master.m3u8"))],
+            }
+            stream = VideoStream(
+                videoId=1,
+                streamType="ON_DEMAND",
+                assetPresentation="FULL",
+                videoQuality="HIGH",
+                manifestMimeType="application/vnd.tidal.emu",
+                manifestHash="",
+                manifest=b64encode(json.dumps(manifest).encode()).decode(),
+            )
+            return await resolve_video_stream(session, stream)
+
+    assert asyncio.run(resolve()) == [f"https://cdn/1080/{n}.ts" for n in range(3)]
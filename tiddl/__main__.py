@@ -0,0 +1,3 @@
+from tiddl.cli.app import app
+
+app()
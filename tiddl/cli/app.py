@@ -1,11 +1,14 @@
 import typer
 import logging
+from pathlib import Path
 from rich.console import Console
+from typing import Optional
 from typing_extensions import Annotated
 
 from tiddl.cli.config import APP_PATH, CONFIG
 from tiddl.cli.ctx import ContextObject, Context
 from tiddl.cli.commands import register_commands
+from tiddl.core.api.cassette import Cassette
 from tiddl.core.utils.ffmpeg import is_ffmpeg_installed as ifs
 
 log = logging.getLogger("tiddl")
@@ -31,6 +34,31 @@ def callback(
             "--debug",
         ),
     ] = CONFIG.debug,
+    RECORD: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--record",
+            help="Record Tidal API calls to a cassette file.",
+            metavar="cassette",
+        ),
+    ] = None,
+    REPLAY: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--replay",
+            help="Serve Tidal API calls from a recorded cassette file.",
+            metavar="cassette",
+            exists=True,
+            dir_okay=False,
+        ),
+    ] = None,
+    REPLAY_LATENCY: Annotated[
+        bool,
+        typer.Option(
+            "--replay-latency",
+            help="Reproduce the recorded latency of replayed calls.",
+        ),
+    ] = False,
 ):
     f"""
     tiddl {VERSION} - download tidal tracks \u266b
@@ -50,8 +78,22 @@ def callback(
     else:
         debug_path = None
 
+    if RECORD and REPLAY:
+        raise typer.BadParameter("--record and --replay can't be used together")
+
+    if RECORD:
+        cassette = Cassette(RECORD, "record")
+    elif REPLAY:
+        cassette = Cassette(REPLAY, "replay", replay_latency=REPLAY_LATENCY)
+    else:
+        cassette = None
+
     ctx.obj = ContextObject(
-        api_omit_cache=OMIT_CACHE, console=Console(), debug_path=debug_path
+        # cached responses would skip the cassette
+        api_omit_cache=OMIT_CACHE or cassette is not None,
+        console=Console(),
+        debug_path=debug_path,
+        cassette=cassette,
     )
 
     if not is_ffmpeg_installed:
@@ -1,11 +1,15 @@
 from typer import Typer
 
 from .auth import auth_command
+from .bench import bench_command
+from .cache import cache_command
 from .download import download_command
 # from .export import export_command
 
 COMMANDS = [
     auth_command,
+    bench_command,
+    cache_command,
     download_command,
     # export_command
 ]
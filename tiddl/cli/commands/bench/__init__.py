@@ -0,0 +1,396 @@
+import asyncio
+import json
+import os
+import sys
+import typer
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import monotonic, time
+
+from rich.console import Console
+from rich.table import Table
+from typing_extensions import Annotated
+
+from .server import ARTIST_ID, MIX_ID, PLAYLIST_UUID, Catalog, Faults, FakeTidal
+
+console = Console()
+log = getLogger(__name__)
+
+bench_command = typer.Typer(
+    name="bench",
+    help="Benchmark downloads against a local fake Tidal server.",
+    no_args_is_help=True,
+)
+
+SCENARIOS = ["track", "album", "playlist", "mix", "artist", "video"]
+
+AlbumsOption = Annotated[
+    int, typer.Option("--albums", help="Number of albums in the catalog.", min=1)
+]
+TracksOption = Annotated[
+    int, typer.Option("--tracks", help="Number of tracks in every album.", min=1)
+]
+VideosOption = Annotated[
+    int, typer.Option("--videos", help="Number of videos of the artist.", min=0)
+]
+TrackSizeOption = Annotated[
+    float, typer.Option("--track-size", help="Size of a track in MB.", min=0)
+]
+VideoSizeOption = Annotated[
+    float, typer.Option("--video-size", help="Size of a video in MB.", min=0)
+]
+SegmentsOption = Annotated[
+    int,
+    typer.Option(
+        "--segments", help="Number of DASH and HLS segments of a stream.", min=1
+    ),
+]
+LatencyOption = Annotated[
+    float,
+    typer.Option("--latency", help="Latency of every response in ms.", min=0),
+]
+BandwidthOption = Annotated[
+    float,
+    typer.Option(
+        "--bandwidth", help="Bandwidth of every CDN response in MB/s, 0 is unlimited."
+    ),
+]
+ErrorRateOption = Annotated[
+    float,
+    typer.Option(
+        "--error-rate", help="Fraction of requests failing with 500.", min=0, max=1
+    ),
+]
+ThrottleRateOption = Annotated[
+    float,
+    typer.Option(
+        "--throttle-rate",
+        help="Fraction of requests throttled with 429.",
+        min=0,
+        max=1,
+    ),
+]
+
+
+def create_server(
+    albums: int,
+    tracks: int,
+    videos: int,
+    track_size: float,
+    video_size: float,
+    segments: int,
+    latency: float,
+    bandwidth: float,
+    error_rate: float,
+    throttle_rate: float,
+) -> FakeTidal:
+    return FakeTidal(
+        catalog=Catalog(
+            albums=albums,
+            tracks=tracks,
+            videos=videos,
+            track_size=int(track_size * 1e6),
+            video_size=int(video_size * 1e6),
+            segments=segments,
+        ),
+        faults=Faults(
+            latency=latency / 1000,
+            bandwidth=bandwidth * 1e6,
+            error_rate=error_rate,
+            throttle_rate=throttle_rate,
+        ),
+    )
+
+
+def get_scenario(catalog: Catalog, scenario: str) -> tuple[str, int]:
+    """Resource to download in the `scenario` and number of its items."""
+
+    first_album = catalog.album_ids()[0]
+    all_tracks = len(catalog.all_track_ids())
+
+    match scenario:
+        case "track":
+            return f"track/{catalog.track_ids(first_album)[0]}", 1
+        case "album":
+            return f"album/{first_album}", catalog.tracks
+        case "playlist":
+            return f"playlist/{PLAYLIST_UUID}", all_tracks
+        case "mix":
+            return f"mix/{MIX_ID}", all_tracks
+        case "artist":
+            return f"artist/{ARTIST_ID}", all_tracks + catalog.videos
+        case "video":
+            return f"video/{catalog.video_ids()[0]}", 1
+
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def write_app_files(app_path: Path, server: FakeTidal, threads: int):
+    """Config and auth data of the app used by the benchmarked process."""
+
+    (app_path / "config.toml").write_text(
+        f"enable_cache = false\n"
+        f"[api]\n"
+        f'url = "{server.api_url}"\n'
+        f"requests_per_second = 0\n"
+        f"[metadata]\n"
+        f"enable = false\n"
+        f"[download]\n"
+        f'download_path = "{(app_path / "downloads").as_posix()}"\n'
+        f"threads_count = {threads}\n"
+        f'videos_filter = "allow"\n'
+    )
+    (app_path / "auth.json").write_text(
+        json.dumps(
+            {
+                "token": "bench",
+                "refresh_token": "bench",
+                "expires_at": int(time()) + 365 * 24 * 3600,
+                "user_id": "1",
+                "country_code": "US",
+            }
+        )
+    )
+
+
+@dataclass(slots=True)
+class BenchResult:
+    scenario: str
+    items: int
+    files: int
+    elapsed: float
+    active: float
+    megabytes: float
+    api_calls: int
+    errors: int
+    throttled: int
+    returncode: int
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.megabytes / self.active if self.active else 0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.active if self.active else 0
+
+    @property
+    def api_calls_per_item(self) -> float:
+        return self.api_calls / self.items if self.items else 0
+
+
+async def run_scenario(
+    server: FakeTidal, scenario: str, quality: str, threads: int
+) -> BenchResult:
+    resource, items = get_scenario(server.catalog, scenario)
+
+    with TemporaryDirectory(prefix="tiddl-bench-") as tmp:
+        app_path = Path(tmp)
+        write_app_files(app_path, server, threads)
+        server.reset_stats()
+
+        started = monotonic()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "tiddl",
+            "download",
+            "--track-quality",
+            quality,
+            "url",
+            resource,
+            env={**os.environ, "TIDDL_PATH": str(app_path)},
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        elapsed = monotonic() - started
+
+        if process.returncode:
+            log.error(stderr.decode(errors="replace"))
+
+        files = sum(
+            1 for file in (app_path / "downloads").rglob("*") if file.is_file()
+        )
+
+    stats = server.stats
+
+    return BenchResult(
+        scenario=scenario,
+        items=items,
+        files=files,
+        elapsed=elapsed,
+        active=stats.active_time,
+        megabytes=stats.cdn_bytes / 1e6,
+        api_calls=stats.api_calls,
+        errors=stats.errors,
+        throttled=stats.throttled,
+        returncode=process.returncode or 0,
+    )
+
+
+def show_results(results: list[BenchResult]):
+    table = Table(expand=True)
+    table.add_column("Scenario", style="cyan")
+    table.add_column("Items", justify="right")
+    table.add_column("Files", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("MB/s", justify="right", style="green")
+    table.add_column("Items/s", justify="right", style="green")
+    table.add_column("API calls/item", justify="right", style="yellow")
+    table.add_column("500/429", justify="right")
+
+    for result in results:
+        table.add_row(
+            result.scenario,
+            str(result.items),
+            str(result.files),
+            f"{result.elapsed:.2f}s",
+            f"{result.mb_per_second:.1f}",
+            f"{result.items_per_second:.2f}",
+            f"{result.api_calls_per_item:.2f}",
+            f"{result.errors}/{result.throttled}",
+        )
+
+    console.print(table)
+    console.print(
+        "[gray]MB/s and items/s are measured from the first request "
+        "to the last response seen by the server."
+    )
+
+
+@bench_command.command(help="Download scenarios and report the throughput.")
+def run(
+    SCENARIO: Annotated[
+        list[str],
+        typer.Argument(
+            help=f"Scenarios to run: {', '.join(SCENARIOS)}.",
+            show_default=False,
+        ),
+    ] = ["album", "playlist"],
+    QUALITY: Annotated[
+        str,
+        typer.Option("--track-quality", "-q", help="Track quality to download."),
+    ] = "high",
+    THREADS_COUNT: Annotated[
+        int,
+        typer.Option(
+            "--threads-count", "-t", help="Number of concurrent downloads.", min=1
+        ),
+    ] = 4,
+    FAIL_BELOW: Annotated[
+        float,
+        typer.Option(
+            "--fail-below",
+            help="Exit with an error when any scenario is slower, in MB/s.",
+            metavar="MB/s",
+        ),
+    ] = 0,
+    ALBUMS: AlbumsOption = 2,
+    TRACKS: TracksOption = 10,
+    VIDEOS: VideosOption = 2,
+    TRACK_SIZE: TrackSizeOption = 8,
+    VIDEO_SIZE: VideoSizeOption = 16,
+    SEGMENTS: SegmentsOption = 8,
+    LATENCY: LatencyOption = 0,
+    BANDWIDTH: BandwidthOption = 0,
+    ERROR_RATE: ErrorRateOption = 0,
+    THROTTLE_RATE: ThrottleRateOption = 0,
+):
+    for scenario in SCENARIO:
+        if scenario not in SCENARIOS:
+            raise typer.BadParameter(f"Unknown scenario '{scenario}'")
+
+    server = create_server(
+        ALBUMS,
+        TRACKS,
+        VIDEOS,
+        TRACK_SIZE,
+        VIDEO_SIZE,
+        SEGMENTS,
+        LATENCY,
+        BANDWIDTH,
+        ERROR_RATE,
+        THROTTLE_RATE,
+    )
+
+    async def run_scenarios() -> list[BenchResult]:
+        await server.start()
+        results = []
+
+        try:
+            for scenario in SCENARIO:
+                with console.status(f"Running {scenario}"):
+                    result = await run_scenario(
+                        server, scenario, QUALITY, THREADS_COUNT
+                    )
+
+                if result.returncode:
+                    console.print(
+                        f"[red]{scenario} failed with code {result.returncode}"
+                    )
+
+                results.append(result)
+        finally:
+            await server.stop()
+
+        return results
+
+    results = asyncio.run(run_scenarios())
+    show_results(results)
+
+    if any(result.returncode for result in results):
+        raise typer.Exit(1)
+
+    if FAIL_BELOW and any(r.mb_per_second < FAIL_BELOW for r in results):
+        console.print(f"[red]Throughput is below {FAIL_BELOW} MB/s")
+        raise typer.Exit(1)
+
+
+@bench_command.command(help="Run the fake Tidal server until interrupted.")
+def serve(
+    PORT: Annotated[int, typer.Option("--port", help="Port of the server.")] = 8080,
+    ALBUMS: AlbumsOption = 2,
+    TRACKS: TracksOption = 10,
+    VIDEOS: VideosOption = 2,
+    TRACK_SIZE: TrackSizeOption = 8,
+    VIDEO_SIZE: VideoSizeOption = 16,
+    SEGMENTS: SegmentsOption = 8,
+    LATENCY: LatencyOption = 0,
+    BANDWIDTH: BandwidthOption = 0,
+    ERROR_RATE: ErrorRateOption = 0,
+    THROTTLE_RATE: ThrottleRateOption = 0,
+):
+    server = create_server(
+        ALBUMS,
+        TRACKS,
+        VIDEOS,
+        TRACK_SIZE,
+        VIDEO_SIZE,
+        SEGMENTS,
+        LATENCY,
+        BANDWIDTH,
+        ERROR_RATE,
+        THROTTLE_RATE,
+    )
+
+    async def serve_forever():
+        await server.start(port=PORT)
+
+        console.print(f"Set [cyan]api.url[/] to [green]{server.api_url}[/]")
+        console.print(
+            "Resources: "
+            + ", ".join(get_scenario(server.catalog, s)[0] for s in SCENARIOS)
+        )
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,802 @@
+import asyncio
+import json
+from base64 import b64encode
+from dataclasses import dataclass, field
+from logging import getLogger
+from random import Random
+from struct import pack
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+
+log = getLogger(__name__)
+
+ARTIST_ID = 1
+ALBUM_ID_START = 100
+VIDEO_ID_START = 9000
+PLAYLIST_UUID = "bench-playlist"
+MIX_ID = "bench-mix"
+
+PAGE_LIMIT_MAX = 100
+CHUNK_SIZE = 64 * 1024
+PAYLOAD_BLOCK_SIZE = 1024**2
+TS_PACKET_SIZE = 188
+FLAC_FRAME_SIZE = 16 * 1024
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+def mp4_box(box_type: bytes, payload: bytes, flags: int | None = None) -> bytes:
+    """MP4 box, `flags` makes it a full box."""
+
+    if flags is not None:
+        payload = pack(">I", flags) + payload
+
+    return pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def flac_init_segment() -> bytes:
+    """Init segment of fragmented MP4 with a 24-bit 96 kHz stereo FLAC track."""
+
+    streaminfo = (
+        pack(">HH", 4096, 4096)
+        + bytes(6)
+        + pack(">Q", (96000 << 44) | (1 << 41) | (23 << 36))
+        + bytes(16)
+    )
+    # last metadata block of type STREAMINFO
+    dfla = mp4_box(b"dfLa", b"\x80" + len(streaminfo).to_bytes(3) + streaminfo, 0)
+    entry = mp4_box(b"fLaC", bytes(28) + dfla)
+    stsd = mp4_box(b"stsd", pack(">I", 1) + entry, 0)
+    trak = mp4_box(
+        b"trak", mp4_box(b"mdia", mp4_box(b"minf", mp4_box(b"stbl", stsd)))
+    )
+    mvex = mp4_box(b"mvex", mp4_box(b"trex", bytes(20), 0))
+
+    return mp4_box(b"ftyp", b"iso6\0\0\0\0") + mp4_box(b"moov", trak + mvex)
+
+
+def flac_fragment_header(frames_size: int) -> bytes:
+    """`moof` and `mdat` header of fragment with `frames_size` bytes of frames."""
+
+    sizes = [
+        min(FLAC_FRAME_SIZE, frames_size - offset)
+        for offset in range(0, frames_size, FLAC_FRAME_SIZE)
+    ]
+
+    def moof(data_offset: int) -> bytes:
+        trun = mp4_box(
+            b"trun",
+            pack(">Ii", len(sizes), data_offset)
+            + b"".join(pack(">I", size) for size in sizes),
+            0x201,
+        )
+        tfhd = mp4_box(b"tfhd", pack(">I", 1), 0x20000)
+        mfhd = mp4_box(b"mfhd", pack(">I", 1), 0)
+
+        return mp4_box(b"moof", mfhd + mp4_box(b"traf", tfhd + trun))
+
+    moof_size = len(moof(0))
+
+    return moof(moof_size + 8) + pack(">I4s", 8 + frames_size, b"mdat")
+
+
+@dataclass(slots=True)
+class Catalog:
+    """Synthetic resources served by the `FakeTidal` server."""
+
+    albums: int = 2
+    tracks: int = 10
+    videos: int = 2
+    track_size: int = 8 * 1024**2
+    video_size: int = 16 * 1024**2
+    segments: int = 8
+
+    def album_ids(self) -> list[int]:
+        return list(range(ALBUM_ID_START, ALBUM_ID_START + self.albums))
+
+    def track_ids(self, album_id: int) -> list[int]:
+        return [album_id * 1000 + n for n in range(1, self.tracks + 1)]
+
+    def all_track_ids(self) -> list[int]:
+        return [
+            track_id
+            for album_id in self.album_ids()
+            for track_id in self.track_ids(album_id)
+        ]
+
+    def video_ids(self) -> list[int]:
+        return list(range(VIDEO_ID_START, VIDEO_ID_START + self.videos))
+
+    def has_album(self, album_id: int) -> bool:
+        return album_id in self.album_ids()
+
+    def has_track(self, track_id: int) -> bool:
+        return self.has_album(track_id // 1000) and 0 < track_id % 1000 <= self.tracks
+
+    def has_video(self, video_id: int) -> bool:
+        return video_id in self.video_ids()
+
+
+@dataclass(slots=True)
+class Faults:
+    """
+    Conditions of the fake network.
+
+    `bandwidth` is in bytes per second for each CDN response, 0 is unlimited.
+    `error_rate` and `throttle_rate` are the fractions of requests
+    answered with 500 and 429.
+    Without `accept_ranges` the CDN ignores the `Range` header.
+    """
+
+    latency: float = 0
+    bandwidth: float = 0
+    error_rate: float = 0
+    throttle_rate: float = 0
+    retry_after: float = 1
+    accept_ranges: bool = True
+    seed: int = 0
+
+
+@dataclass(slots=True)
+class ServerStats:
+    api_calls: int = 0
+    cdn_requests: int = 0
+    cdn_bytes: int = 0
+    errors: int = 0
+    throttled: int = 0
+    api_calls_by_endpoint: dict[str, int] = field(default_factory=dict)
+    first_request: float | None = None
+    last_response: float | None = None
+
+    @property
+    def active_time(self) -> float:
+        """Seconds between the first request and the last response."""
+
+        if self.first_request is None or self.last_response is None:
+            return 0
+
+        return self.last_response - self.first_request
+
+
+def track_payload(track_id: int) -> dict[str, Any]:
+    album_id = track_id // 1000
+    artist = {"id": ARTIST_ID, "name": "Bench Artist", "type": "MAIN"}
+
+    return {
+        "id": track_id,
+        "title": f"Track {track_id % 1000}",
+        "duration": 240,
+        "replayGain": -7.5,
+        "peak": 0.98,
+        "allowStreaming": True,
+        "streamReady": True,
+        "adSupportedStreamReady": True,
+        "djReady": True,
+        "stemReady": False,
+        "streamStartDate": "2020-01-01T00:00:00.000+0000",
+        "premiumStreamingOnly": False,
+        "trackNumber": track_id % 1000,
+        "volumeNumber": 1,
+        "version": None,
+        "popularity": 50,
+        "copyright": "(P) 2020 Bench",
+        "bpm": 120,
+        "url": f"http://www.tidal.com/track/{track_id}",
+        "isrc": f"BENCH{track_id:07d}",
+        "editable": False,
+        "explicit": False,
+        "audioQuality": "LOSSLESS",
+        "audioModes": ["STEREO"],
+        "mediaMetadata": {"tags": ["LOSSLESS", "HIRES_LOSSLESS"]},
+        "artist": artist,
+        "artists": [artist],
+        "album": {
+            "id": album_id,
+            "title": f"Album {album_id}",
+            "cover": None,
+            "vibrantColor": "#ffffff",
+            "videoCover": None,
+        },
+        "mixes": {},
+    }
+
+
+def video_payload(video_id: int) -> dict[str, Any]:
+    artist = {"id": ARTIST_ID, "name": "Bench Artist", "type": "MAIN"}
+
+    return {
+        "id": video_id,
+        "title": f"Video {video_id}",
+        "volumeNumber": 1,
+        "trackNumber": 1,
+        "streamStartDate": "2020-01-01T00:00:00.000+0000",
+        "imagePath": None,
+        "imageId": None,
+        "vibrantColor": "#ffffff",
+        "duration": 240,
+        "quality": "MP4_1080P",
+        "streamReady": True,
+        "adSupportedStreamReady": True,
+        "djReady": True,
+        "stemReady": False,
+        "allowStreaming": True,
+        "explicit": False,
+        "popularity": 50,
+        "type": "Music Video",
+        "adsUrl": None,
+        "adsPrePaywallOnly": True,
+        "artist": artist,
+        "artists": [artist],
+        "album": None,
+    }
+
+
+def album_payload(album_id: int, catalog: Catalog) -> dict[str, Any]:
+    artist = {"id": ARTIST_ID, "name": "Bench Artist", "type": "MAIN"}
+
+    return {
+        "id": album_id,
+        "title": f"Album {album_id}",
+        "duration": 240 * catalog.tracks,
+        "streamReady": True,
+        "adSupportedStreamReady": True,
+        "djReady": True,
+        "stemReady": False,
+        "streamStartDate": "2020-01-01T00:00:00.000+0000",
+        "allowStreaming": True,
+        "premiumStreamingOnly": False,
+        "numberOfTracks": catalog.tracks,
+        "numberOfVideos": 0,
+        "numberOfVolumes": 1,
+        "releaseDate": "2020-01-01",
+        "copyright": "(P) 2020 Bench",
+        "type": "ALBUM",
+        "version": None,
+        "url": f"http://www.tidal.com/album/{album_id}",
+        "cover": None,
+        "vibrantColor": "#ffffff",
+        "videoCover": None,
+        "explicit": False,
+        "upc": f"{album_id:012d}",
+        "popularity": 50,
+        "audioQuality": "LOSSLESS",
+        "audioModes": ["STEREO"],
+        "mediaMetadata": {"tags": ["LOSSLESS", "HIRES_LOSSLESS"]},
+        "artist": artist,
+        "artists": [artist],
+    }
+
+
+def playlist_payload(catalog: Catalog) -> dict[str, Any]:
+    return {
+        "uuid": PLAYLIST_UUID,
+        "title": "Bench Playlist",
+        "numberOfTracks": len(catalog.all_track_ids()),
+        "numberOfVideos": 0,
+        "creator": {"id": 0},
+        "description": None,
+        "duration": 240 * len(catalog.all_track_ids()),
+        "lastUpdated": "2020-01-01T00:00:00.000+0000",
+        "created": "2020-01-01T00:00:00.000+0000",
+        "type": "USER",
+        "publicPlaylist": False,
+        "url": f"http://www.tidal.com/playlist/{PLAYLIST_UUID}",
+        "image": None,
+        "popularity": 0,
+        "squareImage": None,
+        "promotedArtists": [],
+        "lastItemAddedAt": None,
+    }
+
+
+def page(request: web.Request, items: list[Any]) -> dict[str, Any]:
+    limit = min(int(request.query.get("limit", 10)), PAGE_LIMIT_MAX)
+    offset = int(request.query.get("offset", 0))
+
+    return {
+        "limit": limit,
+        "offset": offset,
+        "totalNumberOfItems": len(items),
+        "items": items[offset : offset + limit],
+    }
+
+
+def not_found(message: str) -> web.Response:
+    return web.json_response(
+        {"status": 404, "subStatus": "2001", "userMessage": message}, status=404
+    )
+
+
+class FakeTidal:
+    """
+    Local stand-in for Tidal API and CDN, used for benchmarks.
+
+    API endpoints are served under `/v1`, media under `/cdn`.
+    Every resource comes from the `Catalog`
+    and all responses are shaped by `Faults`.
+    """
+
+    catalog: Catalog
+    faults: Faults
+    stats: ServerStats
+    base_url: str
+
+    def __init__(self, catalog: Catalog, faults: Faults) -> None:
+        self.catalog = catalog
+        self.faults = faults
+        self.stats = ServerStats()
+        self.base_url = ""
+        self._random = Random(faults.seed)
+        self._block = self._random.randbytes(PAYLOAD_BLOCK_SIZE)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def cdn_url(self) -> str:
+        return f"{self.base_url}/cdn"
+
+    def reset_stats(self) -> None:
+        self.stats = ServerStats()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.faults_middleware])
+
+        api = [
+            ("/albums/{id}", self.album),
+            ("/albums/{id}/items", self.album_items),
+            ("/albums/{id}/items/credits", self.album_items_credits),
+            ("/albums/{id}/review", self.album_review),
+            ("/artists/{id}", self.artist),
+            ("/artists/{id}/albums", self.artist_albums),
+            ("/artists/{id}/videos", self.artist_videos),
+            ("/playlists/{id}", self.playlist),
+            ("/playlists/{id}/items", self.playlist_items),
+            ("/mixes/{id}/items", self.mix_items),
+            ("/tracks/{id}", self.track),
+            ("/tracks/{id}/lyrics", self.track_lyrics),
+            ("/tracks/{id}/playbackinfopostpaywall", self.track_stream),
+            ("/videos/{id}", self.video),
+            ("/videos/{id}/playbackinfopostpaywall", self.video_stream),
+        ]
+
+        for path, handler in api:
+            app.router.add_get(f"/v1{path}", handler)
+
+        app.router.add_get("/cdn/tracks/{id}.{ext}", self.cdn_track)
+        app.router.add_get("/cdn/tracks/{id}/{segment}.mp4", self.cdn_track_segment)
+        app.router.add_get("/cdn/videos/{id}/master.m3u8", self.cdn_video_master)
+        app.router.add_get("/cdn/videos/{id}/playlist.m3u8", self.cdn_video_playlist)
+        app.router.add_get("/cdn/videos/{id}/{segment}.ts", self.cdn_video_segment)
+
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start the server and return its base url."""
+
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        server = site._server
+        assert isinstance(server, asyncio.Server)
+        port = server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+
+        log.debug(f"fake tidal server started at {self.base_url}")
+
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def faults_middleware(
+        self, request: web.Request, handler: Handler
+    ) -> web.StreamResponse:
+        stats = self.stats
+
+        if stats.first_request is None:
+            stats.first_request = monotonic()
+
+        is_api = request.path.startswith("/v1/")
+
+        if is_api:
+            stats.api_calls += 1
+            endpoint = request.match_info.route.resource
+            name = endpoint.canonical if endpoint else request.path
+            stats.api_calls_by_endpoint[name] = (
+                stats.api_calls_by_endpoint.get(name, 0) + 1
+            )
+        else:
+            stats.cdn_requests += 1
+
+        if self.faults.latency:
+            await asyncio.sleep(self.faults.latency)
+
+        roll = self._random.random()
+
+        if roll < self.faults.throttle_rate:
+            stats.throttled += 1
+            response: web.StreamResponse = web.json_response(
+                {"status": 429, "subStatus": "0", "userMessage": "Too many requests"},
+                status=429,
+                headers={"Retry-After": f"{self.faults.retry_after:g}"},
+            )
+        elif roll < self.faults.throttle_rate + self.faults.error_rate:
+            stats.errors += 1
+            response = web.json_response(
+                {"status": 500, "subStatus": "0", "userMessage": "Injected error"},
+                status=500,
+            )
+        else:
+            response = await handler(request)
+
+        stats.last_response = monotonic()
+
+        return response
+
+    # API
+
+    async def album(self, request: web.Request) -> web.StreamResponse:
+        album_id = int(request.match_info["id"])
+
+        if not self.catalog.has_album(album_id):
+            return not_found("Album not found")
+
+        return web.json_response(album_payload(album_id, self.catalog))
+
+    def album_tracks(self, album_id: int) -> list[dict[str, Any]]:
+        return [
+            {"item": track_payload(track_id), "type": "track"}
+            for track_id in self.catalog.track_ids(album_id)
+        ]
+
+    async def album_items(self, request: web.Request) -> web.StreamResponse:
+        album_id = int(request.match_info["id"])
+
+        if not self.catalog.has_album(album_id):
+            return not_found("Album not found")
+
+        return web.json_response(page(request, self.album_tracks(album_id)))
+
+    async def album_items_credits(self, request: web.Request) -> web.StreamResponse:
+        album_id = int(request.match_info["id"])
+
+        if not self.catalog.has_album(album_id):
+            return not_found("Album not found")
+
+        credits = [
+            {"type": "Producer", "contributors": [{"name": "Bench Producer"}]}
+        ]
+        items = [
+            {**item, "credits": credits} for item in self.album_tracks(album_id)
+        ]
+
+        return web.json_response(page(request, items))
+
+    async def album_review(self, request: web.Request) -> web.StreamResponse:
+        return web.json_response(
+            {
+                "source": "bench",
+                "lastUpdated": "2020-01-01T00:00:00.000+0000",
+                "text": "Synthetic album.",
+                "summary": "Synthetic album.",
+            }
+        )
+
+    async def artist(self, request: web.Request) -> web.StreamResponse:
+        if int(request.match_info["id"]) != ARTIST_ID:
+            return not_found("Artist not found")
+
+        return web.json_response(
+            {"id": ARTIST_ID, "name": "Bench Artist", "type": "MAIN"}
+        )
+
+    async def artist_albums(self, request: web.Request) -> web.StreamResponse:
+        albums = []
+
+        if int(request.match_info["id"]) == ARTIST_ID:
+            if request.query.get("filter", "ALBUMS") == "ALBUMS":
+                albums = [
+                    album_payload(album_id, self.catalog)
+                    for album_id in self.catalog.album_ids()
+                ]
+
+        return web.json_response(page(request, albums))
+
+    async def artist_videos(self, request: web.Request) -> web.StreamResponse:
+        videos = []
+
+        if int(request.match_info["id"]) == ARTIST_ID:
+            videos = [video_payload(video_id) for video_id in self.catalog.video_ids()]
+
+        return web.json_response(page(request, videos))
+
+    async def playlist(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["id"] != PLAYLIST_UUID:
+            return not_found("Playlist not found")
+
+        return web.json_response(playlist_payload(self.catalog))
+
+    async def playlist_items(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["id"] != PLAYLIST_UUID:
+            return not_found("Playlist not found")
+
+        items = [
+            {
+                "item": {
+                    **track_payload(track_id),
+                    "dateAdded": "2020-01-01T00:00:00.000+0000",
+                    "index": index,
+                    "itemUuid": f"bench-{track_id}",
+                },
+                "type": "track",
+                "cut": None,
+            }
+            for index, track_id in enumerate(self.catalog.all_track_ids())
+        ]
+
+        return web.json_response(page(request, items))
+
+    async def mix_items(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["id"] != MIX_ID:
+            return not_found("Mix not found")
+
+        items = [
+            {"item": track_payload(track_id), "type": "track"}
+            for track_id in self.catalog.all_track_ids()
+        ]
+
+        return web.json_response(page(request, items))
+
+    async def track(self, request: web.Request) -> web.StreamResponse:
+        track_id = int(request.match_info["id"])
+
+        if not self.catalog.has_track(track_id):
+            return not_found("Track not found")
+
+        return web.json_response(track_payload(track_id))
+
+    async def track_lyrics(self, request: web.Request) -> web.StreamResponse:
+        track_id = int(request.match_info["id"])
+
+        return web.json_response(
+            {
+                "isRightToLeft": False,
+                "lyrics": "la la la",
+                "lyricsProvider": "bench",
+                "providerCommontrackId": str(track_id),
+                "providerLyricsId": str(track_id),
+                "subtitles": "[00:00.00] la la la",
+                "trackId": track_id,
+            }
+        )
+
+    async def track_stream(self, request: web.Request) -> web.StreamResponse:
+        track_id = int(request.match_info["id"])
+
+        if not self.catalog.has_track(track_id):
+            return not_found("Track not found")
+
+        quality = request.query.get("audioquality", "LOSSLESS")
+        bit_depth, sample_rate = 16, 44100
+
+        if quality == "HI_RES_LOSSLESS":
+            bit_depth, sample_rate = 24, 96000
+            manifest_mime_type = "application/dash+xml"
+            manifest = self.dash_manifest(track_id)
+        elif quality == "LOSSLESS":
+            manifest_mime_type = "application/vnd.tidal.bts"
+            manifest = json.dumps(
+                {
+                    "mimeType": "audio/flac",
+                    "codecs": "flac",
+                    "encryptionType": "NONE",
+                    "urls": [f"{self.cdn_url}/tracks/{track_id}.flac"],
+                }
+            )
+        else:
+            manifest_mime_type = "application/vnd.tidal.bts"
+            manifest = json.dumps(
+                {
+                    "mimeType": "audio/mp4",
+                    "codecs": "mp4a.40.2",
+                    "encryptionType": "NONE",
+                    "urls": [f"{self.cdn_url}/tracks/{track_id}.m4a"],
+                }
+            )
+
+        return web.json_response(
+            {
+                "trackId": track_id,
+                "assetPresentation": "FULL",
+                "audioMode": "STEREO",
+                "audioQuality": quality,
+                "manifestMimeType": manifest_mime_type,
+                "manifestHash": str(track_id),
+                "manifest": b64encode(manifest.encode()).decode(),
+                "bitDepth": bit_depth,
+                "sampleRate": sample_rate,
+            }
+        )
+
+    def dash_manifest(self, track_id: int) -> str:
+        # the init segment and `segments - 1` media segments
+        repeat = max(self.catalog.segments - 2, 0)
+
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static">'
+            '<Period><AdaptationSet contentType="audio" mimeType="audio/mp4">'
+            '<Representation id="FLAC,96000,24" codecs="flac" bandwidth="3000000">'
+            f'<SegmentTemplate timescale="96000" initialization="'
+            f'{self.cdn_url}/tracks/{track_id}/0.mp4" '
+            f'media="{self.cdn_url}/tracks/{track_id}/$Number$.mp4" startNumber="1">'
+            f'<SegmentTimeline><S d="393216" r="{repeat}"/></SegmentTimeline>'
+            "</SegmentTemplate></Representation></AdaptationSet></Period></MPD>"
+        )
+
+    async def video(self, request: web.Request) -> web.StreamResponse:
+        video_id = int(request.match_info["id"])
+
+        if not self.catalog.has_video(video_id):
+            return not_found("Video not found")
+
+        return web.json_response(video_payload(video_id))
+
+    async def video_stream(self, request: web.Request) -> web.StreamResponse:
+        video_id = int(request.match_info["id"])
+
+        if not self.catalog.has_video(video_id):
+            return not_found("Video not found")
+
+        manifest = json.dumps(
+            {
+                "mimeType": "application/vnd.apple.mpegurl",
+                "urls": [f"{self.cdn_url}/videos/{video_id}/master.m3u8"],
+            }
+        )
+
+        return web.json_response(
+            {
+                "videoId": video_id,
+                "streamType": "ON_DEMAND",
+                "assetPresentation": "FULL",
+                "videoQuality": request.query.get("videoquality", "HIGH"),
+                "manifestMimeType": "application/vnd.tidal.emu",
+                "manifestHash": str(video_id),
+                "manifest": b64encode(manifest.encode()).decode(),
+            }
+        )
+
+    # CDN
+
+    def payload_chunk(self, position: int, size: int, header: bytes) -> bytes:
+        """Synthetic data at `position`, the same for every request."""
+
+        offset = position % PAYLOAD_BLOCK_SIZE
+        chunk = self._block[offset : offset + size]
+
+        if len(chunk) < size:
+            chunk += self._block[: size - len(chunk)]
+
+        if position < len(header):
+            head = header[position : position + size]
+            chunk = head + chunk[len(head) :]
+
+        return chunk
+
+    async def send_payload(
+        self, request: web.Request, size: int, header: bytes = b""
+    ) -> web.StreamResponse:
+        """
+        Stream `size` bytes of synthetic data limited by the bandwidth,
+        single byte range is served when requested.
+        """
+
+        start, stop = 0, size
+        headers = {"Content-Type": "application/octet-stream"}
+
+        if self.faults.accept_ranges:
+            headers["Accept-Ranges"] = "bytes"
+
+            try:
+                requested = request.http_range
+            except ValueError:
+                raise web.HTTPRequestRangeNotSatisfiable()
+
+            if requested.start is not None or requested.stop is not None:
+                start, stop, _ = requested.indices(size)
+
+                if start >= stop:
+                    raise web.HTTPRequestRangeNotSatisfiable(
+                        headers={"Content-Range": f"bytes */{size}"}
+                    )
+
+        response = web.StreamResponse(headers=headers)
+
+        if (start, stop) != (0, size):
+            response.set_status(206)
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+        response.content_length = stop - start
+        await response.prepare(request)
+
+        position = start
+
+        while position < stop:
+            chunk = self.payload_chunk(
+                position, min(CHUNK_SIZE, stop - position), header
+            )
+
+            try:
+                await response.write(chunk)
+            except ConnectionResetError:
+                # client went away, e.g. interrupted download
+                return response
+
+            position += len(chunk)
+            self.stats.cdn_bytes += len(chunk)
+
+            if self.faults.bandwidth:
+                await asyncio.sleep(len(chunk) / self.faults.bandwidth)
+
+        await response.write_eof()
+
+        return response
+
+    async def cdn_track(self, request: web.Request) -> web.StreamResponse:
+        header = b"fLaC" if request.match_info["ext"] == "flac" else b"\0\0\0\x18ftyp"
+        return await self.send_payload(request, self.catalog.track_size, header)
+
+    async def cdn_track_segment(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["segment"] == "0":
+            init = flac_init_segment()
+            return await self.send_payload(request, len(init), init)
+
+        size = self.catalog.track_size // max(self.catalog.segments, 1)
+        header = flac_fragment_header(size)
+
+        return await self.send_payload(request, len(header) + size, header)
+
+    async def cdn_video_master(self, request: web.Request) -> web.StreamResponse:
+        video_id = request.match_info["id"]
+
+        return web.Response(
+            text=(
+                "#EXTM3U\n"
+                "#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080\n"
+                f"{self.cdn_url}/videos/{video_id}/playlist.m3u8\n"
+            ),
+            content_type="application/vnd.apple.mpegurl",
+        )
+
+    async def cdn_video_playlist(self, request: web.Request) -> web.StreamResponse:
+        video_id = request.match_info["id"]
+        segments = "".join(
+            f"#EXTINF:10.0,\n{self.cdn_url}/videos/{video_id}/{n}.ts\n"
+            for n in range(self.catalog.segments)
+        )
+
+        return web.Response(
+            text=(
+                "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n"
+                f"{segments}#EXT-X-ENDLIST\n"
+            ),
+            content_type="application/vnd.apple.mpegurl",
+        )
+
+    async def cdn_video_segment(self, request: web.Request) -> web.StreamResponse:
+        size = self.catalog.video_size // max(self.catalog.segments, 1)
+        # mpeg-ts packets start with the sync byte
+        size -= size % TS_PACKET_SIZE
+        return await self.send_payload(request, size, b"\x47")
@@ -0,0 +1,263 @@
+import asyncio
+import typer
+from fnmatch import fnmatch
+from logging import getLogger
+from urllib.parse import urlparse
+
+from requests_cache import SQLiteCache
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+from typing_extensions import Annotated
+
+from tiddl.cli.config import CONFIG
+from tiddl.cli.ctx import API_CACHE_NAME, ASYNC_API_CACHE_NAME, Context
+from tiddl.cli.commands.auth import refresh
+from tiddl.cli.utils.resource import TidalResource
+from tiddl.core.api import AsyncTidalAPI
+from tiddl.core.api.cache import (
+    CacheStats,
+    ResponseCache,
+    endpoint_family,
+    load_lookups,
+)
+
+console = Console()
+log = getLogger(__name__)
+
+cache_command = typer.Typer(
+    name="cache", help="Manage Tidal API cache.", no_args_is_help=True
+)
+
+
+def get_endpoint(url: str) -> str:
+    """Endpoint of the API `url`, e.g. `albums/123`."""
+
+    return urlparse(url).path.removeprefix(urlparse(CONFIG.api.url).path).strip("/")
+
+
+def open_response_cache() -> ResponseCache | None:
+    """Cache of the `AsyncTidalClient`, None when it was not created yet."""
+
+    if not ASYNC_API_CACHE_NAME.with_suffix(".sqlite").exists():
+        return None
+
+    return ResponseCache(ASYNC_API_CACHE_NAME)
+
+
+def open_requests_cache() -> SQLiteCache | None:
+    """Cache of the `TidalClient`, None when it was not created yet."""
+
+    if not API_CACHE_NAME.with_suffix(".sqlite").exists():
+        return None
+
+    return SQLiteCache(API_CACHE_NAME)
+
+
+def get_requests_cache_stats(cache: SQLiteCache) -> dict[str, CacheStats]:
+    stats: dict[str, CacheStats] = {}
+
+    for response in cache.responses.values():
+        family_stats = stats.setdefault(
+            endpoint_family(get_endpoint(response.url)), CacheStats()
+        )
+        family_stats.entries += 1
+        family_stats.size += len(response.content or b"")
+        family_stats.expired += response.is_expired
+
+    with cache.responses.connection(commit=True) as connection:
+        lookups = load_lookups(connection)
+
+    for family, hits, misses in lookups:
+        family_stats = stats.setdefault(family, CacheStats())
+        family_stats.hits = hits
+        family_stats.misses = misses
+
+    return stats
+
+
+@cache_command.command(help="Show cache usage by endpoint.")
+def stats():
+    table = Table(expand=True)
+    table.add_column("Cache", style="cyan")
+    table.add_column("Endpoint", style="green")
+    table.add_column("Entries", justify="right")
+    table.add_column("Expired", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Hit rate", justify="right", style="yellow")
+
+    stores: list[tuple[str, dict[str, CacheStats]]] = []
+
+    if response_cache := open_response_cache():
+        stores.append(("download", response_cache.stats()))
+        response_cache.close()
+
+    if requests_cache := open_requests_cache():
+        stores.append(("api", get_requests_cache_stats(requests_cache)))
+        requests_cache.close()
+
+    for store_name, store_stats in stores:
+        for family, family_stats in sorted(store_stats.items()):
+            hit_rate = family_stats.hit_rate
+
+            table.add_row(
+                store_name,
+                family,
+                str(family_stats.entries),
+                str(family_stats.expired),
+                decimal(family_stats.size),
+                "-" if hit_rate is None else f"{hit_rate:.0%}",
+            )
+
+    console.print(table)
+
+    for path in (
+        ASYNC_API_CACHE_NAME.with_suffix(".sqlite"),
+        API_CACHE_NAME.with_suffix(".sqlite"),
+    ):
+        if path.exists():
+            console.print(f"{path} [cyan]{decimal(path.stat().st_size)}")
+
+
+@cache_command.command(help="Delete expired responses and shrink the database.")
+def prune():
+    deleted = 0
+
+    if response_cache := open_response_cache():
+        deleted += response_cache.prune()
+        response_cache.vacuum()
+        response_cache.close()
+
+    if requests_cache := open_requests_cache():
+        count = len(requests_cache.responses)
+        requests_cache.delete(expired=True, vacuum=True)
+        deleted += count - len(requests_cache.responses)
+        requests_cache.close()
+
+    console.print(f"[green]Deleted {deleted} expired responses.")
+
+
+@cache_command.command(help="Delete cached responses of matching endpoints.")
+def purge(
+    PATTERN: Annotated[
+        str,
+        typer.Argument(
+            metavar="pattern",
+            help="Endpoint glob pattern, e.g. 'playlists/<uuid>*' or 'albums/*'.",
+        ),
+    ],
+):
+    deleted = 0
+
+    if response_cache := open_response_cache():
+        deleted += response_cache.purge(PATTERN)
+        response_cache.close()
+
+    if requests_cache := open_requests_cache():
+        keys = [
+            key
+            for key, response in requests_cache.responses.items()
+            if fnmatch(get_endpoint(response.url), PATTERN)
+        ]
+        requests_cache.delete(*keys)
+        deleted += len(keys)
+        requests_cache.close()
+
+    console.print(f"[green]Deleted {deleted} responses matching '{PATTERN}'.")
+
+
+async def warm_resource(api: AsyncTidalAPI, resource: TidalResource):
+    """Fetch metadata the download command needs for `resource`."""
+
+    async def warm_album(album_id: int | str):
+        await api.get_album(album_id)
+
+        async for _ in api.iter_album_items_credits(album_id):
+            pass
+
+    async def warm_items_albums(album_ids: set[int]):
+        await asyncio.gather(*(api.get_album(album_id) for album_id in album_ids))
+
+    match resource.type:
+        case "track":
+            track = await api.get_track(resource.id)
+            await api.get_album(track.album.id)
+
+        case "video":
+            video = await api.get_video(resource.id)
+
+            if video.album and video.album.id is not None:
+                await api.get_album(video.album.id)
+
+        case "album":
+            await warm_album(resource.id)
+
+        case "artist":
+            await api.get_artist(resource.id)
+
+            album_ids = [
+                album.id
+                for filter in ("ALBUMS", "EPSANDSINGLES")
+                async for album in api.iter_artist_albums(resource.id, filter)
+            ]
+
+            await asyncio.gather(*(warm_album(album_id) for album_id in album_ids))
+
+        case "playlist":
+            await api.get_playlist(resource.id)
+            await warm_items_albums(
+                {
+                    playlist_item.item.album.id
+                    async for playlist_item in api.iter_playlist_items(resource.id)
+                    if playlist_item.item.album and playlist_item.item.album.id
+                }
+            )
+
+        case "mix":
+            await warm_items_albums(
+                {
+                    mix_item.item.album.id
+                    async for mix_item in api.iter_mix_items(resource.id)
+                }
+            )
+
+
+@cache_command.command(
+    no_args_is_help=True, help="Fetch metadata of resources into cache."
+)
+def warm(
+    ctx: Context,
+    RESOURCES: Annotated[
+        list[TidalResource],
+        typer.Argument(
+            metavar="resources",
+            parser=TidalResource.from_string,
+            help="Tidal URLs or `resource_type/resource_id`, e.g. album/67890.",
+        ),
+    ],
+):
+    ctx.invoke(refresh, EARLY_EXPIRE_TIME=600)
+
+    api = ctx.obj.async_api
+
+    async def warm_resources():
+        async def wrapper(resource: TidalResource):
+            try:
+                await warm_resource(api, resource)
+                console.print(f"[green]Warmed[/] {resource}")
+            except Exception as e:
+                log.error(f"{resource=} {e=}")
+                console.print(f"[red]Error:[/] {e} ({resource})")
+
+        try:
+            await asyncio.gather(*(wrapper(resource) for resource in RESOURCES))
+        finally:
+            await api.client.close()
+
+    with console.status("Warming cache..."):
+        asyncio.run(warm_resources())
+
+    console.print(
+        f"[cyan]API requests: {api.client.stats.requests}, "
+        f"coalesced: {api.client.stats.coalesced}"
+    )
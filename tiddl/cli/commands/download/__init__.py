@@ -6,6 +6,7 @@ from pathlib import Path
 from logging import getLogger
 from rich.live import Live
 
+from typing import Any, Awaitable
 from typing_extensions import Annotated
 
 from tiddl.core.metadata import add_track_metadata, add_video_metadata, Cover
@@ -21,6 +22,7 @@ from tiddl.cli.config import (
     VALID_M3U_RESOURCE_LITERAL,
     VIDEOS_FILTER_LITERAL,
     ATMOS_FILTER_LITERAL,
+    SCHEDULE_LITERAL,
 )
 from tiddl.cli.utils.resource import TidalResource
 from tiddl.cli.ctx import Context
@@ -30,6 +32,7 @@ from tiddl.cli.commands.subcommands import register_subcommands
 
 from .downloader import Downloader
 from .output import RichOutput
+from .work_queue import WorkQueue, schedule_key, settle_queued
 
 download_command = typer.Typer(name="download")
 register_subcommands(download_command)
@@ -135,6 +138,14 @@ def download_callback(
             help="Dolby Atmos filter, 'none' to exclude, 'allow' to include, 'only' to download only Dolby Atmos, if available.",
         ),
     ] = CONFIG.download.atmos_filter,
+    SCHEDULE: Annotated[
+        SCHEDULE_LITERAL,
+        typer.Option(
+            "--schedule",
+            "-sch",
+            help="Order of queued downloads, 'fifo' as found, 'album' to complete resources and their albums in order, 'shortest' for shortest items first.",
+        ),
+    ] = CONFIG.download.schedule,
 ):
     """
     Download Tidal resources.
@@ -161,7 +172,7 @@ def download_callback(
     def save_m3u(
         resource_type: VALID_M3U_RESOURCE_LITERAL,
         filename: str,
-        tracks_with_path: list[tuple[Path, Track]],
+        tracks_with_path: list[tuple[Path | None, Track | Video]],
     ):
         if not CONFIG.m3u.save:
             return
@@ -204,10 +215,11 @@ def download_callback(
         return predict_item_quality().upper()
 
     async def download_resources():
+        api = ctx.obj.async_api
         rich_output = RichOutput(ctx.obj.console)
 
         downloader = Downloader(
-            tidal_api=ctx.obj.api,
+            tidal_api=api,
             threads_count=THREADS_COUNT,
             rich_output=rich_output,
             track_quality=TRACK_QUALITY,
@@ -218,6 +230,20 @@ def download_callback(
             scan_path=SCAN_PATH,
             match_existing_path_case=CONFIG.download.match_existing_path_case,
             dolby_atmos_filter=DOLBY_ATMOS_FILTER,
+            connections_per_host=CONFIG.download.connections_per_host,
+            keepalive_timeout=CONFIG.download.keepalive_timeout,
+            dns_cache_ttl=CONFIG.download.dns_cache_ttl,
+            connect_timeout=CONFIG.download.connect_timeout,
+            read_timeout=CONFIG.download.read_timeout,
+            segment_concurrency=CONFIG.download.segment_concurrency,
+            range_connections=CONFIG.download.range_connections,
+            pipe_to_ffmpeg=CONFIG.download.pipe_to_ffmpeg,
+            postprocess_workers=CONFIG.download.postprocess_workers,
+            stream_workers=CONFIG.download.stream_workers,
+            tagging_workers=CONFIG.download.tagging_workers,
+            queue_size=CONFIG.download.queue_size,
+            prefetch_window=CONFIG.download.prefetch_window,
+            stream_max_age=CONFIG.download.stream_max_age,
         )
 
         class Metadata:
@@ -235,7 +261,7 @@ def download_callback(
                 self.cover = cover
                 self.album_review = album_review
 
-        async def handle_resource(resource: TidalResource):
+        async def handle_resource(resource: TidalResource, resource_index: int):
             async def handle_item(
                 item: Track | Video,
                 file_path: str,
@@ -244,73 +270,129 @@ def download_callback(
                 log.debug(f"{item.id=}, {file_path=}")
                 rich_output.total_increment()
 
-                if not track_metadata:
-                    track_metadata = Metadata()
+                metadata = track_metadata or Metadata()
+
+                def write_track_metadata(path: Path, track: Track, lyrics: str):
+                    if metadata.cover and metadata.cover.data is None:
+                        metadata.cover.fetch_data()
+
+                    write_lrc_file(track, lyrics, path)
+
+                    add_track_metadata(
+                        path=path,
+                        track=track,
+                        lyrics=lyrics,
+                        album_artist=metadata.artist,
+                        cover_data=metadata.cover.data if metadata.cover else None,
+                        date=metadata.date,
+                        credits_contributors=metadata.credits,
+                        comment=metadata.album_review,
+                    )
+
+                async def tag(path: Path, was_downloaded: bool):
+                    # rewrite metadata when track was skipped due to already existing
+                    if CONFIG.metadata.enable and (REWRITE_METADATA or was_downloaded):
+                        if isinstance(item, Track):
+                            lyrics_subtitles = ""
+
+                            if CONFIG.metadata.lyrics or CONFIG.download.write_lrc_file:
+                                try:
+                                    lyrics = await api.get_track_lyrics(item.id)
+                                    lyrics_subtitles = lyrics.subtitles
+                                except Exception as e:
+                                    log.error(e)
+
+                            if (
+                                not metadata.cover
+                                and item.album.cover
+                                and CONFIG.metadata.cover
+                            ):
+                                metadata.cover = Cover(item.album.cover)
+
+                            # cover fetching and file writes don't block the event loop
+                            await asyncio.to_thread(
+                                write_track_metadata, path, item, lyrics_subtitles
+                            )
+
+                        elif isinstance(item, Video):
+                            await asyncio.to_thread(
+                                add_video_metadata, path=path, video=item
+                            )
+
+                    if CONFIG.download.update_mtime:
+                        try:
+                            os.utime(path, None)
+                        except Exception:
+                            log.warning(f"could not update mtime for {path}")
 
                 download_path, was_downloaded = await downloader.download(
-                    item=item, file_path=Path(file_path)
+                    item=item, file_path=Path(file_path), tag=tag
                 )
 
                 log.debug(f"{download_path=}, {was_downloaded=}")
 
-                if (
-                    CONFIG.metadata.enable
-                    and download_path
-                    # rewrite metadata when track was skipped due to already existing
-                    and (REWRITE_METADATA or was_downloaded)
+                return download_path, item
+
+            async def queue_item(
+                item: Track | Video,
+                file_path: str,
+                track_metadata: Metadata | None = None,
+            ) -> asyncio.Future[tuple[Path | None, Track | Video]]:
+                """Queue download of `item`, waits while the work queue is full."""
+
+                done = asyncio.get_running_loop().create_future()
+
+                # filtered items don't take a slot of the work queue
+                if downloader.skip(item, Path(file_path)):
+                    done.set_result((None, item))
+                    return done
+
+                # existing files without metadata to rewrite need no worker,
+                # at most their mtime is updated in the tagging stage
+                if not (CONFIG.metadata.enable and REWRITE_METADATA) and (
+                    downloader.find_existing(item, Path(file_path))
                 ):
-                    if isinstance(item, Track):
-                        lyrics_subtitles = ""
+                    done.set_result(await handle_item(item, file_path, track_metadata))
+                    return done
 
-                        if CONFIG.metadata.lyrics or CONFIG.download.write_lrc_file:
-                            try:
-                                lyrics_subtitles = ctx.obj.api.get_track_lyrics(
-                                    item.id
-                                ).subtitles
-                            except Exception as e:
-                                log.error(e)
+                return await work_queue.submit(
+                    lambda: handle_item(item, file_path, track_metadata),
+                    key=schedule_key(SCHEDULE, item),
+                    lane=resource_index,
+                )
 
-                        if (
-                            not track_metadata.cover
-                            and item.album.cover
-                            and CONFIG.metadata.cover
-                        ):
-                            track_metadata.cover = Cover(item.album.cover)
-
-                        if track_metadata.cover and track_metadata.cover.data is None:
-                            track_metadata.cover.fetch_data()
-
-                        write_lrc_file(item, lyrics_subtitles, download_path)
-
-                        add_track_metadata(
-                            path=download_path,
-                            track=item,
-                            lyrics=lyrics_subtitles,
-                            album_artist=track_metadata.artist,
-                            cover_data=(
-                                track_metadata.cover.data
-                                if track_metadata.cover
-                                else None
-                            ),
-                            date=track_metadata.date,
-                            credits_contributors=track_metadata.credits,
-                            comment=track_metadata.album_review,
-                        )
+            async def finish_album(
+                album: Album,
+                futures: list[asyncio.Future[tuple[Path | None, Track | Video]]],
+                cover: Cover | None,
+            ):
+                tracks_with_path = await asyncio.gather(*futures)
 
-                    elif isinstance(item, Video):
-                        add_video_metadata(path=download_path, video=item)
+                save_m3u(
+                    resource_type="album",
+                    filename=format_template(
+                        CONFIG.m3u.templates.album,
+                        album=album,
+                        type="album",
+                    ),
+                    tracks_with_path=tracks_with_path,
+                )
 
-                if download_path and CONFIG.download.update_mtime:
-                    try:
-                        os.utime(download_path, None)
-                    except Exception:
-                        log.warning(f"could not update mtime for {download_path}")
+                if cover:
+                    cover.save_to_directory(
+                        path=DOWNLOAD_PATH
+                        / format_template(
+                            template=CONFIG.cover.templates.album, album=album
+                        )
+                    )
 
-                return download_path, item
+            async def download_album(album: Album) -> asyncio.Task[None]:
+                """
+                Queue tracks of `album`, returns task which saves
+                its m3u and cover when the tracks are downloaded.
+                """
 
-            async def download_album(album: Album):
-                offset = 0
-                futures = []
+                futures: list[asyncio.Future[tuple[Path | None, Track | Video]]] = []
 
                 cover: Cover | None = None
                 save_cover = ("album" in CONFIG.cover.allowed) and CONFIG.cover.save
@@ -322,18 +404,13 @@ def download_callback(
 
                 if CONFIG.metadata.album_review:
                     try:
-                        album_review = ctx.obj.api.get_album_review(
-                            album_id=resource.id
-                        ).normalized_text()
+                        review = await api.get_album_review(album_id=resource.id)
+                        album_review = review.normalized_text()
                     except Exception as e:
                         log.error(e)
 
-                while True:
-                    album_items = ctx.obj.api.get_album_items_credits(
-                        album_id=album.id, offset=offset
-                    )
-
-                    for album_item in album_items.items:
+                async with settle_queued(futures):
+                    async for album_item in api.iter_album_items_credits(album.id):
                         try:
                             template = TEMPLATE or CONFIG.templates.album
                             file_path = format_template(
@@ -352,7 +429,7 @@ def download_callback(
 
                         try:
                             futures.append(
-                                handle_item(
+                                await queue_item(
                                     item=album_item.item,
                                     file_path=file_path,
                                     track_metadata=Metadata(
@@ -383,30 +460,10 @@ def download_callback(
                             if RAISE_ERRORS:
                                 raise
 
-                    offset += album_items.limit
-                    if offset >= album_items.totalNumberOfItems:
-                        break
-
-                tracks_with_path = await asyncio.gather(*futures)
-
-                save_m3u(
-                    resource_type="album",
-                    filename=format_template(
-                        CONFIG.m3u.templates.album,
-                        album=album,
-                        type="album",
-                    ),
-                    tracks_with_path=tracks_with_path,
+                return asyncio.create_task(
+                    finish_album(album, futures, cover if save_cover else None)
                 )
 
-                if save_cover and cover:
-                    cover.save_to_directory(
-                        path=DOWNLOAD_PATH
-                        / format_template(
-                            template=CONFIG.cover.templates.album, album=album
-                        )
-                    )
-
             # resources should be collected from a distinct function
             # that would yield the resources.
             # then we would be able to reuse the logic in the export command
@@ -414,8 +471,8 @@ def download_callback(
             match resource.type:
 
                 case "track":
-                    track = ctx.obj.api.get_track(resource.id)
-                    album = ctx.obj.api.get_album(track.album.id)
+                    track = await api.get_track(resource.id)
+                    album = await api.get_album(track.album.id)
 
                     cover: Cover | None = None
                     save_cover = ("track" in CONFIG.cover.allowed) and CONFIG.cover.save
@@ -423,7 +480,7 @@ def download_callback(
                     if album.cover and (CONFIG.metadata.cover or save_cover):
                         cover = Cover(album.cover, size=CONFIG.cover.size)
 
-                    await handle_item(
+                    download = await queue_item(
                         item=track,
                         file_path=format_template(
                             template=TEMPLATE or CONFIG.templates.track,
@@ -438,6 +495,7 @@ def download_callback(
                             # credits are missing
                         ),
                     )
+                    await download
 
                     if (
                         CONFIG.cover.save
@@ -454,7 +512,7 @@ def download_callback(
                         )
 
                 case "video":
-                    video = ctx.obj.api.get_video(resource.id)
+                    video = await api.get_video(resource.id)
                     template = TEMPLATE or CONFIG.templates.video
 
                     if (
@@ -462,11 +520,11 @@ def download_callback(
                         and video.album
                         and video.album.id is not None
                     ):
-                        album = ctx.obj.api.get_album(video.album.id)
+                        album = await api.get_album(video.album.id)
                     else:
                         album = None
 
-                    await handle_item(
+                    download = await queue_item(
                         item=video,
                         file_path=format_template(
                             template=template,
@@ -475,27 +533,23 @@ def download_callback(
                             quality=get_item_quality(video),
                         ),
                     )
+                    await download
 
                 case "mix":
-                    offset = 0
                     futures = []
 
-                    while True:
-                        mix_items = ctx.obj.api.get_mix_items(resource.id, offset=0)
-
-                        for mix_item in mix_items.items:
+                    async with settle_queued(futures):
+                        async for mix_item in api.iter_mix_items(resource.id):
                             template = TEMPLATE or CONFIG.templates.mix
 
                             try:
                                 if "{album" in template:
-                                    album = ctx.obj.api.get_album(
-                                        mix_item.item.album.id
-                                    )
+                                    album = await api.get_album(mix_item.item.album.id)
                                 else:
                                     album = None
 
                                 futures.append(
-                                    handle_item(
+                                    await queue_item(
                                         item=mix_item.item,
                                         file_path=format_template(
                                             template=template,
@@ -523,10 +577,6 @@ def download_callback(
                                 if RAISE_ERRORS:
                                     raise
 
-                        offset += mix_items.limit
-                        if offset >= mix_items.totalNumberOfItems:
-                            break
-
                     tracks_with_path = await asyncio.gather(*futures)
 
                     save_m3u(
@@ -540,15 +590,18 @@ def download_callback(
                     )
 
                 case "album":
-                    album = ctx.obj.api.get_album(album_id=resource.id)
-                    await download_album(album)
+                    album = await api.get_album(album_id=resource.id)
+                    finish = await download_album(album)
+                    await finish
 
                 case "artist":
                     futures = []
 
-                    async def safe_download_album(album: Album):
+                    async def safe_download_album(
+                        album: Album, download: Awaitable[Any]
+                    ):
                         try:
-                            await download_album(album)
+                            return await download
                         except ApiError as e:
                             ctx.obj.console.print(
                                 f"[red]API Error:[/] {e} (Album: {album.title}, ID: {album.id})"
@@ -562,106 +615,86 @@ def download_callback(
                             if RAISE_ERRORS:
                                 raise
 
-                    def get_all_albums(singles: bool):
-                        offset = 0
-
-                        while True:
-                            artist_albums = ctx.obj.api.get_artist_albums(
-                                artist_id=resource.id,
-                                offset=offset,
-                                filter="EPSANDSINGLES" if singles else "ALBUMS",
+                    async def get_all_albums(singles: bool):
+                        async for album in api.iter_artist_albums(
+                            resource.id, filter="EPSANDSINGLES" if singles else "ALBUMS"
+                        ):
+                            # tracks of the next album are queued
+                            # while this one finishes in the background
+                            task = await safe_download_album(
+                                album, download_album(album)
                             )
 
-                            for album in artist_albums.items:
-                                futures.append(safe_download_album(album))
-
-                            offset += artist_albums.limit
-                            if offset >= artist_albums.totalNumberOfItems:
-                                break
+                            if task:
+                                futures.append(safe_download_album(album, task))
 
-                    def get_all_videos():
-                        offset = 0
-
-                        while True:
-                            artist_videos = ctx.obj.api.get_artist_videos(
-                                resource.id, offset=offset
-                            )
+                    async def get_all_videos():
+                        async for video in api.iter_artist_videos(resource.id):
+                            template = TEMPLATE or CONFIG.templates.video
 
-                            for video in artist_videos.items:
-                                template = TEMPLATE or CONFIG.templates.video
-
-                                try:
-                                    if "{album" in template and video.album:
-                                        album = ctx.obj.api.get_album(video.album.id)
-                                    else:
-                                        album = None
+                            try:
+                                if "{album" in template and video.album:
+                                    album = await api.get_album(video.album.id)
+                                else:
+                                    album = None
 
-                                    futures.append(
-                                        handle_item(
+                                futures.append(
+                                    await queue_item(
+                                        item=video,
+                                        file_path=format_template(
+                                            template=template,
                                             item=video,
-                                            file_path=format_template(
-                                                template=template,
-                                                item=video,
-                                                album=album,
-                                                quality=get_item_quality(video),
-                                            ),
-                                        )
-                                    )
-                                except ApiError as e:
-                                    ctx.obj.console.print(
-                                        f"[red]API Error:[/] {e} (Video: {video.title}, ID: {video.id})"
-                                    )
-                                    if RAISE_ERRORS:
-                                        raise
-                                except Exception as e:
-                                    ctx.obj.console.print(
-                                        f"[red]Error:[/] {e} (Video: {video.title}, ID: {video.id})"
+                                            album=album,
+                                            quality=get_item_quality(video),
+                                        ),
                                     )
-                                    if RAISE_ERRORS:
-                                        raise
-
-                            if offset > artist_videos.totalNumberOfItems:
-                                break
-
-                            offset += artist_videos.limit
+                                )
+                            except ApiError as e:
+                                ctx.obj.console.print(
+                                    f"[red]API Error:[/] {e} (Video: {video.title}, ID: {video.id})"
+                                )
+                                if RAISE_ERRORS:
+                                    raise
+                            except Exception as e:
+                                ctx.obj.console.print(
+                                    f"[red]Error:[/] {e} (Video: {video.title}, ID: {video.id})"
+                                )
+                                if RAISE_ERRORS:
+                                    raise
 
-                    if VIDEOS_FILTER != "none":
-                        get_all_videos()
+                    async with settle_queued(futures):
+                        if VIDEOS_FILTER != "none":
+                            await get_all_videos()
 
-                    if VIDEOS_FILTER != "only":
-                        if SINGLES_FILTER == "include":
-                            get_all_albums(False)
-                            get_all_albums(True)
-                        else:
-                            get_all_albums(SINGLES_FILTER == "only")
+                        if VIDEOS_FILTER != "only":
+                            if SINGLES_FILTER == "include":
+                                await get_all_albums(False)
+                                await get_all_albums(True)
+                            else:
+                                await get_all_albums(SINGLES_FILTER == "only")
 
                     await asyncio.gather(*futures)
 
                 case "playlist":
-                    offset = 0
                     futures = []
                     playlist_index = 0
-                    playlist = ctx.obj.api.get_playlist(playlist_uuid=resource.id)
+                    playlist = await api.get_playlist(playlist_uuid=resource.id)
 
-                    while True:
-                        playlist_items = ctx.obj.api.get_playlist_items(
-                            playlist_uuid=resource.id, offset=offset
-                        )
-
-                        for playlist_item in playlist_items.items:
+                    async with settle_queued(futures):
+                        async for playlist_item in api.iter_playlist_items(resource.id):
                             playlist_index += 1
                             template = TEMPLATE or CONFIG.templates.playlist
 
                             try:
                                 if "{album" in template:
-                                    album = ctx.obj.api.get_album(
+                                    album = await api.get_album(
                                         playlist_item.item.album.id
                                     )
                                 else:
                                     album = None
 
                                 futures.append(
-                                    handle_item(
+                                    await queue_item(
                                         item=playlist_item.item,
                                         file_path=format_template(
                                             template=template,
@@ -695,10 +728,6 @@ def download_callback(
                                 if RAISE_ERRORS:
                                     raise
 
-                        offset += playlist_items.limit
-                        if offset >= playlist_items.totalNumberOfItems:
-                            break
-
                     tracks_with_path = await asyncio.gather(*futures)
 
                     save_m3u(
@@ -726,6 +755,14 @@ def download_callback(
                             )
                         )
 
+        # the pool keeps every stage and queue of the pipeline busy,
+        # the schedule picks the next item from a wider window
+        work_queue = WorkQueue(
+            workers=downloader.pipeline.capacity,
+            size=max(CONFIG.download.schedule_window, downloader.pipeline.capacity),
+            lane_workers=CONFIG.download.resource_workers,
+        )
+
         with Live(
             rich_output.group,
             refresh_per_second=10,
@@ -733,9 +770,16 @@ def download_callback(
             transient=True,
         ):
 
-            async def wrapper(r: TidalResource):
+            async def wrapper(r: TidalResource, index: int):
+                work_queue.add_lane(
+                    index,
+                    weight=CONFIG.download.resource_weights.get(r.type, 1),
+                    # resources are completed in the order they were given
+                    priority=index if SCHEDULE == "album" else 0,
+                )
+
                 try:
-                    await handle_resource(r)
+                    await handle_resource(r, index)
                 except ApiError as e:
                     ctx.obj.console.print(f"[red]API Error:[/] {e} ({r})")
                     if RAISE_ERRORS:
@@ -745,10 +789,49 @@ def download_callback(
                     if RAISE_ERRORS:
                         raise
 
-            await asyncio.gather(*(wrapper(r) for r in ctx.obj.resources))
+            try:
+                async with downloader, work_queue:
+                    await asyncio.gather(
+                        *(
+                            wrapper(r, index)
+                            for index, r in enumerate(ctx.obj.resources)
+                        )
+                    )
+            finally:
+                await api.client.close()
 
         rich_output.show_stats()
 
+        log.debug(f"pipeline: {downloader.pipeline}")
+
+        postprocess_stats = downloader.postprocess_stats
+        log.debug(f"{postprocess_stats=}")
+
+        if str(postprocess_stats):
+            ctx.obj.console.print(f"[gray]Post-processing: {postprocess_stats}")
+
+        filter_stats = downloader.filter_stats
+        log.debug(f"{filter_stats=}")
+
+        if str(filter_stats):
+            ctx.obj.console.print(
+                f"[gray]Skipped before stream request: {filter_stats} "
+                f"({filter_stats.avoided_requests} stream requests avoided)"
+            )
+
+        api_stats = api.client.stats
+        model_cache = api.client.model_cache
+        log.debug(
+            f"{api_stats=}, model cache hits={model_cache.hits} "
+            f"misses={model_cache.misses} rate={model_cache.hit_rate:.0%}"
+        )
+
+        if api_stats.throttled or api_stats.retried:
+            ctx.obj.console.print(
+                f"[yellow]API requests: {api_stats.requests}, "
+                f"throttled: {api_stats.throttled}, retried: {api_stats.retried}"
+            )
+
     def run():
         asyncio.run(download_resources())
 
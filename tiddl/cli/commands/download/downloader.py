@@ -1,31 +1,65 @@
 import asyncio
-import shutil
+from dataclasses import dataclass
 from logging import getLogger
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+from time import time
+from typing import AsyncIterator, Awaitable, Callable
 
 import aiofiles
 import aiohttp
+from rich.progress import TaskID
 
 from tiddl.cli.config import VIDEOS_FILTER_LITERAL, ATMOS_FILTER_LITERAL
 from tiddl.cli.utils.download import get_existing_track_filename
 from tiddl.cli.utils.path import resolve_existing_path_case
-from tiddl.core.api import ApiError, TidalAPI
+from tiddl.core.api import ApiError, AsyncTidalAPI
 from tiddl.core.api.models import StreamVideoQuality, Track, TrackQuality, Video
-from tiddl.core.utils import parse_track_stream, parse_video_stream
+from tiddl.core.utils import parse_track_manifest
+from tiddl.core.utils.parse import parse_url_expiry
 from tiddl.core.utils.const import (
     TRACK_QUALITY_LITERAL,
     VIDEO_QUALITY_LITERAL,
     track_qualities,
     video_qualities,
 )
-from tiddl.core.utils.ffmpeg import convert_to_mp4, extract_flac
+from tiddl.core.utils.ffmpeg import (
+    FFmpegError,
+    convert_to_mp4,
+    finalize_flac,
+    is_ffmpeg_installed,
+    remux_stream,
+)
+from tiddl.core.utils.journal import (
+    PARTIAL_SUFFIX,
+    Journal,
+    remove_stale_partials,
+)
+from tiddl.core.utils.transfer import (
+    RANGE_CONNECTIONS,
+    SEGMENT_CONCURRENCY,
+    fetch_file,
+    fetch_segments,
+    iter_file,
+    resolve_video_stream,
+)
 
+from .filters import SKIP_REASON_LITERAL, FilterStats, get_skip_reason
 from .output import RichOutput
+from .pipeline import QUEUE_SIZE, Pipeline, Stage
 
 log = getLogger(__name__)
 
-CHUNK_SIZE = 1024**2
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 60
+STREAM_WORKERS = 4
+POSTPROCESS_WORKERS = 2
+TAGGING_WORKERS = 2
+PREFETCH_WINDOW = 4
+STREAM_MAX_AGE = 600
+# stream urls must stay valid for the whole transfer
+STREAM_EXPIRY_MARGIN = 60
 
 track_qualities_color: dict[TrackQuality, str] = {
     "LOW": "[gray]96 kbps",
@@ -41,10 +75,60 @@ video_qualities_color: dict[StreamVideoQuality, str] = {
 }
 
 
+@dataclass(slots=True)
+class PostprocessStats:
+    """How downloaded files were finished, see `finalize_flac`."""
+
+    native: int = 0
+    demuxed: int = 0
+    ffmpeg: int = 0
+    renamed: int = 0
+    videos: int = 0
+    piped: int = 0
+    failed: int = 0
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name}: {getattr(self, name)}"
+            for name in self.__slots__  # type: ignore
+            if getattr(self, name)
+        )
+
+
+@dataclass(slots=True)
+class ResolvedStream:
+    """Parsed stream of an item, ready to be transferred."""
+
+    urls: list[str]
+    quality: str
+    quality_string: str
+    download_path: Path
+    expires_at: float
+    codecs: str | None = None
+    should_extract_flac: bool = False
+    piped: bool = False
+
+    @property
+    def expired(self) -> bool:
+        return time() > self.expires_at - STREAM_EXPIRY_MARGIN
+
+
 class Downloader:
-    api: TidalAPI
+    """
+    Downloads tracks and videos with one aiohttp session,
+    use it as async context manager to open and close the session.
+
+    Items pass the resolve, transfer, postprocess and tag stages
+    of the `pipeline`, each stage has its own number of workers.
+    Streams of up to `prefetch_window` items are resolved,
+    or being resolved, while they wait for a transfer slot.
+    """
+
+    api: AsyncTidalAPI
     rich_output: RichOutput
-    semaphore: asyncio.Semaphore
+    pipeline: Pipeline
+    postprocess_stats: PostprocessStats
+    filter_stats: FilterStats
     track_quality: TrackQuality
     video_quality: StreamVideoQuality
     videos_filter: VIDEOS_FILTER_LITERAL
@@ -53,10 +137,12 @@ class Downloader:
     scan_path: Path
     match_existing_path_case: bool
     dolby_atmos_filter: ATMOS_FILTER_LITERAL
+    _session: aiohttp.ClientSession | None
+    _swept_directories: set[Path]
 
     def __init__(
         self,
-        tidal_api: TidalAPI,
+        tidal_api: AsyncTidalAPI,
         threads_count: int,
         rich_output: RichOutput,
         track_quality: TRACK_QUALITY_LITERAL,
@@ -67,10 +153,32 @@ class Downloader:
         scan_path: Path,
         match_existing_path_case: bool = False,
         dolby_atmos_filter: ATMOS_FILTER_LITERAL = "none",
+        connections_per_host: int = 0,
+        keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+        dns_cache_ttl: int = DNS_CACHE_TTL,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        segment_concurrency: int = SEGMENT_CONCURRENCY,
+        range_connections: int = RANGE_CONNECTIONS,
+        pipe_to_ffmpeg: bool = False,
+        postprocess_workers: int = POSTPROCESS_WORKERS,
+        stream_workers: int = STREAM_WORKERS,
+        tagging_workers: int = TAGGING_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+        prefetch_window: int = PREFETCH_WINDOW,
+        stream_max_age: float = STREAM_MAX_AGE,
     ) -> None:
         self.api = tidal_api
         self.rich_output = rich_output
-        self.semaphore = asyncio.Semaphore(threads_count)
+        self.pipeline = Pipeline(
+            # streams are resolved only with room in the transfer queue
+            Stage("resolve", stream_workers, queue_size, reserve="transfer"),
+            Stage("transfer", threads_count, prefetch_window),
+            Stage("postprocess", postprocess_workers, queue_size),
+            Stage("tag", tagging_workers, queue_size),
+        )
+        self.postprocess_stats = PostprocessStats()
+        self.filter_stats = FilterStats()
         self.track_quality = track_qualities[track_quality]
         self.video_quality = video_qualities[video_quality]
         self.videos_filter = videos_filter
@@ -79,6 +187,247 @@ class Downloader:
         self.scan_path = scan_path
         self.match_existing_path_case = match_existing_path_case
         self.dolby_atmos_filter = dolby_atmos_filter
+        # every transfer may hold its range or segment connections at once,
+        # 0 derives the limit from that so no transfer waits for another
+        self.connections_per_host = connections_per_host or (
+            threads_count * max(range_connections, segment_concurrency)
+        )
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.segment_concurrency = segment_concurrency
+        self.range_connections = range_connections
+        self.pipe_to_ffmpeg = pipe_to_ffmpeg and is_ffmpeg_installed()
+        self.stream_max_age = stream_max_age
+        self._session = None
+        self._swept_directories = set()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.connections_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=self.connect_timeout,
+                    sock_read=self.read_timeout,
+                ),
+                trust_env=True,
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def write_stream(
+        self, urls: list[str], file: Path, task_id: TaskID, journal: Journal
+    ) -> None:
+        """
+        Write data at `urls` to `file`.
+        Single file is split into byte ranges fetched over several
+        connections, segmented streams are fetched concurrently
+        and written in order.
+        Progress is committed to the `journal` so the next run can resume.
+        """
+
+        def advance(size: int):
+            self.rich_output.download_advance(task_id, size=size)
+
+        if len(urls) == 1:
+            await fetch_file(
+                self.session,
+                urls[0],
+                file,
+                connections=self.range_connections,
+                on_progress=advance,
+                journal=journal,
+            )
+            return
+
+        segment = journal.data.segment
+        committed = journal.data.committed
+
+        async with aiofiles.open(file, "r+b" if segment else "wb") as f:
+            if segment:
+                log.debug(f"resuming '{file}' from segment {segment}")
+                await f.truncate(committed)
+                await f.seek(committed)
+
+            async for data in fetch_segments(
+                self.session, urls[segment:], self.segment_concurrency
+            ):
+                await f.write(data)
+                await f.flush()
+                advance(len(data))
+
+                segment += 1
+                committed += len(data)
+                journal.commit_segment(segment, committed)
+
+    async def write_file(
+        self,
+        item_id: int,
+        quality: str,
+        urls: list[str],
+        download_path: Path,
+        task_id: TaskID,
+    ) -> Path:
+        """
+        Download data at `urls` to partial file next to `download_path`,
+        resuming its previous download, and move it to `download_path`.
+        """
+
+        if download_path.parent not in self._swept_directories:
+            self._swept_directories.add(download_path.parent)
+            remove_stale_partials(download_path.parent)
+
+        journal = Journal(
+            file=download_path.with_name(download_path.name + PARTIAL_SUFFIX),
+            item_id=item_id,
+            quality=quality,
+            urls=len(urls),
+        )
+
+        try:
+            await self.write_stream(urls, journal.file, task_id, journal)
+        except BaseException:
+            if journal.resumable:
+                journal.save()
+            else:
+                journal.remove()
+
+            raise
+
+        journal.file.replace(download_path)
+        journal.path.unlink(missing_ok=True)
+
+        try:
+            download_path.chmod(0o644)
+        except OSError:
+            pass
+
+        return download_path
+
+    async def iter_stream(
+        self, urls: list[str], task_id: TaskID
+    ) -> AsyncIterator[bytes]:
+        """Yield data at `urls` in order, used to pipe it into ffmpeg."""
+
+        if len(urls) == 1:
+            chunks = iter_file(self.session, urls[0], self.range_connections)
+        else:
+            chunks = fetch_segments(self.session, urls, self.segment_concurrency)
+
+        async for chunk in chunks:
+            self.rich_output.download_advance(task_id, size=len(chunk))
+            yield chunk
+
+    async def postprocess(
+        self, item: Track | Video, download_path: Path, should_extract_flac: bool
+    ) -> Path:
+        """Finish FLAC of track or convert video to MP4 in a worker thread."""
+
+        if not (isinstance(item, Track) and should_extract_flac) and not isinstance(
+            item, Video
+        ):
+            return download_path
+
+        stats = self.postprocess_stats
+
+        try:
+            if isinstance(item, Video):
+                path = await asyncio.to_thread(convert_to_mp4, download_path)
+                stats.videos += 1
+                return path
+
+            path, action = await asyncio.to_thread(finalize_flac, download_path)
+            setattr(stats, action, getattr(stats, action) + 1)
+            log.debug(f"{item.id=} {action=}")
+            return path
+        except Exception as exc:
+            stats.failed += 1
+            log.error(f"{should_extract_flac=}, {exc=}")
+
+        return download_path
+
+    def show_skipped(self, item: Track | Video, reason: SKIP_REASON_LITERAL) -> None:
+        match reason:
+            case "streaming":
+                self.rich_output.console.print(
+                    f"[red]Can't stream[/] {item.title} ({item.id})"
+                )
+            case "videos":
+                self.rich_output.console.print(
+                    f"Skipping '{item.title}' due to video filter set to '{self.videos_filter}'"
+                )
+            case "atmos":
+                self.rich_output.console.print(
+                    f"[blue]Skipping[/] [gray]{item.title}[/] [blue]due to Dolby Atmos filter[/] {self.dolby_atmos_filter}"
+                )
+
+    def skip(self, item: Track | Video, file_path: Path) -> bool:
+        """
+        Evaluate filters of `item` on its catalog data,
+        skipped items never request their stream nor take a slot.
+        """
+
+        reason = get_skip_reason(item, self.videos_filter, self.dolby_atmos_filter)
+
+        if reason is None:
+            return False
+
+        log.debug(f"skipping {item.id} due to {reason} filter")
+        setattr(self.filter_stats, reason, getattr(self.filter_stats, reason) + 1)
+
+        # these skips used to request the stream first
+        if (
+            reason == "atmos"
+            or (reason == "streaming" and item.allowStreaming)
+            or (
+                reason == "videos"
+                and not self.skip_existing
+                and self.get_filenames(item, file_path)[1].exists()
+            )
+        ):
+            self.filter_stats.avoided_requests += 1
+
+        self.show_skipped(item, reason)
+        return True
+
+    def get_filenames(self, item: Track | Video, file_path: Path) -> tuple[Path, Path]:
+        """Predicted filename of `item` and path of its existing file."""
+
+        if isinstance(item, Track):
+            filename = get_existing_track_filename(
+                item.audioQuality, self.track_quality, file_path
+            )
+        else:
+            filename = file_path.with_suffix(".mp4")
+
+        return filename, self.get_path(self.scan_path, filename)
+
+    def find_existing(self, item: Track | Video, file_path: Path) -> Path | None:
+        """Existing file of `item` which is skipped instead of downloaded."""
+
+        if not self.skip_existing:
+            return None
+
+        existing_file_path = self.get_filenames(item, file_path)[1]
+        return existing_file_path if existing_file_path.exists() else None
 
     def get_path(self, base_path: Path, relative_path: Path) -> Path:
         if self.match_existing_path_case:
@@ -86,34 +435,135 @@ class Downloader:
 
         return base_path / relative_path
 
+    async def resolve(
+        self, item: Track | Video, filename: Path, vibrant_color: str
+    ) -> ResolvedStream | None:
+        """Get stream of `item` and parse its manifest, `None` when it's skipped."""
+
+        resolved_at = time()
+
+        def expires_at(urls: list[str]) -> float:
+            expires = resolved_at + self.stream_max_age
+
+            if urls and (url_expiry := parse_url_expiry(urls[0])):
+                expires = min(expires, url_expiry)
+
+            return expires
+
+        if isinstance(item, Video):
+            video_stream = await self.api.get_video_stream(
+                video_id=item.id, quality=self.video_quality
+            )
+            urls = await resolve_video_stream(self.session, video_stream)
+
+            return ResolvedStream(
+                urls=urls,
+                quality=video_stream.videoQuality,
+                quality_string=video_qualities_color[video_stream.videoQuality],
+                download_path=self.get_path(self.download_path, filename).with_suffix(
+                    ".ts"
+                ),
+                expires_at=expires_at(urls),
+            )
+
+        try:
+            stream = await self.api.get_track_stream(
+                track_id=item.id, quality=self.track_quality
+            )
+        except ApiError as e:
+            log.error(f"{item.id=} {e=}")
+            self.rich_output.console.print(
+                f"[red]Error [{vibrant_color}]{item.title}[/] - {e.user_message}"
+            )
+            return None
+
+        log.debug(f"{stream.trackId=}, {stream.audioQuality=}, {stream.audioMode=}")
+
+        # tracks with both audio modes pass the catalog filter
+        if (
+            self.dolby_atmos_filter == "none" and stream.audioMode == "DOLBY_ATMOS"
+        ) or (self.dolby_atmos_filter == "only" and stream.audioMode == "STEREO"):
+            self.show_skipped(item, "atmos")
+            return None
+
+        urls, codecs = parse_track_manifest(stream)
+        resolved = ResolvedStream(
+            urls=urls,
+            quality=f"{stream.audioQuality} {stream.audioMode}",
+            quality_string=track_qualities_color[stream.audioQuality],
+            download_path=self.get_path(self.download_path, filename),
+            expires_at=expires_at(urls),
+            codecs=codecs,
+        )
+
+        if (
+            stream.audioQuality in ["HI_RES_LOSSLESS", "LOSSLESS"]
+            and stream.audioMode == "STEREO"
+        ):
+            resolved.quality_string += f" {stream.bitDepth}-bit, {(stream.sampleRate or 0) / 1000:.1f} kHz"
+            resolved.should_extract_flac = True
+        else:
+            resolved.download_path = resolved.download_path.with_suffix(".m4a")
+
+            if stream.audioMode == "DOLBY_ATMOS":
+                resolved.quality_string = "[blue]Dolby Atmos[/]"
+
+        return resolved
+
+    async def transfer(
+        self, item: Track | Video, resolved: ResolvedStream, task_id: TaskID
+    ) -> Path:
+        """
+        Download resolved stream of `item`, either to a resumable
+        partial file or piped straight into ffmpeg.
+        """
+
+        download_path = resolved.download_path
+        download_path.parent.mkdir(exist_ok=True, parents=True)
+
+        if not (
+            self.pipe_to_ffmpeg
+            and (resolved.should_extract_flac or isinstance(item, Video))
+        ):
+            return await self.write_file(
+                item.id, resolved.quality, resolved.urls, download_path, task_id
+            )
+
+        if isinstance(item, Video):
+            target = download_path.with_suffix(".mp4")
+        else:
+            target = download_path.with_suffix(
+                ".flac" if resolved.codecs == "flac" else ".m4a"
+            )
+
+        path = await remux_stream(self.iter_stream(resolved.urls, task_id), target)
+        self.postprocess_stats.piped += 1
+        resolved.piped = True
+        return path
+
     async def download(
-        self, item: Track | Video, file_path: Path
+        self,
+        item: Track | Video,
+        file_path: Path,
+        tag: Callable[[Path, bool], Awaitable[None]] | None = None,
     ) -> tuple[Path | None, bool]:
         """
+        Download `item` through the pipeline stages,
+        `tag` is awaited in the tagging stage with the item path
+        and whether it was downloaded, existing files are only tagged.
+
         returns
         - Path `item_path` path of existing/downloaded item
         - bool `was_downloaded`
         """
 
-        if not item.allowStreaming:
-            self.rich_output.console.print(
-                f"[red]Can't stream[/] {item.title} ({item.id})"
-            )
+        if self.skip(item, file_path):
             return None, False
 
-        if isinstance(item, Track):
-            filename = get_existing_track_filename(
-                item.audioQuality, self.track_quality, file_path
-            )
-            existing_file_path = self.get_path(self.scan_path, filename)
-            vibrant_color = item.album.vibrantColor
-
-        elif isinstance(item, Video):
-            filename = file_path.with_suffix(".mp4")
-            existing_file_path = self.get_path(self.scan_path, filename)
-            vibrant_color = item.vibrantColor
-
-        vibrant_color = vibrant_color or "gray"
+        filename, existing_file_path = self.get_filenames(item, file_path)
+        vibrant_color = (
+            item.album.vibrantColor if isinstance(item, Track) else item.vibrantColor
+        ) or "gray"
 
         log.debug(f"{file_path=}, {filename=}, {existing_file_path=}")
 
@@ -123,129 +573,96 @@ class Downloader:
             result_message = "[cyan]Overwrited"
 
             if self.skip_existing:
+                self.filter_stats.existing += 1
                 self.rich_output.show_item_result(
                     result_message="[yellow]Exists",
                     item_description=f"[{vibrant_color}]{item.title}",
                     item_path=existing_file_path,
                 )
-                return existing_file_path, False
-
-        elif (isinstance(item, Video) and self.videos_filter == "none") or (
-            isinstance(item, Track) and self.videos_filter == "only"
-        ):
-            log.debug(f"skipping {item.id} due to {self.videos_filter=}")
-            self.rich_output.console.print(
-                f"Skipping '{item.title}' due to video filter set to '{self.videos_filter}'"
-            )
-            return None, False
-
-        should_extract_flac = False
 
-        async with self.semaphore:
-            if isinstance(item, Track):
-                try:
-                    stream = self.api.get_track_stream(
-                        track_id=item.id, quality=self.track_quality
+                if tag is not None:
+                    await self.pipeline.run(
+                        "tag",
+                        {"tag": lambda: tag(existing_file_path, False)},
                     )
 
-                    log.debug(
-                        f"{stream.trackId=}, {stream.audioQuality=}, {stream.audioMode=}"
-                    )
-
-                    if (
-                        self.dolby_atmos_filter == "none"
-                        and stream.audioMode == "DOLBY_ATMOS"
-                    ) or (
-                        self.dolby_atmos_filter == "only"
-                        and stream.audioMode == "STEREO"
-                    ):
-                        self.rich_output.console.print(
-                            f"[blue]Skipping[/] [gray]{item.title}[/] [blue]due to Dolby Atmos filter[/] {self.dolby_atmos_filter}"
-                        )
-                        return None, False
-
-                except ApiError as e:
-                    log.error(f"{item.id=} {e=}")
-                    self.rich_output.console.print(
-                        f"[red]Error [{vibrant_color}]{item.title}[/] - {e.user_message}"
-                    )
-                    return None, False
+                return existing_file_path, False
 
-                urls, _ = parse_track_stream(stream)
-                download_path = self.get_path(self.download_path, filename)
+        resolved: ResolvedStream | None = None
+        download_path: Path | None = None
+        task_id = TaskID(0)
 
-                quality_string = track_qualities_color[stream.audioQuality]
+        def finish() -> None:
+            task = self.rich_output.download_finish(task_id=task_id)
+            self.rich_output.show_item_result(
+                result_message=result_message,
+                item_description=task.description,
+                item_path=download_path,
+            )
 
-                if (
-                    stream.audioQuality in ["HI_RES_LOSSLESS", "LOSSLESS"]
-                    and stream.audioMode == "STEREO"
-                ):
-                    quality_string = f"{quality_string} {stream.bitDepth}-bit, {(stream.sampleRate or 0) / 1000:.1f} kHz"
-                    should_extract_flac = True
-                else:
-                    download_path = download_path.with_suffix(".m4a")
+        async def resolve() -> str | None:
+            nonlocal resolved
+            resolved = await self.resolve(item, filename, vibrant_color)
+            return "transfer" if resolved else None
 
-                    if stream.audioMode == "DOLBY_ATMOS":
-                        quality_string = "[blue]Dolby Atmos[/]"
+        async def transfer() -> str | None:
+            nonlocal download_path, task_id, resolved
+            assert resolved is not None
 
-            elif isinstance(item, Video):
-                stream = self.api.get_video_stream(
-                    video_id=item.id, quality=self.video_quality
-                )
+            if resolved.expired:
+                log.debug(f"{item.id=} stream expired while queued, resolving again")
+                resolved = await self.resolve(item, filename, vibrant_color)
 
-                urls, ext = parse_video_stream(stream), ".ts"
-                download_path = self.get_path(self.download_path, filename).with_suffix(
-                    ext
-                )
-                quality_string = video_qualities_color[stream.videoQuality]
+                if resolved is None:
+                    return None
 
             task_id = self.rich_output.download_start(
-                f"[{vibrant_color}]{item.title} {quality_string}"
+                f"[{vibrant_color}]{item.title} {resolved.quality_string}"
             )
 
-            download_path.parent.mkdir(exist_ok=True, parents=True)
-
-            # TODO shouldnt session be reused instead of
-            # creating new one on every download?
+            try:
+                download_path = await self.transfer(item, resolved, task_id)
+            except FFmpegError as e:
+                log.error(f"{item.id=} {e=}")
+                self.rich_output.download_finish(task_id=task_id)
+                self.rich_output.console.print(
+                    f"[red]Error [{vibrant_color}]{item.title}[/] - {e}"
+                )
+                return None
 
-            with NamedTemporaryFile(
-                "wb", delete=False, dir=download_path.parent
-            ) as tmp:
-                async with aiohttp.ClientSession(trust_env=True) as session:
-                    async with aiofiles.open(tmp.name, "wb") as f:
-                        for url in urls:
-                            async with session.get(url) as resp:
-                                async for chunk in resp.content.iter_chunked(
-                                    CHUNK_SIZE
-                                ):
-                                    await f.write(chunk)
-                                    self.rich_output.download_advance(
-                                        task_id, size=len(chunk)
-                                    )
+            if not resolved.piped and (
+                resolved.should_extract_flac or isinstance(item, Video)
+            ):
+                return "postprocess"
 
-            shutil.move(tmp.name, download_path)
+            finish()
+            return "tag" if tag else None
 
-            try:
-                download_path.chmod(0o644)
-            except OSError:
-                pass
+        async def postprocess() -> str | None:
+            nonlocal download_path
+            assert resolved is not None and download_path is not None
 
-            try:
-                if isinstance(item, Track) and should_extract_flac:
-                    download_path = extract_flac(download_path)
-                elif isinstance(item, Video):
-                    download_path = convert_to_mp4(download_path)
-            except Exception as exc:
-                log.error(f"{should_extract_flac=}, {exc=}")
-
-            task = self.rich_output.download_finish(
-                task_id=task_id,
-            )
-
-            self.rich_output.show_item_result(
-                result_message=result_message,
-                item_description=task.description,
-                item_path=download_path,
+            download_path = await self.postprocess(
+                item, download_path, resolved.should_extract_flac
             )
+            finish()
+            return "tag" if tag else None
+
+        async def tag_downloaded() -> None:
+            assert tag is not None and download_path is not None
+            await tag(download_path, True)
+
+        await self.pipeline.run(
+            "resolve",
+            {
+                "resolve": resolve,
+                "transfer": transfer,
+                "postprocess": postprocess,
+                "tag": tag_downloaded,
+            },
+        )
+
+        if download_path is None:
+            return None, False
 
-            return download_path, True
+        return download_path, True
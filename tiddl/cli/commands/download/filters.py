@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Literal, get_args
+
+from tiddl.cli.config import ATMOS_FILTER_LITERAL, VIDEOS_FILTER_LITERAL
+from tiddl.core.api.models import Track, Video
+
+log = getLogger(__name__)
+
+SKIP_REASON_LITERAL = Literal["streaming", "videos", "atmos", "existing"]
+SKIP_REASONS: tuple[SKIP_REASON_LITERAL, ...] = get_args(SKIP_REASON_LITERAL)
+
+
+@dataclass(slots=True)
+class FilterStats:
+    """
+    Items skipped before their stream was requested, by reason.
+    `avoided_requests` counts the skips which used to request
+    the stream before the filters ran on catalog data.
+    """
+
+    streaming: int = 0
+    videos: int = 0
+    atmos: int = 0
+    existing: int = 0
+    avoided_requests: int = 0
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name}: {getattr(self, name)}"
+            for name in SKIP_REASONS
+            if getattr(self, name)
+        )
+
+
+def is_atmos_excluded(track: Track, atmos_filter: ATMOS_FILTER_LITERAL) -> bool:
+    """
+    Whether the catalog data of `track` tells the atmos filter excludes it.
+    Tracks with both audio modes are decided by their stream.
+    """
+
+    modes = set(track.audioModes)
+
+    if "DOLBY_ATMOS" in track.mediaMetadata.tags:
+        modes.add("DOLBY_ATMOS")
+
+    if atmos_filter == "none":
+        return modes == {"DOLBY_ATMOS"}
+
+    if atmos_filter == "only":
+        return "DOLBY_ATMOS" not in modes
+
+    return False
+
+
+def get_skip_reason(
+    item: Track | Video,
+    videos_filter: VIDEOS_FILTER_LITERAL,
+    atmos_filter: ATMOS_FILTER_LITERAL,
+) -> SKIP_REASON_LITERAL | None:
+    """Evaluate filters of `item` on its catalog data, `None` when it passes."""
+
+    if not (item.allowStreaming and item.streamReady):
+        return "streaming"
+
+    if (isinstance(item, Video) and videos_filter == "none") or (
+        isinstance(item, Track) and videos_filter == "only"
+    ):
+        return "videos"
+
+    if isinstance(item, Track) and is_atmos_excluded(item, atmos_filter):
+        return "atmos"
+
+    return None
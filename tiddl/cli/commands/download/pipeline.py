@@ -0,0 +1,141 @@
+import asyncio
+from dataclasses import dataclass
+from logging import getLogger
+from time import perf_counter
+from typing import Awaitable, Callable
+
+log = getLogger(__name__)
+
+QUEUE_SIZE = 4
+
+Step = Callable[[], Awaitable[str | None]]
+
+
+@dataclass(slots=True)
+class StageStats:
+    processed: int = 0
+    busy: float = 0
+    waited: float = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.processed} items, {self.busy:.1f}s busy, "
+            f"{self.waited:.1f}s waited"
+        )
+
+
+class Stage:
+    """
+    Step of the download pipeline with its own pool of `workers`
+    and a queue of up to `queue_size` items waiting for them.
+
+    With `reserve` an item takes room in the queue of that stage
+    before it gets a worker, so its result never waits for the room
+    while holding the worker, e.g. resolved streams don't age
+    in the resolve stage while the transfers are busy.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        queue_size: int = QUEUE_SIZE,
+        reserve: str | None = None,
+    ) -> None:
+        self.name = name
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 1)
+        self.reserve = reserve
+        self.stats = StageStats()
+        self._workers = asyncio.Semaphore(self.workers)
+        self._queue = asyncio.Semaphore(self.queue_size)
+
+
+class Pipeline:
+    """
+    Stages every item passes in order, each with independent limits,
+    so a slow stage doesn't hold the workers of the other ones.
+
+    An item holds its worker until there's room in the queue
+    of its next stage, a slow stage throttles the ones before it
+    instead of letting their results pile up.
+    """
+
+    def __init__(self, *stages: Stage) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        self._order = {stage.name: index for index, stage in enumerate(stages)}
+
+    @property
+    def capacity(self) -> int:
+        """How many items fit in the workers and queues of all stages."""
+
+        return sum(stage.workers + stage.queue_size for stage in self.stages.values())
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name} ({stage.workers}): {stage.stats}"
+            for name, stage in self.stages.items()
+        )
+
+    async def run(self, stage: str, steps: dict[str, Step]) -> None:
+        """
+        Pass an item through the pipeline starting at `stage`.
+
+        Step of each stage runs on one of its workers and returns
+        name of the next stage of the item, `None` when the item is done.
+        Stages can be skipped but not revisited.
+        """
+
+        current = self.stages[stage]
+        # stages whose queue has room taken by the item
+        queued: list[Stage] = []
+
+        try:
+            await current._queue.acquire()
+            queued.append(current)
+
+            while True:
+                started = perf_counter()
+
+                if current.reserve is not None:
+                    reserved = self.stages[current.reserve]
+                    await reserved._queue.acquire()
+                    queued.append(reserved)
+
+                await current._workers.acquire()
+                current._queue.release()
+                queued.remove(current)
+                current.stats.waited += perf_counter() - started
+                started = perf_counter()
+
+                try:
+                    try:
+                        next_stage = await steps[current.name]()
+                    finally:
+                        current.stats.processed += 1
+                        current.stats.busy += perf_counter() - started
+
+                    if next_stage is None:
+                        return
+
+                    if self._order[next_stage] <= self._order[current.name]:
+                        raise ValueError(
+                            f"stage {next_stage!r} can't follow {current.name!r}"
+                        )
+
+                    following = self.stages[next_stage]
+
+                    for reserved in [s for s in queued if s is not following]:
+                        reserved._queue.release()
+                        queued.remove(reserved)
+
+                    if not queued:
+                        await following._queue.acquire()
+                        queued.append(following)
+                finally:
+                    current._workers.release()
+
+                current = following
+        finally:
+            for reserved in queued:
+                reserved._queue.release()
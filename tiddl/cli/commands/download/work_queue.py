@@ -0,0 +1,204 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from heapq import heappop, heappush
+from itertools import count
+from logging import getLogger
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Sequence,
+    TypeVar,
+)
+
+from tiddl.cli.config import SCHEDULE_LITERAL
+from tiddl.core.api.models import Track, Video
+
+log = getLogger(__name__)
+
+T = TypeVar("T")
+
+Key = tuple[float, ...]
+Work = tuple[Key, int, Callable[[], Awaitable[Any]], asyncio.Future[Any]]
+
+
+def schedule_key(schedule: SCHEDULE_LITERAL, item: Track | Video) -> Key:
+    """
+    Priority of `item` within the lane of its resource,
+    lower keys are downloaded first, equal keys in queue order.
+
+    - fifo, album: queue order, a resource queues its albums one by one
+    - shortest: shortest items first
+    """
+
+    if schedule == "shortest":
+        return (item.duration,)
+
+    return ()
+
+
+@asynccontextmanager
+async def settle_queued(futures: Sequence[Awaitable[Any]]) -> AsyncIterator[None]:
+    """
+    Await `futures` of the work already queued when the producer
+    wrapped by this context raises, before the error is re-raised.
+    Otherwise the work would be cancelled silently when the queue closes.
+    """
+
+    try:
+        yield
+    except Exception:
+        if futures:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            failed = sum(isinstance(result, BaseException) for result in results)
+            log.warning(
+                f"producer failed, settled {len(results)} queued items"
+                f" ({failed} failed)"
+            )
+
+        raise
+
+
+@dataclass(slots=True)
+class Lane:
+    """Queued work of one resource."""
+
+    weight: int = 1
+    priority: int = 0
+    queue: list[Work] = field(default_factory=list)
+    running: int = 0
+    credit: int = 0
+
+
+class WorkQueue:
+    """
+    Bounded queue of download work drained by a fixed pool of workers,
+    use it as async context manager to start and stop the workers.
+
+    Producers `submit` work while they expand resources and wait
+    when the queue is full, so only a bounded number of items
+    is held at once and downloads start with the first page of items.
+    Work must not submit more work, the pool could wait on itself.
+
+    Every resource has its own lane of up to `size` items ordered
+    by their `key`, see `schedule_key`. Free workers take work
+    from the lanes by weighted round-robin, so a small resource
+    isn't starved by a big one, and at most `lane_workers` items
+    of one lane are worked on at once, 0 for no limit.
+    Lanes with lower `priority` are served first, the round-robin
+    only shares workers between ready lanes of the same priority.
+    """
+
+    def __init__(
+        self, workers: int, size: int | None = None, lane_workers: int = 0
+    ) -> None:
+        self.workers = max(workers, 1)
+        self.size = max(size or self.workers, 1)
+        self.lane_workers = max(lane_workers, 0)
+        self.lanes: dict[Hashable, Lane] = {}
+        self._changed: asyncio.Condition | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._sequence = count()
+
+    async def __aenter__(self):
+        self._changed = asyncio.Condition()
+        self._tasks = [
+            asyncio.create_task(self._work(self._changed))
+            for _ in range(self.workers)
+        ]
+        return self
+
+    async def __aexit__(self, *_):
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._changed = None
+
+    def add_lane(self, lane: Hashable, weight: int = 1, priority: int = 0) -> None:
+        """
+        Lane gets `weight` turns for every turn of a lane with weight 1,
+        lanes of higher `priority` get turns only when it has no ready work.
+        """
+
+        queued = self.lanes.setdefault(lane, Lane())
+        queued.weight = max(weight, 1)
+        queued.priority = priority
+
+    async def submit(
+        self, work: Callable[[], Awaitable[T]], key: Key = (), lane: Hashable = 0
+    ) -> asyncio.Future[T]:
+        """Queue `work`, waits for room in its lane. Returns future of its result."""
+
+        assert self._changed is not None, "work queue is not started"
+
+        queued = self.lanes.setdefault(lane, Lane())
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+
+        async with self._changed:
+            await self._changed.wait_for(lambda: len(queued.queue) < self.size)
+            heappush(queued.queue, (key, next(self._sequence), work, future))
+            self._changed.notify_all()
+
+        return future
+
+    def _next_lane(self) -> Lane | None:
+        """Lane to take work from by smooth weighted round-robin."""
+
+        ready = [
+            lane
+            for lane in self.lanes.values()
+            if lane.queue
+            and (not self.lane_workers or lane.running < self.lane_workers)
+        ]
+
+        if not ready:
+            return None
+
+        priority = min(lane.priority for lane in ready)
+        ready = [lane for lane in ready if lane.priority == priority]
+
+        for lane in ready:
+            lane.credit += lane.weight
+
+        chosen = max(ready, key=lambda lane: lane.credit)
+        chosen.credit -= sum(lane.weight for lane in ready)
+        return chosen
+
+    async def _work(self, changed: asyncio.Condition) -> None:
+        while True:
+            async with changed:
+                lane = await changed.wait_for(self._next_lane)
+                # wait_for only returns once the predicate is truthy
+                assert lane is not None
+                _, _, work, future = heappop(lane.queue)
+                lane.running += 1
+                changed.notify_all()
+
+            try:
+                if future.cancelled():
+                    continue
+
+                result = await work()
+
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                log.debug(f"{e=}")
+
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                lane.running -= 1
+
+                # a capped lane may be ready again
+                if self.lane_workers:
+                    async with changed:
+                        changed.notify_all()
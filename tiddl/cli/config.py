@@ -5,6 +5,8 @@ from tomllib import loads as parse_toml
 from typing import Literal
 
 from tiddl.cli.const import APP_PATH
+from tiddl.cli.utils.resource import ResourceTypeLiteral
+from tiddl.core.api.client import API_URL
 from tiddl.core.utils.const import TRACK_QUALITY_LITERAL, VIDEO_QUALITY_LITERAL
 
 CONFIG_FILENAME = "config.toml"
@@ -15,6 +17,7 @@ VALID_M3U_RESOURCE_LITERAL = Literal["album", "playlist", "mix"]
 VALID_RESOURCE_COVER_SAVE_LITERAL = Literal["track", "album", "playlist"]
 VIDEOS_FILTER_LITERAL = Literal["none", "only", "allow"]
 ATMOS_FILTER_LITERAL = Literal["none", "only", "allow"]
+SCHEDULE_LITERAL = Literal["fifo", "album", "shortest"]
 
 log = getLogger(__name__)
 
@@ -23,6 +26,14 @@ class Config(BaseModel):
     enable_cache: bool = True
     debug: bool = False
 
+    class ApiConfig(BaseModel):
+        url: str = API_URL
+        requests_per_second: float = 10
+        burst: int = 20
+        model_cache_size: int = 2048
+
+    api: ApiConfig = ApiConfig()
+
     class MetadataConfig(BaseModel):
         enable: bool = True
         lyrics: bool = False
@@ -59,6 +70,26 @@ class Config(BaseModel):
         write_lrc_file: bool = False
         match_existing_path_case: bool = False
         atmos_filter: ATMOS_FILTER_LITERAL = "none"
+        # connections of the session shared by all downloads, 0 derives it
+        # from threads_count * max(range_connections, segment_concurrency)
+        connections_per_host: int = 0
+        keepalive_timeout: float = 30
+        dns_cache_ttl: int = 300
+        connect_timeout: float = 30
+        read_timeout: float = 60
+        segment_concurrency: int = 4
+        range_connections: int = 4
+        pipe_to_ffmpeg: bool = False
+        postprocess_workers: int = 2
+        stream_workers: int = 4
+        tagging_workers: int = 2
+        queue_size: int = 4
+        prefetch_window: int = 4
+        stream_max_age: float = 600
+        schedule: SCHEDULE_LITERAL = "fifo"
+        schedule_window: int = 64
+        resource_workers: int = 0
+        resource_weights: dict[ResourceTypeLiteral, int] = {}
 
         def model_post_init(self, __context):
             # set scan path to download path when download path is non default
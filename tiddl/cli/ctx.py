@@ -1,72 +1,146 @@
 import typer
 from time import time
 from pathlib import Path
+from typing import NamedTuple
 
 from rich.console import Console
 
-from tiddl.core.api import TidalClient, TidalAPI
-from tiddl.cli.config import APP_PATH
+from tiddl.core.api import AsyncTidalAPI, AsyncTidalClient, TidalClient, TidalAPI
+from tiddl.core.api.cassette import Cassette
+from tiddl.core.api.client import OnTokenExpiry
+from tiddl.core.api.limiter import RateLimiter
+from tiddl.cli.config import APP_PATH, CONFIG
 from tiddl.core.auth import AuthAPI
 from tiddl.cli.utils.auth.core import load_auth_data, save_auth_data
 from tiddl.cli.utils.resource import TidalResource
 
+API_CACHE_NAME = APP_PATH / "api_cache"
+ASYNC_API_CACHE_NAME = APP_PATH / "api_cache_async"
+
+
+class Credentials(NamedTuple):
+    token: str
+    user_id: str
+    country_code: str
+    expires_at: float | None
+    on_token_expiry: OnTokenExpiry | None
+
 
 class ContextObject:
     console: Console
     resources: list[TidalResource]
     auth_api: AuthAPI
     _api: TidalAPI | None
+    _async_api: AsyncTidalAPI | None
     api_omit_cache: bool
     debug_path: Path | None
+    cassette: Cassette | None
 
     def __init__(
-        self, api_omit_cache: bool, debug_path: Path | None, console: Console
+        self,
+        api_omit_cache: bool,
+        debug_path: Path | None,
+        console: Console,
+        cassette: Cassette | None = None,
     ) -> None:
         self.console = console
         self.resources = []
         self.auth_api = AuthAPI()
         self._api = None
+        self._async_api = None
         self.api_omit_cache = api_omit_cache
         self.debug_path = debug_path
+        self.cassette = cassette
 
-    @property
-    def api(self):
-        if self._api is not None:
-            return self._api
-
+    def _load_auth_data(self) -> Credentials:
         auth_data = load_auth_data()
 
-        assert auth_data.token, "Auth Token is missing. Use `tiddl auth login`"
-        assert auth_data.user_id, "User ID is missing. Use `tiddl auth login`"
-        assert auth_data.country_code, "Country Code is missing. Use `tiddl auth login`"
-
+        token = auth_data.token
+        user_id = auth_data.user_id
+        country_code = auth_data.country_code
         refresh_token = auth_data.refresh_token
+
+        assert token, "Auth Token is missing. Use `tiddl auth login`"
+        assert user_id, "User ID is missing. Use `tiddl auth login`"
+        assert country_code, "Country Code is missing. Use `tiddl auth login`"
         assert refresh_token, "Refresh Token is missing. Use `tiddl auth login`"
 
-        def on_token_expiry() -> str | None:
+        expires_at = auth_data.expires_at or None
+
+        if self.cassette is not None and self.cassette.replaying:
+            # replayed calls don't need a valid token
+            return Credentials(token, user_id, country_code, expires_at, None)
+
+        def on_token_expiry() -> tuple[str, float]:
             auth_response = self.auth_api.refresh_token(refresh_token)
             auth_data.token = auth_response.access_token
             auth_data.expires_at = auth_response.expires_in + int(time())
 
             save_auth_data(auth_data=auth_data)
 
-            if auth_response:
-                return auth_response.access_token
+            return auth_data.token, auth_data.expires_at
 
-            return None
+        return Credentials(token, user_id, country_code, expires_at, on_token_expiry)
+
+    @property
+    def api(self):
+        if self._api is not None:
+            return self._api
+
+        credentials = self._load_auth_data()
 
         client = TidalClient(
-            token=auth_data.token,
-            cache_name=APP_PATH / "api_cache",
+            token=credentials.token,
+            cache_name=API_CACHE_NAME,
             omit_cache=self.api_omit_cache,
             debug_path=self.debug_path,
-            on_token_expiry=on_token_expiry,
+            on_token_expiry=credentials.on_token_expiry,
+            expires_at=credentials.expires_at,
+            rate_limiter=RateLimiter(
+                CONFIG.api.requests_per_second, CONFIG.api.burst
+            ),
+            model_cache_size=CONFIG.api.model_cache_size,
+            cassette=self.cassette,
+            api_url=CONFIG.api.url,
         )
 
-        self._api = TidalAPI(client, auth_data.user_id, auth_data.country_code)
+        self._api = TidalAPI(client, credentials.user_id, credentials.country_code)
 
         return self._api
 
+    @property
+    def async_api(self):
+        """
+        API used by the download command,
+        the client must be closed with `AsyncTidalClient.close()`.
+        """
+
+        if self._async_api is not None:
+            return self._async_api
+
+        credentials = self._load_auth_data()
+
+        client = AsyncTidalClient(
+            token=credentials.token,
+            cache_name=ASYNC_API_CACHE_NAME,
+            omit_cache=self.api_omit_cache,
+            debug_path=self.debug_path,
+            on_token_expiry=credentials.on_token_expiry,
+            expires_at=credentials.expires_at,
+            rate_limiter=RateLimiter(
+                CONFIG.api.requests_per_second, CONFIG.api.burst
+            ),
+            model_cache_size=CONFIG.api.model_cache_size,
+            cassette=self.cassette,
+            api_url=CONFIG.api.url,
+        )
+
+        self._async_api = AsyncTidalAPI(
+            client, credentials.user_id, credentials.country_code
+        )
+
+        return self._async_api
+
 
 class Context(typer.Context):
     obj: ContextObject
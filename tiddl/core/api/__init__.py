@@ -1,5 +1,5 @@
-from .api import TidalAPI
-from .client import TidalClient
+from .api import AsyncTidalAPI, TidalAPI
+from .client import AsyncTidalClient, TidalClient
 from .exceptions import ApiError
 
-__all__ = ["TidalAPI", "TidalClient", "ApiError"]
+__all__ = ["TidalAPI", "TidalClient", "AsyncTidalAPI", "AsyncTidalClient", "ApiError"]
@@ -1,8 +1,11 @@
-from typing import Literal, TypeAlias
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Generic, Literal, Type, TypeAlias, TypeVar
 
+from pydantic import BaseModel
 from requests_cache import DO_NOT_CACHE, EXPIRE_IMMEDIATELY
 
-from .client import TidalClient
+from .client import AsyncTidalClient, TidalClient
+from .paginate import paginate
 from .models.base import (
     AlbumItems,
     AlbumItemsCredits,
@@ -30,6 +33,8 @@ from .models.review import AlbumReview
 
 ID: TypeAlias = str | int
 
+T = TypeVar("T", bound=BaseModel)
+
 
 class Limits:
     # TODO test every max limit
@@ -50,28 +55,32 @@ class Limits:
     MIX_ITEMS_MAX = 100
 
 
-class TidalAPI:
-    client: TidalClient
+@dataclass(frozen=True, slots=True)
+class Endpoint(Generic[T]):
+    """Request of an API endpoint and the model of its response."""
+
+    model: Type[T]
+    path: str
+    params: dict[str, Any] = field(default_factory=dict)
+    expire_after: int = 3600
+
+
+class Endpoints:
+    """
+    Endpoints of the TIDAL API, defined once
+    for the `TidalAPI` and `AsyncTidalAPI` which fetch them.
+    """
+
     user_id: str
     country_code: str
 
-    def __init__(self, client: TidalClient, user_id: str, country_code: str) -> None:
-        self.client = client
-        self.user_id = user_id
-        self.country_code = country_code
-
-    def get_album(self, album_id: ID):
-        return self.client.fetch(
-            Album,
-            f"albums/{album_id}",
-            {"countryCode": self.country_code},
-            expire_after=3600,
-        )
+    def album_endpoint(self, album_id: ID):
+        return Endpoint(Album, f"albums/{album_id}", {"countryCode": self.country_code})
 
-    def get_album_items(
+    def album_items_endpoint(
         self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
     ):
-        return self.client.fetch(
+        return Endpoint(
             AlbumItems,
             f"albums/{album_id}/items",
             {
@@ -79,13 +88,12 @@ class TidalAPI:
                 "limit": min(limit, Limits.ALBUM_ITEMS_MAX),
                 "offset": offset,
             },
-            expire_after=3600,
         )
 
-    def get_album_items_credits(
+    def album_items_credits_endpoint(
         self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
     ):
-        return self.client.fetch(
+        return Endpoint(
             AlbumItemsCredits,
             f"albums/{album_id}/items/credits",
             {
@@ -93,50 +101,41 @@ class TidalAPI:
                 "limit": min(limit, Limits.ALBUM_ITEMS_MAX),
                 "offset": offset,
             },
-            expire_after=3600,
         )
 
-    def get_album_review(self, album_id: ID):
-        return self.client.fetch(
+    def album_review_endpoint(self, album_id: ID):
+        return Endpoint(
             AlbumReview,
             f"albums/{album_id}/review",
             {"countryCode": self.country_code},
-            expire_after=3600,
         )
 
-    def get_artist(self, artist_id: ID):
-        return self.client.fetch(
-            Artist,
-            f"artists/{artist_id}",
-            {"countryCode": self.country_code},
-            expire_after=3600,
+    def artist_endpoint(self, artist_id: ID):
+        return Endpoint(
+            Artist, f"artists/{artist_id}", {"countryCode": self.country_code}
         )
 
-    def get_artist_videos(
-        self,
-        artist_id: ID,
-        limit: int = Limits.ARTIST_VIDEOS,
-        offset: int = 0,
+    def artist_videos_endpoint(
+        self, artist_id: ID, limit: int = Limits.ARTIST_VIDEOS, offset: int = 0
     ):
-        return self.client.fetch(
+        return Endpoint(
             ArtistVideosItems,
             f"artists/{artist_id}/videos",
             {
                 "countryCode": self.country_code,
-                "limit": limit,
+                "limit": min(limit, Limits.ARTIST_VIDEOS_MAX),
                 "offset": offset,
             },
-            expire_after=3600,
         )
 
-    def get_artist_albums(
+    def artist_albums_endpoint(
         self,
         artist_id: ID,
         limit: int = Limits.ARTIST_ALBUMS,
         offset: int = 0,
         filter: Literal["ALBUMS", "EPSANDSINGLES"] = "ALBUMS",
     ):
-        return self.client.fetch(
+        return Endpoint(
             ArtistAlbumsItems,
             f"artists/{artist_id}/albums",
             {
@@ -145,16 +144,12 @@ class TidalAPI:
                 "offset": offset,
                 "filter": filter,
             },
-            expire_after=3600,
         )
 
-    def get_mix_items(
-        self,
-        mix_id: str,
-        limit: int = Limits.MIX_ITEMS,
-        offset: int = 0,
+    def mix_items_endpoint(
+        self, mix_id: str, limit: int = Limits.MIX_ITEMS, offset: int = 0
     ):
-        return self.client.fetch(
+        return Endpoint(
             MixItems,
             f"mixes/{mix_id}/items",
             {
@@ -162,29 +157,28 @@ class TidalAPI:
                 "limit": min(limit, Limits.MIX_ITEMS_MAX),
                 "offset": offset,
             },
-            expire_after=3600,
         )
 
-    def get_favorites(self):
-        return self.client.fetch(
+    def favorites_endpoint(self):
+        return Endpoint(
             Favorites,
             f"users/{self.user_id}/favorites/ids",
             {"countryCode": self.country_code},
             expire_after=EXPIRE_IMMEDIATELY,
         )
 
-    def get_playlist(self, playlist_uuid: str):
-        return self.client.fetch(
+    def playlist_endpoint(self, playlist_uuid: str):
+        return Endpoint(
             Playlist,
             f"playlists/{playlist_uuid}",
             {"countryCode": self.country_code},
             expire_after=EXPIRE_IMMEDIATELY,
         )
 
-    def get_playlist_items(
+    def playlist_items_endpoint(
         self, playlist_uuid: str, limit: int = Limits.PLAYLIST_ITEMS, offset: int = 0
     ):
-        return self.client.fetch(
+        return Endpoint(
             PlaylistItems,
             f"playlists/{playlist_uuid}/items",
             {
@@ -195,35 +189,29 @@ class TidalAPI:
             expire_after=EXPIRE_IMMEDIATELY,
         )
 
-    def get_search(self, query: str):
-        return self.client.fetch(
+    def search_endpoint(self, query: str):
+        return Endpoint(
             Search,
             "search",
             {"countryCode": self.country_code, "query": query},
             expire_after=DO_NOT_CACHE,
         )
 
-    def get_session(self):
-        return self.client.fetch(SessionResponse, "sessions", expire_after=DO_NOT_CACHE)
+    def session_endpoint(self):
+        return Endpoint(SessionResponse, "sessions", expire_after=DO_NOT_CACHE)
 
-    def get_track_lyrics(self, track_id: ID):
-        return self.client.fetch(
+    def track_lyrics_endpoint(self, track_id: ID):
+        return Endpoint(
             TrackLyrics,
             f"tracks/{track_id}/lyrics",
             {"countryCode": self.country_code},
-            expire_after=3600,
         )
 
-    def get_track(self, track_id: ID):
-        return self.client.fetch(
-            Track,
-            f"tracks/{track_id}",
-            {"countryCode": self.country_code},
-            expire_after=3600,
-        )
+    def track_endpoint(self, track_id: ID):
+        return Endpoint(Track, f"tracks/{track_id}", {"countryCode": self.country_code})
 
-    def get_track_stream(self, track_id: ID, quality: TrackQuality):
-        return self.client.fetch(
+    def track_stream_endpoint(self, track_id: ID, quality: TrackQuality):
+        return Endpoint(
             TrackStream,
             f"tracks/{track_id}/playbackinfopostpaywall",
             {
@@ -234,16 +222,11 @@ class TidalAPI:
             expire_after=DO_NOT_CACHE,
         )
 
-    def get_video(self, video_id: ID):
-        return self.client.fetch(
-            Video,
-            f"videos/{video_id}",
-            {"countryCode": self.country_code},
-            expire_after=3600,
-        )
+    def video_endpoint(self, video_id: ID):
+        return Endpoint(Video, f"videos/{video_id}", {"countryCode": self.country_code})
 
-    def get_video_stream(self, video_id: ID, quality: StreamVideoQuality):
-        return self.client.fetch(
+    def video_stream_endpoint(self, video_id: ID, quality: StreamVideoQuality):
+        return Endpoint(
             VideoStream,
             f"videos/{video_id}/playbackinfopostpaywall",
             {
@@ -253,3 +236,245 @@ class TidalAPI:
             },
             expire_after=DO_NOT_CACHE,
         )
+
+
+class TidalAPI(Endpoints):
+    client: TidalClient
+    user_id: str
+    country_code: str
+
+    def __init__(self, client: TidalClient, user_id: str, country_code: str) -> None:
+        self.client = client
+        self.user_id = user_id
+        self.country_code = country_code
+
+    def fetch(self, endpoint: Endpoint[T]) -> T:
+        return self.client.fetch(
+            endpoint.model,
+            endpoint.path,
+            endpoint.params,
+            expire_after=endpoint.expire_after,
+        )
+
+    def get_album(self, album_id: ID):
+        return self.fetch(self.album_endpoint(album_id))
+
+    def get_album_items(
+        self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
+    ):
+        return self.fetch(self.album_items_endpoint(album_id, limit, offset))
+
+    def get_album_items_credits(
+        self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
+    ):
+        return self.fetch(self.album_items_credits_endpoint(album_id, limit, offset))
+
+    def get_album_review(self, album_id: ID):
+        return self.fetch(self.album_review_endpoint(album_id))
+
+    def get_artist(self, artist_id: ID):
+        return self.fetch(self.artist_endpoint(artist_id))
+
+    def get_artist_videos(
+        self, artist_id: ID, limit: int = Limits.ARTIST_VIDEOS, offset: int = 0
+    ):
+        return self.fetch(self.artist_videos_endpoint(artist_id, limit, offset))
+
+    def get_artist_albums(
+        self,
+        artist_id: ID,
+        limit: int = Limits.ARTIST_ALBUMS,
+        offset: int = 0,
+        filter: Literal["ALBUMS", "EPSANDSINGLES"] = "ALBUMS",
+    ):
+        return self.fetch(self.artist_albums_endpoint(artist_id, limit, offset, filter))
+
+    def get_mix_items(
+        self, mix_id: str, limit: int = Limits.MIX_ITEMS, offset: int = 0
+    ):
+        return self.fetch(self.mix_items_endpoint(mix_id, limit, offset))
+
+    def get_favorites(self):
+        return self.fetch(self.favorites_endpoint())
+
+    def get_playlist(self, playlist_uuid: str):
+        return self.fetch(self.playlist_endpoint(playlist_uuid))
+
+    def get_playlist_items(
+        self, playlist_uuid: str, limit: int = Limits.PLAYLIST_ITEMS, offset: int = 0
+    ):
+        return self.fetch(self.playlist_items_endpoint(playlist_uuid, limit, offset))
+
+    def get_search(self, query: str):
+        return self.fetch(self.search_endpoint(query))
+
+    def get_session(self):
+        return self.fetch(self.session_endpoint())
+
+    def get_track_lyrics(self, track_id: ID):
+        return self.fetch(self.track_lyrics_endpoint(track_id))
+
+    def get_track(self, track_id: ID):
+        return self.fetch(self.track_endpoint(track_id))
+
+    def get_track_stream(self, track_id: ID, quality: TrackQuality):
+        return self.fetch(self.track_stream_endpoint(track_id, quality))
+
+    def get_video(self, video_id: ID):
+        return self.fetch(self.video_endpoint(video_id))
+
+    def get_video_stream(self, video_id: ID, quality: StreamVideoQuality):
+        return self.fetch(self.video_stream_endpoint(video_id, quality))
+
+
+class AsyncTidalAPI(Endpoints):
+    """`TidalAPI` endpoints served by the `AsyncTidalClient`."""
+
+    client: AsyncTidalClient
+    user_id: str
+    country_code: str
+
+    def __init__(
+        self, client: AsyncTidalClient, user_id: str, country_code: str
+    ) -> None:
+        self.client = client
+        self.user_id = user_id
+        self.country_code = country_code
+
+    async def fetch(self, endpoint: Endpoint[T]) -> T:
+        return await self.client.fetch(
+            endpoint.model,
+            endpoint.path,
+            endpoint.params,
+            expire_after=endpoint.expire_after,
+        )
+
+    async def get_album(self, album_id: ID):
+        return await self.fetch(self.album_endpoint(album_id))
+
+    async def get_album_items(
+        self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
+    ):
+        return await self.fetch(self.album_items_endpoint(album_id, limit, offset))
+
+    async def get_album_items_credits(
+        self, album_id: ID, limit: int = Limits.ALBUM_ITEMS, offset: int = 0
+    ):
+        return await self.fetch(
+            self.album_items_credits_endpoint(album_id, limit, offset)
+        )
+
+    async def get_album_review(self, album_id: ID):
+        return await self.fetch(self.album_review_endpoint(album_id))
+
+    async def get_artist(self, artist_id: ID):
+        return await self.fetch(self.artist_endpoint(artist_id))
+
+    async def get_artist_videos(
+        self, artist_id: ID, limit: int = Limits.ARTIST_VIDEOS, offset: int = 0
+    ):
+        return await self.fetch(self.artist_videos_endpoint(artist_id, limit, offset))
+
+    async def get_artist_albums(
+        self,
+        artist_id: ID,
+        limit: int = Limits.ARTIST_ALBUMS,
+        offset: int = 0,
+        filter: Literal["ALBUMS", "EPSANDSINGLES"] = "ALBUMS",
+    ):
+        return await self.fetch(
+            self.artist_albums_endpoint(artist_id, limit, offset, filter)
+        )
+
+    async def get_mix_items(
+        self, mix_id: str, limit: int = Limits.MIX_ITEMS, offset: int = 0
+    ):
+        return await self.fetch(self.mix_items_endpoint(mix_id, limit, offset))
+
+    async def get_favorites(self):
+        return await self.fetch(self.favorites_endpoint())
+
+    async def get_playlist(self, playlist_uuid: str):
+        return await self.fetch(self.playlist_endpoint(playlist_uuid))
+
+    async def get_playlist_items(
+        self, playlist_uuid: str, limit: int = Limits.PLAYLIST_ITEMS, offset: int = 0
+    ):
+        return await self.fetch(
+            self.playlist_items_endpoint(playlist_uuid, limit, offset)
+        )
+
+    async def get_search(self, query: str):
+        return await self.fetch(self.search_endpoint(query))
+
+    async def get_session(self):
+        return await self.fetch(self.session_endpoint())
+
+    async def get_track_lyrics(self, track_id: ID):
+        return await self.fetch(self.track_lyrics_endpoint(track_id))
+
+    async def get_track(self, track_id: ID):
+        return await self.fetch(self.track_endpoint(track_id))
+
+    async def get_track_stream(self, track_id: ID, quality: TrackQuality):
+        return await self.fetch(self.track_stream_endpoint(track_id, quality))
+
+    async def get_video(self, video_id: ID):
+        return await self.fetch(self.video_endpoint(video_id))
+
+    async def get_video_stream(self, video_id: ID, quality: StreamVideoQuality):
+        return await self.fetch(self.video_stream_endpoint(video_id, quality))
+
+    async def iter_album_items_credits(
+        self, album_id: ID
+    ) -> AsyncIterator[AlbumItemsCredits.TrackItem | AlbumItemsCredits.VideoItem]:
+        async for page in paginate(
+            lambda limit, offset: self.get_album_items_credits(album_id, limit, offset),
+            Limits.ALBUM_ITEMS_MAX,
+        ):
+            for item in page.items:
+                yield item
+
+    async def iter_artist_albums(
+        self,
+        artist_id: ID,
+        filter: Literal["ALBUMS", "EPSANDSINGLES"] = "ALBUMS",
+    ) -> AsyncIterator[Album]:
+        async for page in paginate(
+            lambda limit, offset: self.get_artist_albums(
+                artist_id, limit, offset, filter
+            ),
+            Limits.ARTIST_ALBUMS_MAX,
+        ):
+            for album in page.items:
+                yield album
+
+    async def iter_artist_videos(self, artist_id: ID) -> AsyncIterator[Video]:
+        async for page in paginate(
+            lambda limit, offset: self.get_artist_videos(artist_id, limit, offset),
+            Limits.ARTIST_VIDEOS_MAX,
+        ):
+            for video in page.items:
+                yield video
+
+    async def iter_mix_items(self, mix_id: str) -> AsyncIterator[MixItems.MixItem]:
+        async for page in paginate(
+            lambda limit, offset: self.get_mix_items(mix_id, limit, offset),
+            Limits.MIX_ITEMS_MAX,
+        ):
+            for item in page.items:
+                yield item
+
+    async def iter_playlist_items(
+        self, playlist_uuid: str
+    ) -> AsyncIterator[
+        PlaylistItems.PlaylistTrackItem | PlaylistItems.PlaylistVideoItem
+    ]:
+        async for page in paginate(
+            lambda limit, offset: self.get_playlist_items(
+                playlist_uuid, limit, offset
+            ),
+            Limits.PLAYLIST_ITEMS_MAX,
+        ):
+            for item in page.items:
+                yield item
@@ -0,0 +1,341 @@
+import asyncio
+import sqlite3
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Mapping, Sequence, Type, TypeVar
+from urllib.parse import urlencode
+
+from pydantic import BaseModel
+from requests_cache import DO_NOT_CACHE, EXPIRE_IMMEDIATELY, NEVER_EXPIRE, StrOrPath
+
+T = TypeVar("T", bound=BaseModel)
+
+MODEL_CACHE_SIZE = 2048
+
+log = getLogger(__name__)
+
+
+def create_key(endpoint: str, params: dict[str, Any]) -> str:
+    """Cache key of a request, independent of the params order."""
+
+    return f"{endpoint}?{urlencode(sorted(params.items()))}"
+
+
+def endpoint_family(endpoint: str) -> str:
+    """
+    Endpoint without the resource id,
+    e.g. `albums/123/items` -> `albums/{id}/items`.
+    """
+
+    parts = endpoint.strip("/").split("/")
+
+    if len(parts) > 1:
+        parts[1] = "{id}"
+
+    return "/".join(parts)
+
+
+def is_cacheable(expire_after: int) -> bool:
+    return expire_after != DO_NOT_CACHE
+
+
+def is_readable(expire_after: int) -> bool:
+    return expire_after not in (DO_NOT_CACHE, EXPIRE_IMMEDIATELY)
+
+
+def remaining_ttl(expires_at: float | None) -> int:
+    """`expire_after` of data from a cached response expiring at `expires_at`."""
+
+    if expires_at is None:
+        return NEVER_EXPIRE
+
+    return max(int(expires_at - time()), EXPIRE_IMMEDIATELY)
+
+
+LOOKUPS_TABLE = """
+CREATE TABLE IF NOT EXISTS lookups (
+    family TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL,
+    misses INTEGER NOT NULL
+)
+"""
+
+
+def save_lookups(
+    connection: sqlite3.Connection, lookups: Mapping[str, Sequence[int]]
+) -> None:
+    """Add hits and misses by endpoint family to the `lookups` table."""
+
+    connection.execute(LOOKUPS_TABLE)
+    connection.executemany(
+        """
+        INSERT INTO lookups VALUES (?, ?, ?)
+        ON CONFLICT(family) DO UPDATE SET
+            hits = hits + excluded.hits,
+            misses = misses + excluded.misses
+        """,
+        [(family, hits, misses) for family, (hits, misses) in lookups.items()],
+    )
+
+
+def load_lookups(connection: sqlite3.Connection) -> list[tuple[str, int, int]]:
+    """Hits and misses by endpoint family saved with `save_lookups`."""
+
+    connection.execute(LOOKUPS_TABLE)
+
+    return connection.execute("SELECT family, hits, misses FROM lookups").fetchall()
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    status: int
+    body: bytes
+    created_at: float
+    expires_at: float | None
+
+
+@dataclass(slots=True)
+class CacheStats:
+    entries: int = 0
+    size: int = 0
+    expired: int = 0
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float | None:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+
+class ResponseCache:
+    """
+    SQLite store of raw API responses, shared between threads.
+
+    Async methods run the queries in a worker thread,
+    so the event loop is not blocked by disk access.
+    """
+
+    path: Path
+
+    def __init__(self, cache_name: StrOrPath) -> None:
+        path = Path(cache_name)
+        self.path = path if path.suffix == ".sqlite" else path.with_suffix(".sqlite")
+        self._lock = Lock()
+        self._connection: sqlite3.Connection | None = None
+        # hits and misses by endpoint family, saved on close
+        self._lookups: defaultdict[str, list[int]] = defaultdict(lambda: [0, 0])
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    body BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            self._connection.execute(LOOKUPS_TABLE)
+
+        return self._connection
+
+    def get_sync(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT status, body, created_at, expires_at "
+                "FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+        response = CachedResponse(*row) if row else None
+
+        if (
+            response
+            and response.expires_at is not None
+            and response.expires_at <= time()
+        ):
+            response = None
+
+        with self._lock:
+            self._lookups[endpoint_family(key.split("?")[0])][response is None] += 1
+
+        return response
+
+    def set_sync(
+        self,
+        key: str,
+        endpoint: str,
+        status: int,
+        body: bytes,
+        expire_after: int = NEVER_EXPIRE,
+    ) -> None:
+        if not is_cacheable(expire_after):
+            return
+
+        now = time()
+        expires_at = None if expire_after == NEVER_EXPIRE else now + expire_after
+
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, status, body, now, expires_at),
+            )
+
+    async def get(self, key: str) -> CachedResponse | None:
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def set(
+        self,
+        key: str,
+        endpoint: str,
+        status: int,
+        body: bytes,
+        expire_after: int = NEVER_EXPIRE,
+    ) -> None:
+        await asyncio.to_thread(
+            self.set_sync, key, endpoint, status, body, expire_after
+        )
+
+    def stats(self) -> dict[str, CacheStats]:
+        """Cache usage by endpoint family."""
+
+        stats: defaultdict[str, CacheStats] = defaultdict(CacheStats)
+        now = time()
+
+        with self._lock:
+            self._save_lookups()
+
+            rows = self.connection.execute(
+                "SELECT endpoint, length(body), expires_at FROM responses"
+            ).fetchall()
+            lookups = load_lookups(self.connection)
+
+        for endpoint, size, expires_at in rows:
+            family_stats = stats[endpoint_family(endpoint)]
+            family_stats.entries += 1
+            family_stats.size += size
+            family_stats.expired += expires_at is not None and expires_at <= now
+
+        for family, hits, misses in lookups:
+            stats[family].hits = hits
+            stats[family].misses = misses
+
+        return dict(stats)
+
+    def prune(self) -> int:
+        """Delete expired responses and return how many were deleted."""
+
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM responses "
+                "WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time(),),
+            )
+
+        return cursor.rowcount
+
+    def purge(self, pattern: str) -> int:
+        """
+        Delete responses of endpoints matching glob `pattern`
+        and return how many were deleted.
+        """
+
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM responses WHERE endpoint GLOB ?", (pattern,)
+            )
+
+        return cursor.rowcount
+
+    def vacuum(self) -> None:
+        with self._lock:
+            self.connection.execute("VACUUM")
+
+    def _save_lookups(self) -> None:
+        if not self._lookups:
+            return
+
+        with self.connection:
+            save_lookups(self.connection, self._lookups)
+
+        self._lookups.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._save_lookups()
+                self._connection.close()
+                self._connection = None
+
+
+class ModelCache:
+    """
+    In-memory LRU cache of validated models,
+    skips reading, decoding and validating responses that were already parsed.
+    """
+
+    def __init__(self, max_size: int = MODEL_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[
+            tuple[type, str], tuple[BaseModel, float | None]
+        ] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: Type[T], key: str) -> T | None:
+        entry = self._entries.get((model, key))
+
+        if entry is not None:
+            value, expires_at = entry
+
+            if expires_at is None or expires_at > monotonic():
+                self._entries.move_to_end((model, key))
+                self.hits += 1
+                return value  # type: ignore
+
+            del self._entries[(model, key)]
+
+        self.misses += 1
+        return None
+
+    def set(
+        self,
+        model: Type[T],
+        key: str,
+        value: T,
+        expire_after: int = NEVER_EXPIRE,
+    ) -> None:
+        if not is_readable(expire_after) or self.max_size <= 0:
+            return
+
+        expires_at = None
+
+        if expire_after != NEVER_EXPIRE:
+            expires_at = monotonic() + expire_after
+
+        self._entries[(model, key)] = (value, expires_at)
+        self._entries.move_to_end((model, key))
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
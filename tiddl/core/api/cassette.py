@@ -0,0 +1,113 @@
+import json
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import IO, Any, Literal
+
+from .cache import create_key
+from .exceptions import CassetteError
+
+CASSETTE_MODE_LITERAL = Literal["record", "replay"]
+
+log = getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Interaction:
+    endpoint: str
+    params: dict[str, Any]
+    status: int
+    body: str
+    latency: float
+
+
+class Cassette:
+    """
+    Recorded API calls, stored as json lines file.
+
+    In `record` mode every response received by a client is appended
+    to the file together with its latency.
+    In `replay` mode the clients are served from the file
+    instead of the network, responses of the same request
+    are returned in the recorded order, the last one is repeated.
+    With `replay_latency` the recorded latency is reproduced.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        mode: CASSETTE_MODE_LITERAL,
+        replay_latency: bool = False,
+    ) -> None:
+        self.path = path
+        self.mode: CASSETTE_MODE_LITERAL = mode
+        self.replay_latency = replay_latency
+        self._lock = Lock()
+        self._file: IO[str] | None = None
+        self._interactions: defaultdict[str, deque[Interaction]] = defaultdict(deque)
+
+        if mode == "replay":
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        with self.path.open() as f:
+            for line in f:
+                interaction = Interaction(**json.loads(line))
+                key = create_key(interaction.endpoint, interaction.params)
+                self._interactions[key].append(interaction)
+
+        log.debug(f"loaded {len(self)} interactions from '{self.path}'")
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._interactions.values())
+
+    def record(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        status: int,
+        body: bytes,
+        latency: float,
+    ) -> None:
+        interaction = Interaction(
+            endpoint=endpoint,
+            params=dict(params),
+            status=status,
+            body=body.decode(errors="replace"),
+            latency=latency,
+        )
+
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a")
+
+            self._file.write(json.dumps(asdict(interaction)) + "\n")
+            self._file.flush()
+
+    def play(self, endpoint: str, params: dict[str, Any]) -> Interaction:
+        key = create_key(endpoint, params)
+
+        with self._lock:
+            queue = self._interactions.get(key)
+
+            if not queue:
+                raise CassetteError(f"'{key}' is not recorded in '{self.path}'")
+
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,36 +1,101 @@
+import asyncio
 import json
+from dataclasses import dataclass
 from logging import getLogger
 from pathlib import Path
 from typing import Any, Type, TypeVar, Callable, Optional
 
-from pydantic import BaseModel
-from time import sleep
+import aiohttp
+from pydantic import BaseModel, ValidationError
+from threading import Lock
+from time import perf_counter, sleep, time
 
-from requests.exceptions import JSONDecodeError
+from requests import Request
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
 from requests_cache import (
+    AnyResponse,
     CachedSession,
+    OriginalResponse,
+    SQLiteDict,
     StrOrPath,
     NEVER_EXPIRE,
 )
 
-from .exceptions import ApiError
+from .cache import (
+    MODEL_CACHE_SIZE,
+    ModelCache,
+    ResponseCache,
+    create_key,
+    endpoint_family,
+    is_readable,
+    remaining_ttl,
+    save_lookups,
+)
+from .cassette import Cassette
+from .debug import DebugCapture
+from .exceptions import ApiError, InvalidJSONError
+from .limiter import RETRY_STATUS_CODES, RateLimiter, retry_delay
 
 T = TypeVar("T", bound=BaseModel)
 
 API_URL = "https://api.tidal.com/v1"
 MAX_RETRIES = 5
 RETRY_DELAY = 2
+# how many seconds before the token expiry it is refreshed
+TOKEN_REFRESH_MARGIN = 300
+
+# returns new token and its expiry as unix timestamp
+OnTokenExpiry = Callable[[], tuple[str, float] | None]
 
 log = getLogger(__name__)
 
 
-# TODO add token expiry check
-# maybe refactor to aiohttp.ClientSession
+def decode_response(model: Type[T], status_code: int, body: bytes) -> T:
+    """
+    Validate the response body straight into `model`,
+    error responses are decoded to raise `ApiError`.
+
+    Raises `InvalidJSONError` when the body is not valid json.
+    """
+
+    if status_code != 200:
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise InvalidJSONError(str(e)) from e
+
+        raise ApiError(**data)
+
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        if any(error["type"] == "json_invalid" for error in e.errors()):
+            raise InvalidJSONError(str(e)) from e
+
+        raise
+
+
+@dataclass(slots=True)
+class ClientStats:
+    requests: int = 0
+    throttled: int = 0
+    retried: int = 0
+    coalesced: int = 0
+
+
 class TidalClient:
     _token: str
     debug_path: Path | None
+    debug: DebugCapture | None
     session: CachedSession
-    on_token_expiry: Optional[Callable[[], str | None]]
+    on_token_expiry: Optional[OnTokenExpiry]
+    expires_at: float | None
+    rate_limiter: RateLimiter | None
+    stats: ClientStats
+    model_cache: ModelCache
+    omit_cache: bool
+    cassette: Cassette | None
+    api_url: str
 
     def __init__(
         self,
@@ -38,10 +103,23 @@ class TidalClient:
         cache_name: StrOrPath,
         omit_cache: bool = False,
         debug_path: Path | None = None,
-        on_token_expiry: Optional[Callable[[], str | None]] = None,
+        on_token_expiry: Optional[OnTokenExpiry] = None,
+        rate_limiter: RateLimiter | None = None,
+        model_cache_size: int = MODEL_CACHE_SIZE,
+        expires_at: float | None = None,
+        cassette: Cassette | None = None,
+        api_url: str | None = None,
     ) -> None:
         self.on_token_expiry = on_token_expiry
+        self.expires_at = expires_at
+        self.cassette = cassette
+        self.api_url = api_url or API_URL
         self.debug_path = debug_path
+        self.debug = DebugCapture(debug_path) if debug_path else None
+        self.rate_limiter = rate_limiter
+        self.stats = ClientStats()
+        self.model_cache = ModelCache(model_cache_size)
+        self.omit_cache = omit_cache
         self.session = CachedSession(
             cache_name=cache_name, always_revalidate=omit_cache
         )
@@ -50,6 +128,7 @@ class TidalClient:
             "Accept": "application/json",
         }
         self._token = token
+        self._refresh_lock = Lock()
 
     @property
     def token(self):
@@ -64,6 +143,144 @@ class TidalClient:
             }
         )
 
+    def token_expires_soon(self) -> bool:
+        return (
+            self.on_token_expiry is not None
+            and self.expires_at is not None
+            and self.expires_at - TOKEN_REFRESH_MARGIN <= time()
+        )
+
+    def refresh_token(self, expired_token: str | None = None) -> None:
+        """
+        Refresh the token with `on_token_expiry`.
+
+        When `expired_token` was already replaced by another thread,
+        its new token is used instead of refreshing again.
+        """
+
+        if self.on_token_expiry is None:
+            return
+
+        with self._refresh_lock:
+            if expired_token is not None and expired_token != self._token:
+                return
+
+            refreshed = self.on_token_expiry()
+
+            if refreshed:
+                self.token, self.expires_at = refreshed
+
+    def _send(
+        self, endpoint: str, params: dict[str, Any], expire_after: int
+    ) -> AnyResponse:
+        if self.cassette is not None and self.cassette.replaying:
+            interaction = self.cassette.play(endpoint, params)
+
+            if self.cassette.replay_latency:
+                sleep(interaction.latency)
+
+            res = OriginalResponse()
+            res.status_code = interaction.status
+            res._content = interaction.body.encode()
+            return res
+
+        started = perf_counter()
+        res = self.session.get(
+            f"{self.api_url}/{endpoint}", params=params, expire_after=expire_after
+        )
+
+        if self.cassette is not None:
+            self.cassette.record(
+                endpoint, params, res.status_code, res.content, perf_counter() - started
+            )
+
+        return res
+
+    def _is_cached(
+        self, endpoint: str, params: dict[str, Any], expire_after: int
+    ) -> bool:
+        """Whether the session answers the request from its cache."""
+
+        if self.omit_cache or not is_readable(expire_after):
+            return False
+
+        if self.cassette is not None and self.cassette.replaying:
+            return False
+
+        responses = self.session.cache.responses
+
+        if not isinstance(responses, SQLiteDict):
+            return False
+
+        request = self.session.prepare_request(
+            Request("GET", f"{self.api_url}/{endpoint}", params=params)
+        )
+        key = self.session.cache.create_key(request)
+
+        # only the expiry is read, the response is decoded by the session
+        with responses.connection() as connection:
+            row = connection.execute(
+                f"SELECT expires FROM {responses.table_name} WHERE key = ?", (key,)
+            ).fetchone()
+
+        return row is not None and (row[0] is None or row[0] > time())
+
+    def _save_lookup(self, endpoint: str, hit: bool) -> None:
+        """Save whether the cache answered `endpoint`, for its hit rate."""
+
+        responses = self.session.cache.responses
+
+        if not isinstance(responses, SQLiteDict):
+            return
+
+        with responses.connection(commit=True) as connection:
+            save_lookups(
+                connection, {endpoint_family(endpoint): (int(hit), int(not hit))}
+            )
+
+    def _get(self, endpoint: str, params: dict[str, Any], expire_after: int):
+        """
+        Send GET request, throttled and retried
+        on connection errors, 429 and 5xx responses.
+        Cache hits are neither throttled nor counted as requests.
+        """
+
+        if self._is_cached(endpoint, params, expire_after):
+            return self._send(endpoint, params, expire_after)
+
+        attempt = 1
+
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire_sync()
+
+            self.stats.requests += 1
+
+            try:
+                res = self._send(endpoint, params, expire_after)
+            except (RequestsConnectionError, Timeout) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+
+                delay = retry_delay(attempt)
+                log.warning(f"{endpoint} {e}, retrying in {delay:.1f}s")
+            else:
+                if res.status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+                    return res
+
+                delay = retry_delay(attempt, res.headers.get("Retry-After"))
+                log.warning(f"{endpoint} [{res.status_code}], retrying in {delay:.1f}s")
+
+                if res.status_code == 429:
+                    self.stats.throttled += 1
+
+                    if self.rate_limiter:
+                        self.rate_limiter.pause(delay)
+
+            self.stats.retried += 1
+            attempt += 1
+            sleep(delay)
+
     def fetch(
         self,
         model: Type[T],
@@ -77,15 +294,24 @@ class TidalClient:
         and parse it into the given Pydantic model.
         """
 
-        res = self.session.get(
-            f"{API_URL}/{endpoint}", params=params, expire_after=expire_after
-        )
+        cache_key = create_key(endpoint, params)
 
-        if res.status_code == 401 and self.on_token_expiry:
-            token = self.on_token_expiry()
+        if is_readable(expire_after) and not self.omit_cache:
+            cached_model = self.model_cache.get(model, cache_key)
+
+            if cached_model is not None:
+                return cached_model
+
+        if self.token_expires_soon():
+            self.refresh_token(self._token)
 
-            if token:
-                self.token = token
+        token = self._token
+        started = perf_counter()
+        res = self._get(endpoint, params, expire_after)
+        latency = perf_counter() - started
+
+        if res.status_code == 401 and self.on_token_expiry:
+            self.refresh_token(token)
 
             return self.fetch(
                 model=model,
@@ -99,9 +325,24 @@ class TidalClient:
             f"{endpoint} {params} '{'HIT' if res.from_cache else 'MISS'}' [{res.status_code}]",
         )
 
+        replaying = self.cassette is not None and self.cassette.replaying
+
+        if is_readable(expire_after) and not self.omit_cache and not replaying:
+            self._save_lookup(endpoint, res.from_cache)
+
+        if self.debug:
+            self.debug.record(
+                endpoint,
+                params,
+                res.status_code,
+                res.content,
+                latency,
+                cached=res.from_cache,
+            )
+
         try:
-            data = res.json()
-        except JSONDecodeError as e:
+            result = decode_response(model, res.status_code, res.content)
+        except InvalidJSONError as e:
             if _attempt >= MAX_RETRIES:
                 log.error(f"JSON decode failed after {MAX_RETRIES} attempts: {e}")
                 raise ApiError(
@@ -120,25 +361,367 @@ class TidalClient:
                 expire_after=expire_after,
                 _attempt=_attempt + 1,
             )
+        except ApiError:
+            log.error(f"{endpoint=}, {params=}, {res.content=}")
+            raise
+
+        if res.from_cache:
+            # the model expires together with the cached response
+            expire_after = remaining_ttl(
+                res.expires.timestamp() if res.expires else None
+            )
+
+        self.model_cache.set(model, cache_key, result, expire_after)
+
+        return result
+
+
+class AsyncTidalClient:
+    """
+    Asyncio counterpart of `TidalClient`.
+
+    Responses are cached in a `ResponseCache`,
+    the aiohttp session is created on the first request,
+    so the client has to be used inside a running event loop.
+    """
+
+    _token: str
+    debug_path: Path | None
+    debug: DebugCapture | None
+    cache: ResponseCache
+    omit_cache: bool
+    on_token_expiry: Optional[OnTokenExpiry]
+    expires_at: float | None
+    rate_limiter: RateLimiter | None
+    stats: ClientStats
+    model_cache: ModelCache
+    cassette: Cassette | None
+    api_url: str
+
+    def __init__(
+        self,
+        token: str,
+        cache_name: StrOrPath,
+        omit_cache: bool = False,
+        debug_path: Path | None = None,
+        on_token_expiry: Optional[OnTokenExpiry] = None,
+        rate_limiter: RateLimiter | None = None,
+        model_cache_size: int = MODEL_CACHE_SIZE,
+        expires_at: float | None = None,
+        cassette: Cassette | None = None,
+        api_url: str | None = None,
+    ) -> None:
+        self.on_token_expiry = on_token_expiry
+        self.expires_at = expires_at
+        self.cassette = cassette
+        self.api_url = api_url or API_URL
+        self.debug_path = debug_path
+        self.debug = DebugCapture(debug_path) if debug_path else None
+        self.rate_limiter = rate_limiter
+        self.stats = ClientStats()
+        self.model_cache = ModelCache(model_cache_size)
+        self.cache = ResponseCache(cache_name)
+        self.omit_cache = omit_cache
+        self._token = token
+        self._session: aiohttp.ClientSession | None = None
+        self._in_flight: dict[tuple[type, str], asyncio.Future] = {}
+        self._refresh: asyncio.Future | None = None
+
+    @property
+    def token(self):
+        return self._token
+
+    @token.setter
+    def token(self, token: str):
+        self._token = token
+
+        if self._session is not None:
+            self._session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def token_expires_soon(self) -> bool:
+        return (
+            self.on_token_expiry is not None
+            and self.expires_at is not None
+            and self.expires_at - TOKEN_REFRESH_MARGIN <= time()
+        )
+
+    def _start_refresh(self) -> asyncio.Future:
+        """Start refreshing the token, unless a refresh is already running."""
+
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._refresh_token())
+
+        return self._refresh
+
+    async def _refresh_token(self) -> None:
+        assert self.on_token_expiry
 
-        if self.debug_path:
-            file = self.debug_path / f"{endpoint}.json"
-            file.parent.mkdir(parents=True, exist_ok=True)
-
-            file.write_text(
-                json.dumps(
-                    {
-                        "status_code": res.status_code,
-                        "endpoint": endpoint,
-                        "params": params,
-                        "data": data,
-                    },
-                    indent=2,
+        log.debug("refreshing token")
+        refreshed = await asyncio.to_thread(self.on_token_expiry)
+
+        if refreshed:
+            self.token, self.expires_at = refreshed
+
+    async def refresh_token(self, expired_token: str | None = None) -> None:
+        """
+        Refresh the token with `on_token_expiry`.
+
+        Concurrent callers wait for a single refresh,
+        nothing is refreshed when `expired_token` was already replaced.
+        """
+
+        if self.on_token_expiry is None:
+            return
+
+        if expired_token is not None and expired_token != self._token:
+            return
+
+        await asyncio.shield(self._start_refresh())
+
+    async def _ensure_token(self) -> None:
+        """
+        Refresh the token in background when it is about to expire,
+        requests wait for the refresh only when the token has already expired.
+        """
+
+        if not self.token_expires_soon():
+            return
+
+        assert self.expires_at is not None
+
+        if self.expires_at <= time():
+            await self.refresh_token()
+            return
+
+        if self._refresh is None or self._refresh.done():
+            self._start_refresh().add_done_callback(self._log_refresh_error)
+
+    @staticmethod
+    def _log_refresh_error(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception():
+            log.error(f"token refresh failed: {future.exception()!r}")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Bearer {self._token}",
+                    "Accept": "application/json",
+                },
+                trust_env=True,
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        self.cache.close()
+
+        if self.debug:
+            await asyncio.to_thread(self.debug.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def _send(
+        self, endpoint: str, params: dict[str, Any]
+    ) -> tuple[int, bytes, str | None]:
+        if self.cassette is not None and self.cassette.replaying:
+            interaction = self.cassette.play(endpoint, params)
+
+            if self.cassette.replay_latency:
+                await asyncio.sleep(interaction.latency)
+
+            return interaction.status, interaction.body.encode(), None
+
+        started = perf_counter()
+
+        async with self.session.get(
+            f"{self.api_url}/{endpoint}", params=params
+        ) as res:
+            body = await res.read()
+
+        if self.cassette is not None:
+            # the recorded line is written without blocking the event loop
+            await asyncio.to_thread(
+                self.cassette.record,
+                endpoint,
+                params,
+                res.status,
+                body,
+                perf_counter() - started,
+            )
+
+        return res.status, body, res.headers.get("Retry-After")
+
+    async def _request(
+        self, endpoint: str, params: dict[str, Any]
+    ) -> tuple[int, bytes]:
+        """
+        Send GET request, throttled and retried
+        on connection errors, 429 and 5xx responses.
+        """
+
+        attempt = 1
+
+        while True:
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
+
+            self.stats.requests += 1
+
+            try:
+                status_code, body, retry_after = await self._send(endpoint, params)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+
+                delay = retry_delay(attempt)
+                log.warning(f"{endpoint} {e!r}, retrying in {delay:.1f}s")
+            else:
+                if status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+                    return status_code, body
+
+                delay = retry_delay(attempt, retry_after)
+                log.warning(f"{endpoint} [{status_code}], retrying in {delay:.1f}s")
+
+                if status_code == 429:
+                    self.stats.throttled += 1
+
+                    if self.rate_limiter:
+                        self.rate_limiter.pause(delay)
+
+            self.stats.retried += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def fetch(
+        self,
+        model: Type[T],
+        endpoint: str,
+        params: dict[str, Any] = {},
+        expire_after: int = NEVER_EXPIRE,
+    ) -> T:
+        """
+        Fetch data from the API endpoint
+        and parse it into the given Pydantic model.
+
+        Concurrent calls with the same endpoint and params
+        share a single request and the parsed model.
+        """
+
+        cache_key = create_key(endpoint, params)
+
+        if is_readable(expire_after) and not self.omit_cache:
+            cached_model = self.model_cache.get(model, cache_key)
+
+            if cached_model is not None:
+                return cached_model
+
+        key = (model, cache_key)
+        future = self._in_flight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(
+                self._fetch(model, endpoint, params, expire_after)
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.stats.coalesced += 1
+
+        # shield, so a cancelled caller does not cancel the other waiters
+        return await asyncio.shield(future)
+
+    async def _fetch(
+        self,
+        model: Type[T],
+        endpoint: str,
+        params: dict[str, Any],
+        expire_after: int,
+        _attempt: int = 1,
+    ) -> T:
+        cache_key = create_key(endpoint, params)
+        cached = None
+        # replayed responses bypass the cache like in the sync client
+        replaying = self.cassette is not None and self.cassette.replaying
+
+        if is_readable(expire_after) and not self.omit_cache and not replaying:
+            cached = await self.cache.get(cache_key)
+
+        token = self._token
+        started = perf_counter()
+
+        if cached:
+            status_code, body = cached.status, cached.body
+        else:
+            await self._ensure_token()
+            token = self._token
+            status_code, body = await self._request(endpoint, params)
+
+        latency = perf_counter() - started
+
+        if status_code == 401 and self.on_token_expiry:
+            await self.refresh_token(token)
+
+            return await self._fetch(
+                model=model,
+                endpoint=endpoint,
+                params=params,
+                expire_after=expire_after,
+                _attempt=MAX_RETRIES - 1,
+            )
+
+        log.debug(
+            f"{endpoint} {params} '{'HIT' if cached else 'MISS'}' [{status_code}]",
+        )
+
+        if self.debug:
+            self.debug.record(
+                endpoint, params, status_code, body, latency, cached=bool(cached)
+            )
+
+        try:
+            result = decode_response(model, status_code, body)
+        except InvalidJSONError as e:
+            if _attempt >= MAX_RETRIES:
+                log.error(f"JSON decode failed after {MAX_RETRIES} attempts: {e}")
+                raise ApiError(
+                    status=status_code,
+                    subStatus="0",
+                    userMessage="Response body does not contain valid json.",
                 )
+
+            log.warning(f"JSON decode error, retrying {_attempt}/{MAX_RETRIES}")
+            await asyncio.sleep(RETRY_DELAY)
+
+            return await self._fetch(
+                model=model,
+                endpoint=endpoint,
+                params=params,
+                expire_after=expire_after,
+                _attempt=_attempt + 1,
             )
+        except ApiError:
+            log.error(f"{endpoint=}, {params=}, {body=}")
+            raise
+
+        if cached:
+            # the model expires together with the cached response
+            expire_after = remaining_ttl(cached.expires_at)
+        elif not replaying:
+            await self.cache.set(cache_key, endpoint, status_code, body, expire_after)
 
-        if res.status_code != 200:
-            log.error(f"{endpoint=}, {params=}, {data=}")
-            raise ApiError(**data)
+        self.model_cache.set(model, cache_key, result, expire_after)
 
-        return model.model_validate(data)
+        return result
@@ -0,0 +1,157 @@
+import atexit
+import gzip
+import json
+import os
+from datetime import datetime
+from itertools import count
+from logging import getLogger
+from pathlib import Path
+from queue import Full, Queue
+from threading import Thread
+from time import time
+from typing import Any, Iterator
+
+SEGMENT_SIZE = 16 * 1024**2
+MAX_SEGMENTS = 20
+QUEUE_SIZE = 1024
+
+SEGMENT_GLOB = "*.jsonl.gz"
+
+log = getLogger(__name__)
+
+_segment_ids = count()
+
+
+class DebugCapture:
+    """
+    Append-only capture of API calls.
+
+    Calls are queued and written by a background thread
+    to gzip compressed JSON lines segments at `path`.
+    A segment is rotated when it grows over `segment_size` bytes,
+    only the newest `max_segments` segments are kept.
+
+    `record` never blocks, when the queue is full the call is dropped.
+    The first drop is logged right away, the number of drops on `close`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_size: int = SEGMENT_SIZE,
+        max_segments: int = MAX_SEGMENTS,
+        queue_size: int = QUEUE_SIZE,
+    ) -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.dropped = 0
+        self._queue: Queue[dict[str, Any] | None] = Queue(queue_size)
+        self._thread: Thread | None = None
+        self._file: gzip.GzipFile | None = None
+
+    def record(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        status_code: int,
+        body: bytes,
+        latency: float,
+        cached: bool = False,
+    ) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="debug-capture", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+        try:
+            self._queue.put_nowait(
+                {
+                    "timestamp": time(),
+                    "endpoint": endpoint,
+                    "params": dict(params),
+                    "status_code": status_code,
+                    "latency": latency,
+                    "cached": cached,
+                    "body": body,
+                }
+            )
+        except Full:
+            self.dropped += 1
+
+            if self.dropped == 1:
+                log.warning(
+                    f"debug capture queue is full, dropping calls to {self.path}"
+                )
+
+    def close(self) -> None:
+        """Write the queued calls and close the segment."""
+
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.close)
+
+        if self.dropped:
+            log.warning(f"debug capture dropped {self.dropped} calls")
+
+    def _run(self) -> None:
+        while True:
+            entry = self._queue.get()
+
+            if entry is None:
+                break
+
+            try:
+                self._write(entry)
+            except OSError as e:
+                log.error(f"debug capture failed: {e}")
+
+            if self._queue.empty() and self._file is not None:
+                # sync flush, so the segment is readable while it is still open
+                self._file.flush()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        entry["body"] = entry["body"].decode(errors="replace")
+        line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+
+        if self._file is None:
+            self._open_segment()
+
+        assert self._file is not None
+        self._file.write(line)
+
+        if self._file.fileobj.tell() >= self.segment_size:  # type: ignore
+            self._file.close()
+            self._file = None
+
+    def _open_segment(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        segments = sorted(self.path.glob(SEGMENT_GLOB), key=os.path.getmtime)
+
+        for segment in segments[: max(len(segments) - self.max_segments + 1, 0)]:
+            segment.unlink(missing_ok=True)
+
+        name = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{next(_segment_ids)}"
+        self._file = gzip.open(self.path / f"{name}.jsonl.gz", "wb")
+
+
+def read_captures(path: Path) -> Iterator[dict[str, Any]]:
+    """Yield captured calls from all segments at `path`, oldest first."""
+
+    for segment in sorted(path.glob(SEGMENT_GLOB), key=os.path.getmtime):
+        try:
+            with gzip.open(segment, "rt") as f:
+                for line in f:
+                    yield json.loads(line)
+        except EOFError:
+            # segment of a process that did not close it
+            continue
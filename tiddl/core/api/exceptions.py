@@ -6,3 +6,11 @@ class ApiError(Exception):
 
     def __str__(self):
         return f"{self.user_message}, {self.status}/{self.sub_status}"
+
+
+class InvalidJSONError(ValueError):
+    """Response body is not valid json."""
+
+
+class CassetteError(LookupError):
+    """Request is missing in the replayed cassette."""
@@ -0,0 +1,102 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep, time
+
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+RETRY_AFTER_MAX = 300
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the requests rate of a client.
+
+    The bucket holds up to `burst` tokens and refills
+    at `requests_per_second` tokens per second,
+    every request takes one token or waits until it is available.
+    Rate lower or equal to zero disables the limit.
+    """
+
+    def __init__(self, requests_per_second: float, burst: int = 1) -> None:
+        self.rate = requests_per_second
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+
+        with self._lock:
+            now = monotonic()
+            delay = max(self._paused_until - now, 0)
+
+            if self.rate <= 0:
+                return delay
+
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+
+            return max(delay, -self._tokens / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for `seconds`, used when the API throttles us."""
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    def acquire_sync(self) -> None:
+        delay = self.reserve()
+
+        if delay > 0:
+            sleep(delay)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def backoff_delay(
+    attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX
+) -> float:
+    """Exponential backoff with full jitter, `attempt` starts at 1."""
+
+    return uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse `Retry-After` header given in seconds or as HTTP date."""
+
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Seconds to wait before the next attempt, `Retry-After` takes precedence."""
+
+    delay = parse_retry_after(retry_after)
+
+    if delay is None:
+        return backoff_delay(attempt)
+
+    return min(delay, RETRY_AFTER_MAX)
@@ -0,0 +1,54 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from .models.base import Items
+
+P = TypeVar("P", bound=Items)
+
+PAGE_CONCURRENCY = 4
+
+
+async def paginate(
+    fetch_page: Callable[[int, int], Awaitable[P]],
+    limit: int,
+    concurrency: int = PAGE_CONCURRENCY,
+) -> AsyncIterator[P]:
+    """
+    Yield every page of a paginated endpoint in order.
+
+    `fetch_page(limit, offset)` is called for the first page,
+    which tells the total number of items,
+    then the remaining pages are fetched concurrently,
+    at most `concurrency` at once, while the consumer handles earlier pages.
+    Pages are yielded as soon as they and all previous pages are ready.
+    """
+
+    first_page = await fetch_page(limit, 0)
+
+    # the API can apply lower limit than requested
+    step = first_page.limit if first_page.limit > 0 else limit
+    offsets = iter(range(step, first_page.totalNumberOfItems, step))
+    pending: deque[asyncio.Task[P]] = deque()
+
+    def fill():
+        while len(pending) < concurrency:
+            offset = next(offsets, None)
+
+            if offset is None:
+                return
+
+            pending.append(asyncio.ensure_future(fetch_page(step, offset)))
+
+    try:
+        # later pages are fetched while the first one is consumed
+        fill()
+        yield first_page
+
+        while pending:
+            page = await pending.popleft()
+            fill()
+            yield page
+    finally:
+        for task in pending:
+            task.cancel()
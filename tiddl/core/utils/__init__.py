@@ -1,8 +1,9 @@
-from .parse import parse_track_stream, parse_video_stream
+from .parse import parse_track_manifest, parse_track_stream, parse_video_stream
 from .download import get_track_stream_data, get_video_stream_data
 from .format import format_template
 
 __all__ = [
+    "parse_track_manifest",
     "parse_track_stream",
     "parse_video_stream",
     "get_track_stream_data",
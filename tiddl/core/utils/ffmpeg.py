@@ -1,5 +1,14 @@
+import asyncio
 import subprocess
+from logging import getLogger
 from pathlib import Path
+from typing import AsyncIterable, Literal
+
+from .mp4 import CodecError, Mp4Error, demux_flac, sniff_container
+
+FLAC_ACTION_LITERAL = Literal["native", "demuxed", "ffmpeg", "renamed"]
+
+log = getLogger(__name__)
 
 
 class FFmpegError(RuntimeError):
@@ -66,20 +75,111 @@ def extract_flac(source: Path) -> Path:
     input may not actually contain FLAC.
     """
 
-    codec = _probe_audio_codec(source)
-    if codec and codec != "flac":
-        target = source.with_suffix(".m4a")
+    return finalize_flac(source)[0]
+
+
+def finalize_flac(source: Path) -> tuple[Path, FLAC_ACTION_LITERAL]:
+    """
+    Turn downloaded lossless track into `.flac` file
+    and return it with the action which was needed.
+
+    - `native` file is already FLAC, at most renamed
+    - `demuxed` FLAC was demuxed from fragmented MP4 in Python
+    - `ffmpeg` FLAC was extracted by ffmpeg from other MP4 layout
+    - `renamed` track is not FLAC, file is renamed to `.m4a`
+    """
+
+    if sniff_container(source) == "flac":
+        target = source.with_suffix(".flac")
+
         if target != source:
             source.replace(target)
-        return target
+
+        return target, "native"
 
     target = source.with_suffix(".flac")
     tmp = source.with_suffix(".tmp.flac")
 
-    run(["ffmpeg", "-y", "-i", str(source), "-c", "copy", str(tmp)])
+    try:
+        demux_flac(source, tmp)
+        codec, action = "flac", "demuxed"
+    except CodecError as e:
+        codec, action = e.codec, "renamed"
+    except Mp4Error as e:
+        log.debug(f"'{source}' can't be demuxed, using ffmpeg: {e}")
+        codec, action = _probe_audio_codec(source), "ffmpeg"
+
+        if not codec or codec == "flac":
+            run(["ffmpeg", "-y", "-i", str(source), "-c", "copy", str(tmp)])
+
+    if codec and codec != "flac":
+        target = source.with_suffix(".m4a")
+        if target != source:
+            source.replace(target)
+        return target, "renamed"
 
     tmp.replace(target)
     if source != target and source.exists():
         source.unlink()
 
+    return target, action
+
+
+async def remux_stream(chunks: AsyncIterable[bytes], target: Path) -> Path:
+    """
+    Remux data of `chunks` into `target` with ffmpeg reading its stdin,
+    so only the final file is written to disk.
+    Container of `target` is picked by its suffix.
+    """
+
+    tmp = target.with_suffix(f".tmp{target.suffix}")
+
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        "pipe:0",
+        "-c",
+        "copy",
+        str(tmp),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    assert process.stdin is not None and process.stderr is not None
+
+    stderr = asyncio.ensure_future(process.stderr.read())
+    broken_pipe = False
+
+    try:
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg exited early, its error is read below
+            broken_pipe = True
+        finally:
+            process.stdin.close()
+
+        returncode = await process.wait()
+        error = (await stderr).decode("utf-8", errors="replace").strip()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+        stderr.cancel()
+        tmp.unlink(missing_ok=True)
+        raise
+
+    if returncode != 0 or broken_pipe:
+        tmp.unlink(missing_ok=True)
+        raise FFmpegError(f"ffmpeg failed (rc={returncode}): {error}")
+
+    tmp.replace(target)
+
     return target
@@ -0,0 +1,202 @@
+import os
+import re
+from logging import getLogger
+from pathlib import Path
+from time import time
+
+from pydantic import BaseModel, ValidationError
+
+PARTIAL_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".json"
+PARTIAL_MAX_AGE = 7 * 24 * 3600
+JOURNAL_SAVE_BYTES = 4 * 1024**2
+
+# files of `NamedTemporaryFile` used for downloads by older versions
+LEGACY_TEMP_PATTERN = re.compile(r"tmp[a-z0-9_]{8}")
+# offsets and headers of the flac, mp4 and mpeg-ts streams they contain
+LEGACY_TEMP_HEADERS = ((0, b"fLaC"), (4, b"ftyp"), (0, b"\x47"))
+
+log = getLogger(__name__)
+
+
+class JournalData(BaseModel):
+    item_id: int
+    quality: str
+    urls: int
+    size: int = 0
+    parts: list[tuple[int, int]] = []
+    segment: int = 0
+    committed: int = 0
+
+
+class Journal:
+    """
+    Sidecar of a partial file with the progress of its download,
+    lets the next run continue an interrupted download.
+
+    Single file streams keep their total `size` and written byte `parts`,
+    segmented streams keep the number of written segments
+    and the `committed` bytes of the file.
+    The journal is resumed only for the same item, quality
+    and number of stream urls, otherwise the partial file is removed.
+
+    Commits are saved once `save_bytes` were committed since the last save,
+    the rest is saved when the download is interrupted.
+    """
+
+    def __init__(
+        self,
+        file: Path,
+        item_id: int,
+        quality: str,
+        urls: int,
+        save_bytes: int = JOURNAL_SAVE_BYTES,
+    ) -> None:
+        self.file = file
+        self.path = file.with_name(file.name + JOURNAL_SUFFIX)
+        self.data = JournalData(item_id=item_id, quality=quality, urls=urls)
+        self.save_bytes = save_bytes
+        self._unsaved = 0
+
+        saved = self._load()
+
+        if saved is None:
+            self.remove()
+        else:
+            log.debug(f"resuming '{file}' {saved.segment=} {len(saved.parts)=}")
+            self.data = saved
+
+    @property
+    def resumable(self) -> bool:
+        return bool(self.data.parts or self.data.segment)
+
+    def _load(self) -> JournalData | None:
+        try:
+            saved = JournalData.model_validate_json(self.path.read_text())
+            file_size = self.file.stat().st_size
+        except (OSError, ValidationError):
+            return None
+
+        if (saved.item_id, saved.quality, saved.urls) != (
+            self.data.item_id,
+            self.data.quality,
+            self.data.urls,
+        ):
+            return None
+
+        if saved.parts and file_size != saved.size:
+            return None
+
+        if saved.segment and file_size < saved.committed:
+            return None
+
+        return saved
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(self.data.model_dump_json())
+        os.replace(tmp, self.path)
+        self._unsaved = 0
+
+    def _committed(self, size: int) -> None:
+        self._unsaved += size
+
+        if self._unsaved >= self.save_bytes:
+            self.save()
+
+    def reset(self) -> None:
+        self.data = JournalData(
+            item_id=self.data.item_id, quality=self.data.quality, urls=self.data.urls
+        )
+        self.path.unlink(missing_ok=True)
+
+    def remove(self) -> None:
+        """Remove the journal and its partial file."""
+
+        self.file.unlink(missing_ok=True)
+        self.path.unlink(missing_ok=True)
+
+    def start_parts(self, size: int) -> None:
+        self.data.size = size
+        self.data.parts = []
+
+    def commit_part(self, start: int, end: int) -> None:
+        self.data.parts.append((start, end))
+        self._committed(end - start + 1)
+
+    def commit_segment(self, segment: int, committed: int) -> None:
+        size = committed - self.data.committed
+        self.data.segment = segment
+        self.data.committed = committed
+        self._committed(size)
+
+    def missing_parts(self, part_size: int) -> list[tuple[int, int]]:
+        """Byte ranges not written yet, split into `part_size` parts."""
+
+        missing = []
+        position = 0
+
+        for start, end in sorted(self.data.parts) + [(self.data.size, 0)]:
+            for part_start in range(position, start, part_size):
+                missing.append((part_start, min(part_start + part_size, start) - 1))
+
+            position = max(position, end + 1)
+
+        return missing
+
+
+def is_partial(file: Path) -> bool:
+    """Whether `file` is a partial file, journal or a leftover of either."""
+
+    name = file.name
+
+    if name.endswith(".tmp"):
+        name = name.removesuffix(".tmp")
+
+    return PARTIAL_SUFFIX in name and name.endswith((PARTIAL_SUFFIX, JOURNAL_SUFFIX))
+
+
+def is_legacy_temp(file: Path) -> bool:
+    """
+    Whether `file` is a download of an older version left in its temporary file.
+    Its name doesn't tell the final file, so the stream header is checked too.
+    """
+
+    if LEGACY_TEMP_PATTERN.fullmatch(file.name) is None:
+        return False
+
+    try:
+        with file.open("rb") as f:
+            head = f.read(8)
+    except OSError:
+        return False
+
+    return any(
+        head[offset : offset + len(header)] == header
+        for offset, header in LEGACY_TEMP_HEADERS
+    )
+
+
+def remove_stale_partials(directory: Path, max_age: float = PARTIAL_MAX_AGE) -> None:
+    """
+    Remove partial files, journals and temporary files
+    of older versions not touched for `max_age` seconds.
+    """
+
+    now = time()
+
+    try:
+        files = list(directory.iterdir())
+    except OSError:
+        return
+
+    for file in files:
+        if not file.is_file() or not (is_partial(file) or is_legacy_temp(file)):
+            continue
+
+        try:
+            if now - file.stat().st_mtime > max_age:
+                log.info(f"removing stale download '{file}'")
+                file.unlink()
+        except OSError:
+            pass
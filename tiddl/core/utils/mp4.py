@@ -0,0 +1,332 @@
+from logging import getLogger
+from pathlib import Path
+from struct import unpack_from
+from typing import Iterator, Literal
+
+FLAC_MARKER = b"fLaC"
+TOP_LEVEL_BOXES = {b"ftyp", b"styp", b"moov", b"moof", b"mdat", b"sidx", b"free"}
+CONTAINER_LITERAL = Literal["flac", "mp4"]
+MAX_BOX_SIZE = 64 * 1024**2
+CHUNK_SIZE = 1024**2
+
+# sizes of the fields before child boxes of the boxes
+SAMPLE_ENTRY_SIZE = 28
+STSD_HEADER_SIZE = 8
+
+TFHD_BASE_DATA_OFFSET = 0x1
+TFHD_SAMPLE_DESCRIPTION_INDEX = 0x2
+TFHD_DEFAULT_SAMPLE_DURATION = 0x8
+TFHD_DEFAULT_SAMPLE_SIZE = 0x10
+
+TRUN_DATA_OFFSET = 0x1
+TRUN_FIRST_SAMPLE_FLAGS = 0x4
+TRUN_SAMPLE_DURATION = 0x100
+TRUN_SAMPLE_SIZE = 0x200
+TRUN_SAMPLE_FLAGS = 0x400
+TRUN_SAMPLE_COMPOSITION_TIME_OFFSET = 0x800
+
+log = getLogger(__name__)
+
+
+class Mp4Error(ValueError):
+    """Stream is not a fragmented MP4 which can be demuxed without ffmpeg."""
+
+
+class CodecError(Mp4Error):
+    """Track of the MP4 is not FLAC."""
+
+    def __init__(self, codec: str) -> None:
+        super().__init__(f"codec is {codec}, not flac")
+        self.codec = codec
+
+
+def sniff_container(path: Path) -> CONTAINER_LITERAL | None:
+    """Container of file at `path` by its first bytes, `None` when unknown."""
+
+    with path.open("rb") as f:
+        head = f.read(8)
+
+    if head.startswith(FLAC_MARKER):
+        return "flac"
+
+    if head[4:8] in TOP_LEVEL_BOXES:
+        return "mp4"
+
+    return None
+
+
+def iter_boxes(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+    """Yield type and payload of boxes in `data`."""
+
+    offset = 0
+
+    while offset < len(data):
+        if len(data) - offset < 8:
+            raise Mp4Error("truncated box header")
+
+        size, box_type = unpack_from(">I4s", data, offset)
+        header_size = 8
+
+        if size == 1:
+            (size,) = unpack_from(">Q", data, offset + 8)
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+
+        if size < header_size or offset + size > len(data):
+            raise Mp4Error(f"invalid size of {box_type!r} box")
+
+        yield box_type, data[offset + header_size : offset + size]
+        offset += size
+
+
+def find_boxes(data: bytes, path: list[bytes]) -> list[bytes]:
+    """Payloads of boxes at `path` of nested box types."""
+
+    found = [data]
+
+    for box_type in path:
+        found = [
+            payload
+            for parent in found
+            for child_type, payload in iter_boxes(parent)
+            if child_type == box_type
+        ]
+
+    return found
+
+
+def parse_moov(moov: bytes) -> bytes:
+    """FLAC stream header built from `dfLa` box of the only track."""
+
+    tracks = find_boxes(moov, [b"trak"])
+
+    if len(tracks) != 1:
+        raise Mp4Error(f"expected one track, got {len(tracks)}")
+
+    if not find_boxes(moov, [b"mvex"]):
+        raise Mp4Error("MP4 is not fragmented")
+
+    stsd = find_boxes(tracks[0], [b"mdia", b"minf", b"stbl", b"stsd"])
+
+    if not stsd:
+        raise Mp4Error("no sample description")
+
+    entries = list(iter_boxes(stsd[0][STSD_HEADER_SIZE:]))
+
+    if len(entries) != 1:
+        raise Mp4Error(f"expected one sample entry, got {len(entries)}")
+
+    codec, entry = entries[0]
+
+    if codec != FLAC_MARKER:
+        raise CodecError(codec.decode(errors="replace").strip())
+
+    dfla = find_boxes(entry[SAMPLE_ENTRY_SIZE:], [b"dfLa"])
+
+    if not dfla:
+        raise Mp4Error("no dfLa box")
+
+    # skip version and flags, the rest are native metadata blocks
+    return FLAC_MARKER + dfla[0][4:]
+
+
+def parse_moof(moof: bytes) -> tuple[int, int | None]:
+    """Total size of samples in the fragment and offset of the first one."""
+
+    trafs = find_boxes(moof, [b"traf"])
+
+    if len(trafs) != 1:
+        raise Mp4Error(f"expected one track fragment, got {len(trafs)}")
+
+    tfhd = find_boxes(trafs[0], [b"tfhd"])
+
+    if not tfhd:
+        raise Mp4Error("no tfhd box")
+
+    (tfhd_flags,) = unpack_from(">I", tfhd[0])
+    tfhd_flags &= 0xFFFFFF
+
+    if tfhd_flags & TFHD_BASE_DATA_OFFSET:
+        raise Mp4Error("explicit base data offset is not supported")
+
+    # skip version, flags and track id
+    offset = 8
+    default_size = None
+
+    for flag in (TFHD_SAMPLE_DESCRIPTION_INDEX, TFHD_DEFAULT_SAMPLE_DURATION):
+        if tfhd_flags & flag:
+            offset += 4
+
+    if tfhd_flags & TFHD_DEFAULT_SAMPLE_SIZE:
+        (default_size,) = unpack_from(">I", tfhd[0], offset)
+
+    total = 0
+    data_offset = None
+
+    for trun in find_boxes(trafs[0], [b"trun"]):
+        flags, count = unpack_from(">II", trun)
+        flags &= 0xFFFFFF
+        offset = 8
+
+        if flags & TRUN_DATA_OFFSET:
+            if data_offset is None:
+                (data_offset,) = unpack_from(">i", trun, offset)
+
+            offset += 4
+
+        if flags & TRUN_FIRST_SAMPLE_FLAGS:
+            offset += 4
+
+        if not flags & TRUN_SAMPLE_SIZE:
+            if default_size is None:
+                raise Mp4Error("unknown size of samples")
+
+            total += default_size * count
+            continue
+
+        fields = [
+            flag
+            for flag in (
+                TRUN_SAMPLE_DURATION,
+                TRUN_SAMPLE_SIZE,
+                TRUN_SAMPLE_FLAGS,
+                TRUN_SAMPLE_COMPOSITION_TIME_OFFSET,
+            )
+            if flags & flag
+        ]
+        size_index = fields.index(TRUN_SAMPLE_SIZE)
+        stride = 4 * len(fields)
+
+        for n in range(count):
+            (size,) = unpack_from(">I", trun, offset + n * stride + size_index * 4)
+            total += size
+
+    return total, data_offset
+
+
+class FlacExtractor:
+    """
+    Incremental demuxer of FLAC stream from fragmented MP4,
+    as served by Tidal for lossless and hi-res tracks.
+
+    Data is passed to `feed` in any chunks, it returns FLAC bytes
+    ready to be written: native header built from the `dfLa` box
+    followed by samples of every `mdat`, which are FLAC frames.
+    Anything else than single FLAC track with samples stored
+    right after their fragment raises `Mp4Error`,
+    `CodecError` when the track is not FLAC.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._header_written = False
+        self._mdat_left: int | None = None
+        self._fragment: tuple[int, int | None, int] | None = None
+        self.frames_size = 0
+
+    def feed(self, data: bytes) -> bytes:
+        self._buffer += data
+        output = bytearray()
+
+        while True:
+            if self._mdat_left is not None:
+                size = min(self._mdat_left, len(self._buffer))
+                output += self._buffer[:size]
+                del self._buffer[:size]
+                self._mdat_left -= size
+                self.frames_size += size
+
+                if self._mdat_left:
+                    break
+
+                self._mdat_left = None
+
+            if len(self._buffer) < 8:
+                break
+
+            size, box_type = unpack_from(">I4s", self._buffer)
+            header_size = 8
+
+            if not self._header_written and box_type not in TOP_LEVEL_BOXES:
+                raise Mp4Error(f"not an MP4 stream, starts with {box_type!r}")
+
+            if size == 1:
+                if len(self._buffer) < 16:
+                    break
+
+                (size,) = unpack_from(">Q", self._buffer, 8)
+                header_size = 16
+            elif size == 0:
+                raise Mp4Error(f"{box_type!r} box without size")
+
+            if size < header_size:
+                raise Mp4Error(f"invalid size of {box_type!r} box")
+
+            if box_type == b"mdat":
+                self._start_mdat(size, header_size)
+                del self._buffer[:header_size]
+                continue
+
+            if size > MAX_BOX_SIZE:
+                raise Mp4Error(f"{box_type!r} box is too big")
+
+            if len(self._buffer) < size:
+                break
+
+            payload = bytes(self._buffer[header_size:size])
+            del self._buffer[:size]
+
+            if box_type == b"moov":
+                output += parse_moov(payload)
+                self._header_written = True
+            elif box_type == b"moof":
+                samples_size, data_offset = parse_moof(payload)
+                self._fragment = (samples_size, data_offset, size)
+
+        return bytes(output)
+
+    def _start_mdat(self, size: int, header_size: int) -> None:
+        if not self._header_written:
+            raise Mp4Error("mdat before moov")
+
+        if self._fragment is None:
+            raise Mp4Error("mdat without moof")
+
+        samples_size, data_offset, moof_size = self._fragment
+        self._fragment = None
+
+        if data_offset is not None and data_offset != moof_size + header_size:
+            raise Mp4Error("samples are not stored right after their fragment")
+
+        if samples_size != size - header_size:
+            raise Mp4Error("samples don't fill the mdat box")
+
+        self._mdat_left = samples_size
+
+    def close(self) -> None:
+        """Check that the whole stream was fed."""
+
+        if not self._header_written:
+            raise Mp4Error("stream ended before moov")
+
+        if self._mdat_left or self._buffer:
+            raise Mp4Error("stream ended in the middle of a box")
+
+
+def demux_flac(source: Path, target: Path) -> None:
+    """Write FLAC stream of fragmented MP4 `source` to `target`."""
+
+    extractor = FlacExtractor()
+
+    try:
+        with source.open("rb") as src, target.open("wb") as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                dst.write(extractor.feed(chunk))
+
+        extractor.close()
+    except BaseException:
+        target.unlink(missing_ok=True)
+        raise
+
+    log.debug(f"'{source}' demuxed, {extractor.frames_size} bytes of frames")
@@ -2,6 +2,7 @@ from m3u8 import M3U8
 from requests import Session
 from pydantic import BaseModel
 from base64 import b64decode
+from urllib.parse import parse_qs, urlparse
 from xml.etree.ElementTree import fromstring
 
 from tiddl.core.api.models import TrackStream, VideoStream
@@ -50,17 +51,8 @@ def parse_manifest_XML(xml_content: str):
     return urls, codecs
 
 
-def parse_track_stream(track_stream: TrackStream) -> tuple[list[str], str]:
-    """
-    Parse URLs and file extension from `track_stream`
-
-    | Quality Level   | Codec Type | Manifest MIME Type        | MIME Type  |
-    | --------------- | ---------- | ------------------------- | ---------- |
-    | LOW             | m4a        | application/vnd.tidal.bts | audio/mp4  |
-    | HIGH            | m4a        | application/vnd.tidal.bts | audio/mp4  |
-    | LOSSLESS        | flac       | application/vnd.tidal.bts | audio/flac |
-    | HI_RES_LOSSLESS | m4a        | application/dash+xml      | audio/mp4  |
-    """
+def parse_track_manifest(track_stream: TrackStream) -> tuple[list[str], str]:
+    """Parse URLs and codecs from `track_stream` manifest."""
 
     class TrackManifest(BaseModel):
         mimeType: str
@@ -73,10 +65,30 @@ def parse_track_stream(track_stream: TrackStream) -> tuple[list[str], str]:
     match track_stream.manifestMimeType:
         case "application/vnd.tidal.bts":
             track_manifest = TrackManifest.model_validate_json(decoded_manifest)
-            urls, codecs = track_manifest.urls, track_manifest.codecs
+            return track_manifest.urls, track_manifest.codecs
 
         case "application/dash+xml":
-            urls, codecs = parse_manifest_XML(decoded_manifest)
+            return parse_manifest_XML(decoded_manifest)
+
+    raise ValueError(
+        f"Unknown manifest `{track_stream.manifestMimeType}` "
+        f"(trackId {track_stream.trackId})"
+    )
+
+
+def parse_track_stream(track_stream: TrackStream) -> tuple[list[str], str]:
+    """
+    Parse URLs and file extension from `track_stream`
+
+    | Quality Level   | Codec Type | Manifest MIME Type        | MIME Type  |
+    | --------------- | ---------- | ------------------------- | ---------- |
+    | LOW             | m4a        | application/vnd.tidal.bts | audio/mp4  |
+    | HIGH            | m4a        | application/vnd.tidal.bts | audio/mp4  |
+    | LOSSLESS        | flac       | application/vnd.tidal.bts | audio/flac |
+    | HI_RES_LOSSLESS | m4a        | application/dash+xml      | audio/mp4  |
+    """
+
+    urls, codecs = parse_track_manifest(track_stream)
 
     if codecs == "flac":
         file_extension = ".flac"
@@ -90,8 +102,8 @@ def parse_track_stream(track_stream: TrackStream) -> tuple[list[str], str]:
     return urls, file_extension
 
 
-def parse_video_stream(video_stream: VideoStream) -> list[str]:
-    """Parse `video_stream` manifest and return video urls"""
+def parse_video_manifest(video_stream: VideoStream) -> str:
+    """Parse `video_stream` manifest and return url of its M3U8 playlist"""
 
     class VideoManifest(BaseModel):
         mimeType: str
@@ -100,23 +112,52 @@ def parse_video_stream(video_stream: VideoStream) -> list[str]:
     decoded_manifest = b64decode(video_stream.manifest).decode()
     manifest = VideoManifest.model_validate_json(decoded_manifest)
 
+    return manifest.urls[0]
+
+
+def parse_m3u8_variant(content: str) -> str:
+    """Return uri of the highest quality variant of M3U8 playlist."""
+
+    uri = M3U8(content).playlists[-1].uri
+
+    if not uri:
+        raise ValueError("M3U8 Playlist does not have `uri`.")
+
+    return uri
+
+
+def parse_m3u8_files(content: str) -> list[str]:
+    """Return urls of files of M3U8 playlist."""
+
+    video = M3U8(content)
+
+    if not video.files:
+        raise ValueError("M3U8 Playlist is empty.")
+
+    return [url for url in video.files if url]
+
+
+def parse_video_stream(video_stream: VideoStream) -> list[str]:
+    """Parse `video_stream` manifest and return video urls"""
+
     with Session() as s:
         # get all qualities
-        req = s.get(manifest.urls[0])
-        m3u8 = M3U8(req.text)
+        req = s.get(parse_video_manifest(video_stream))
 
         # get highest quality
-        uri = m3u8.playlists[-1].uri
+        req = s.get(parse_m3u8_variant(req.text))
 
-        if not uri:
-            raise ValueError("M3U8 Playlist does not have `uri`.")
+    return parse_m3u8_files(req.text)
 
-        req = s.get(uri)
-        video = M3U8(req.text)
 
-    if not video.files:
-        raise ValueError("M3U8 Playlist is empty.")
+def parse_url_expiry(url: str) -> float | None:
+    """Return unix time of the `Expires` parameter of signed `url`."""
 
-    urls = [url for url in video.files if url]
+    for key, values in parse_qs(urlparse(url).query).items():
+        if key.lower() == "expires":
+            try:
+                return float(values[0])
+            except ValueError:
+                return None
 
-    return urls
+    return None
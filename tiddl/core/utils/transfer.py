@@ -0,0 +1,479 @@
+import asyncio
+import re
+from collections import deque
+from functools import partial
+from logging import getLogger
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+import aiofiles
+import aiohttp
+
+from tiddl.core.api.limiter import RETRY_STATUS_CODES, backoff_delay
+from tiddl.core.api.models import VideoStream
+
+from .journal import Journal
+from .parse import parse_m3u8_files, parse_m3u8_variant, parse_video_manifest
+
+SEGMENT_CONCURRENCY = 4
+SEGMENT_RETRIES = 3
+
+RANGE_CONNECTIONS = 4
+RANGE_PART_SIZE = 4 * 1024**2
+
+CHUNK_SIZE = 1024**2
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+T = TypeVar("T")
+
+OnProgress = Callable[[int], None]
+
+log = getLogger(__name__)
+
+
+async def with_retries(
+    fetch: Callable[[], Awaitable[T]], url: str, retries: int = SEGMENT_RETRIES
+) -> T:
+    """
+    Await `fetch()` retried on connection errors,
+    incomplete bodies, 429 and 5xx responses.
+    """
+
+    attempt = 1
+
+    while True:
+        try:
+            return await fetch()
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRY_STATUS_CODES or attempt > retries:
+                raise
+
+            error = f"[{e.status}]"
+        except (
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            asyncio.TimeoutError,
+        ) as e:
+            if attempt > retries:
+                raise
+
+            error = repr(e)
+
+        delay = backoff_delay(attempt)
+        log.warning(f"{url} {error}, retrying in {delay:.1f}s")
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def fetch_segment(
+    session: aiohttp.ClientSession, url: str, retries: int = SEGMENT_RETRIES
+) -> bytes:
+    """Fetch whole segment at `url`."""
+
+    async def fetch() -> bytes:
+        async with session.get(url) as res:
+            res.raise_for_status()
+            return await res.read()
+
+    return await with_retries(fetch, url, retries)
+
+
+async def iter_ordered(
+    fetches: Iterable[Callable[[], Awaitable[bytes]]], concurrency: int
+) -> AsyncIterator[bytes]:
+    """
+    Yield results of `fetches` in order, running up to `concurrency` at once.
+
+    Results which arrive before the previous ones wait in memory,
+    so at most `concurrency` results are held besides the yielded one.
+    """
+
+    fetches_iter = iter(fetches)
+    pending: deque[asyncio.Future[bytes]] = deque()
+
+    def fill():
+        while len(pending) < max(concurrency, 1):
+            fetch = next(fetches_iter, None)
+
+            if fetch is None:
+                return
+
+            pending.append(asyncio.ensure_future(fetch()))
+
+    try:
+        fill()
+
+        while pending:
+            data = await pending.popleft()
+            fill()
+            yield data
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def fetch_segments(
+    session: aiohttp.ClientSession,
+    urls: list[str],
+    concurrency: int = SEGMENT_CONCURRENCY,
+    retries: int = SEGMENT_RETRIES,
+) -> AsyncIterator[bytes]:
+    """Yield segments at `urls` in order, fetching up to `concurrency` at once."""
+
+    return iter_ordered(
+        (partial(fetch_segment, session, url, retries) for url in urls),
+        concurrency,
+    )
+
+
+async def fetch_text(
+    session: aiohttp.ClientSession, url: str, retries: int = SEGMENT_RETRIES
+) -> str:
+    """Fetch text document at `url`."""
+
+    async def fetch() -> str:
+        async with session.get(url) as res:
+            res.raise_for_status()
+            return await res.text()
+
+    return await with_retries(fetch, url, retries)
+
+
+async def resolve_video_stream(
+    session: aiohttp.ClientSession,
+    video_stream: VideoStream,
+    retries: int = SEGMENT_RETRIES,
+) -> list[str]:
+    """
+    Urls of the highest quality of `video_stream`,
+    like `parse_video_stream` without blocking the event loop.
+    """
+
+    master = await fetch_text(session, parse_video_manifest(video_stream), retries)
+    playlist = await fetch_text(session, parse_m3u8_variant(master), retries)
+    return parse_m3u8_files(playlist)
+
+
+class StreamChangedError(ValueError):
+    """Server returned different file than the one being resumed."""
+
+
+def parse_content_range(res: aiohttp.ClientResponse) -> tuple[int, int, int] | None:
+    """Start, end and total size of a partial response, `None` for full one."""
+
+    if res.status != 206:
+        return None
+
+    match = CONTENT_RANGE_PATTERN.fullmatch(res.headers.get("Content-Range", ""))
+
+    if match is None:
+        return None
+
+    start, end, total = map(int, match.groups())
+    return start, end, total
+
+
+async def open_response(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: dict[str, str],
+    retries: int = SEGMENT_RETRIES,
+) -> aiohttp.ClientResponse:
+    """
+    Send request for `url` retried like `with_retries`,
+    the caller reads the body and releases the response.
+    """
+
+    async def fetch() -> aiohttp.ClientResponse:
+        res = await session.get(url, headers=headers)
+
+        try:
+            res.raise_for_status()
+        except BaseException:
+            res.release()
+            raise
+
+        return res
+
+    return await with_retries(fetch, url, retries)
+
+
+async def fetch_file(
+    session: aiohttp.ClientSession,
+    url: str,
+    file: Path,
+    connections: int = RANGE_CONNECTIONS,
+    part_size: int = RANGE_PART_SIZE,
+    retries: int = SEGMENT_RETRIES,
+    on_progress: OnProgress | None = None,
+    journal: Journal | None = None,
+) -> None:
+    """
+    Download single file at `url` to `file`.
+
+    The first request asks for the first `part_size` bytes,
+    when the server answers with a partial response the file
+    is preallocated and the remaining parts are fetched
+    over up to `connections` connections, each part retried on its own.
+    Otherwise the whole body is streamed over one connection.
+
+    Finished parts are committed to the `journal`,
+    a resumed journal downloads only the missing parts.
+    """
+
+    lock = asyncio.Lock()
+    resuming = journal is not None and bool(journal.data.parts)
+
+    async with aiofiles.open(file, "r+b" if resuming else "wb") as f:
+
+        async def write(offset: int, chunk: bytes) -> None:
+            async with lock:
+                await f.seek(offset)
+                await f.write(chunk)
+
+            if on_progress:
+                on_progress(len(chunk))
+
+        async def commit(start: int, end: int) -> None:
+            if journal is None:
+                return
+
+            async with lock:
+                await f.flush()
+                journal.commit_part(start, end)
+
+        async def fetch_part(start: int, end: int, total: int) -> None:
+            position = start
+
+            async def fetch() -> None:
+                nonlocal position
+
+                async with session.get(
+                    url, headers={"Range": f"bytes={position}-{end}"}
+                ) as res:
+                    res.raise_for_status()
+                    content_range = parse_content_range(res)
+
+                    if content_range is None or content_range[2] != total:
+                        raise StreamChangedError(
+                            f"expected {total} bytes, "
+                            f"got {res.status} {res.headers.get('Content-Range')}"
+                        )
+
+                    if content_range[0] != position:
+                        raise aiohttp.ClientPayloadError(
+                            f"expected range {position}-{end}, "
+                            f"got {res.headers.get('Content-Range')}"
+                        )
+
+                    async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                        await write(position, chunk)
+                        # retry continues where the broken response stopped
+                        position += len(chunk)
+
+                if position <= end:
+                    raise aiohttp.ClientPayloadError(
+                        f"range {start}-{end} ended at {position}"
+                    )
+
+            await with_retries(fetch, url, retries)
+            await commit(start, end)
+
+        def fetch_parts(
+            parts: list[tuple[int, int]], total: int, concurrency: int
+        ) -> list[asyncio.Future[None]]:
+            semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+            async def fetch_limited(start: int, end: int) -> None:
+                async with semaphore:
+                    await fetch_part(start, end, total)
+
+            return [
+                asyncio.ensure_future(fetch_limited(start, end))
+                for start, end in parts
+            ]
+
+        async def gather(tasks: list[asyncio.Future[None]]) -> None:
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        if journal is not None and resuming:
+            missing = journal.missing_parts(part_size)
+            log.debug(f"{url} resuming {len(missing)} missing parts")
+
+            try:
+                await gather(fetch_parts(missing, journal.data.size, connections))
+                return
+            except StreamChangedError as e:
+                log.warning(f"{url} can't be resumed, {e}")
+                journal.reset()
+                await f.truncate(0)
+
+        headers = (
+            {"Range": f"bytes=0-{part_size - 1}"} if connections > 1 else {}
+        )
+
+        async with await open_response(session, url, headers, retries) as res:
+            content_range = parse_content_range(res)
+
+            if content_range is None or content_range[0] != 0:
+                log.debug(f"{url} streamed over one connection [{res.status}]")
+
+                position = 0
+
+                async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                    await write(position, chunk)
+                    position += len(chunk)
+
+                return
+
+            _, end, total = content_range
+            await f.truncate(total)
+
+            if journal is not None:
+                journal.start_parts(total)
+
+            parts = fetch_parts(
+                [
+                    (start, min(start + part_size, total) - 1)
+                    for start in range(end + 1, total, part_size)
+                ],
+                total,
+                connections - 1,
+            )
+
+            log.debug(f"{url} {total} bytes in {len(parts) + 1} parts")
+
+            try:
+                # the first part is read while the others are fetched
+                position = 0
+
+                try:
+                    async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                        await write(position, chunk)
+                        position += len(chunk)
+                except (
+                    aiohttp.ClientConnectionError,
+                    aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError,
+                ) as e:
+                    log.warning(f"{url} first part ended at {position}, {e!r}")
+
+                if position <= end:
+                    await fetch_part(position, end, total)
+
+                if position > 0:
+                    await commit(0, min(position, end + 1) - 1)
+            except BaseException:
+                for task in parts:
+                    task.cancel()
+
+                raise
+
+        await gather(parts)
+
+
+async def fetch_range(
+    session: aiohttp.ClientSession,
+    url: str,
+    start: int,
+    end: int,
+    total: int,
+    retries: int = SEGMENT_RETRIES,
+) -> bytes:
+    """Fetch bytes from `start` to `end` of file of `total` size at `url`."""
+
+    async def fetch() -> bytes:
+        async with session.get(url, headers={"Range": f"bytes={start}-{end}"}) as res:
+            res.raise_for_status()
+            content_range = parse_content_range(res)
+
+            if content_range is None or content_range[2] != total:
+                raise StreamChangedError(
+                    f"expected {total} bytes, "
+                    f"got {res.status} {res.headers.get('Content-Range')}"
+                )
+
+            data = await res.read()
+
+        if content_range[0] != start or len(data) != end - start + 1:
+            raise aiohttp.ClientPayloadError(
+                f"expected range {start}-{end}, got {len(data)} bytes "
+                f"of {res.headers.get('Content-Range')}"
+            )
+
+        return data
+
+    return await with_retries(fetch, url, retries)
+
+
+async def iter_file(
+    session: aiohttp.ClientSession,
+    url: str,
+    connections: int = RANGE_CONNECTIONS,
+    part_size: int = RANGE_PART_SIZE,
+    retries: int = SEGMENT_RETRIES,
+) -> AsyncIterator[bytes]:
+    """
+    Yield single file at `url` in order, for consumers which can't seek.
+
+    Like `fetch_file` the file is split into byte ranges
+    fetched over up to `connections` connections when the server
+    supports them, up to `connections` parts are held in memory.
+    """
+
+    headers = {"Range": f"bytes=0-{part_size - 1}"} if connections > 1 else {}
+    res = await open_response(session, url, headers, retries)
+
+    try:
+        content_range = parse_content_range(res)
+
+        if (
+            content_range is None
+            or content_range[0] != 0
+            or content_range[1] + 1 >= content_range[2]
+        ):
+            async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                yield chunk
+
+            return
+
+        _, end, total = content_range
+
+        async def first_part() -> bytes:
+            try:
+                return await res.read()
+            except (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                log.warning(f"{url} first part failed, {e!r}")
+                return await fetch_range(session, url, 0, end, total, retries)
+            finally:
+                res.release()
+
+        fetches: list[Callable[[], Awaitable[bytes]]] = [first_part]
+        fetches.extend(
+            partial(
+                fetch_range,
+                session,
+                url,
+                start,
+                min(start + part_size, total) - 1,
+                total,
+                retries,
+            )
+            for start in range(end + 1, total, part_size)
+        )
+
+        log.debug(f"{url} {total} bytes in {len(fetches)} ordered parts")
+
+        async for data in iter_ordered(fetches, connections):
+            yield data
+    finally:
+        res.release()